@@ -0,0 +1,294 @@
+# benchmark_training.py
+# CPU throughput benchmark of the OT2 PPO training loop (replaces GPUvsCPU_test.py).
+#
+# The parts of a training iteration are timed separately, so the numbers can be
+# used to size training machines:
+#   env       environment steps per second with random actions, for several n_envs
+#             (one OT2Env per process with SubprocVecEnv, in process for n_envs=1)
+#   inference policy forward pass for a batch of n_envs observations (the action
+#             computation of every collection step), per torch thread count
+#   update    one PPO update (PPO.train: n_epochs passes over a filled rollout buffer
+#             of random data) per batch size and torch thread count
+#   logging   cost of the per-episode run.log() of OT2Env for every metrics backend, and
+#             the env step rate with and without a run attached
+#
+# Every measurement is warmed up first and repeated; the JSON report holds every
+# repeat plus mean/std/min, the machine details, and a rough estimate of training
+# steps per second for each (n_envs, batch size, threads) combination.
+#
+# Usage:
+#   python benchmark_training.py
+#   python benchmark_training.py --n-envs 1 4 8 16 --batch-sizes 64 256 1024 --threads 1 2 4 --repeats 5
+#   python benchmark_training.py --only update --output results.json
+
+import os
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import datetime
+import numpy as np
+import torch
+import gymnasium as gym
+from gymnasium import spaces
+from stable_baselines3 import PPO
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+import metrics
+
+# Set the working directory to the script's directory
+script_dir = os.path.dirname(os.path.abspath(__file__))
+os.chdir(script_dir)
+
+SECTIONS = ("env", "inference", "update", "logging")
+
+
+def _make_env(run=None):
+    # imported here: creating an OT2Env starts a pybullet simulation
+    from ot2_gym_wrapper_v4 import OT2Env
+    return OT2Env(render=False, max_steps=1000, run=run)
+
+
+class SpacesEnv(gym.Env):
+    """Environment with the OT2Env spaces but no simulation, to build PPO models for the update benchmark."""
+    def __init__(self):
+        super().__init__()
+        self.action_space = spaces.Box(low=-1, high=1, shape=(3,), dtype=np.float32)
+        self.observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(9,), dtype=np.float32)
+
+    def reset(self, seed=None, options=None):
+        return np.zeros(9, dtype=np.float32), {}
+
+    def step(self, action):
+        return np.zeros(9, dtype=np.float32), 0.0, False, False, {}
+
+
+def _stats(values):
+    values = np.asarray(values, dtype=float)
+    return {"mean": float(values.mean()), "std": float(values.std()), "min": float(values.min()),
+            "max": float(values.max()), "repeats": values.tolist()}
+
+
+def _timed(function, warmup, repeats):
+    """Run function() `warmup` times untimed, then `repeats` times; returns the durations in seconds."""
+    for _ in range(warmup):
+        function()
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def bench_env(n_envs_list, steps, warmup, repeats, seed=0):
+    """Environment steps per second (all envs together) with random actions."""
+    results = []
+    for n_envs in n_envs_list:
+        if n_envs == 1:
+            env = DummyVecEnv([_make_env])
+        else:
+            env = SubprocVecEnv([_make_env] * n_envs)
+        env.seed(seed)
+        env.reset()
+        rng = np.random.default_rng(seed)
+        # one action per step of the longer of the warmup and the timed run
+        actions = rng.uniform(-1, 1, size=(max(steps, warmup), n_envs, 3)).astype(np.float32)
+
+        def run_steps(count):
+            for k in range(count):
+                env.step(actions[k])
+
+        run_steps(warmup)
+        durations = _timed(lambda: run_steps(steps), 0, repeats)
+        env.close()
+        rate = _stats([steps * n_envs / d for d in durations])
+        results.append({"n_envs": n_envs, "steps_per_env": steps, "steps_per_s": rate})
+        print(f"[ENV] n_envs={n_envs:<3} {rate['mean']:10.0f} steps/s (std {rate['std']:.0f})")
+    return results
+
+
+def bench_inference(n_envs_list, threads_list, calls, warmup, repeats):
+    """Policy forward pass (model.policy.predict) for one batch of n_envs observations."""
+    model = PPO("MlpPolicy", DummyVecEnv([SpacesEnv]), device="cpu")
+    results = []
+    for threads in threads_list:
+        torch.set_num_threads(threads)
+        for n_envs in n_envs_list:
+            obs = np.random.default_rng(0).normal(size=(n_envs, 9)).astype(np.float32)
+
+            def predict():
+                for _ in range(calls):
+                    model.policy.predict(obs)
+
+            durations = _timed(predict, warmup, repeats)
+            latency = _stats([d / calls * 1e6 for d in durations])
+            results.append({"threads": threads, "n_envs": n_envs, "latency_us": latency})
+            print(f"[INFERENCE] threads={threads:<2} n_envs={n_envs:<3} {latency['mean']:8.1f} us per batch")
+    return results
+
+
+def _fill_rollout(model, rng):
+    # random observations, actions and rewards; the update cost does not depend on the values
+    buffer = model.rollout_buffer
+    buffer.reset()
+    n_envs = model.n_envs
+    with torch.no_grad():
+        for _ in range(model.n_steps):
+            obs = rng.normal(size=(n_envs, 9)).astype(np.float32)
+            actions, values, log_probs = model.policy(torch.as_tensor(obs))
+            buffer.add(obs, actions.numpy(), rng.normal(size=n_envs).astype(np.float32),
+                       np.zeros(n_envs, dtype=np.float32), values, log_probs)
+        buffer.compute_returns_and_advantage(last_values=values, dones=np.zeros(n_envs))
+
+
+def bench_update(batch_sizes, threads_list, rollout, warmup, repeats, n_epochs=10):
+    """Duration of one PPO update on a rollout of `rollout` transitions."""
+    results = []
+    rng = np.random.default_rng(0)
+    for threads in threads_list:
+        torch.set_num_threads(threads)
+        for batch_size in batch_sizes:
+            model = PPO("MlpPolicy", DummyVecEnv([SpacesEnv]), n_steps=rollout, batch_size=batch_size,
+                        n_epochs=n_epochs, device="cpu", seed=0)
+            model.set_logger(metrics.sb3_logger(metrics.init("benchmark", backend="none"), formats=()))
+
+            def update():
+                # train() changes the weights, not the buffer, so every repeat does the same work
+                model.train()
+
+            _fill_rollout(model, rng)
+            durations = _timed(update, warmup, repeats)
+            seconds = _stats(durations)
+            results.append({"threads": threads, "batch_size": batch_size, "rollout": rollout,
+                            "n_epochs": n_epochs, "seconds": seconds,
+                            "samples_per_s": rollout * n_epochs / seconds["mean"]})
+            print(f"[UPDATE] threads={threads:<2} batch={batch_size:<5} {seconds['mean']:7.3f} s per update "
+                  f"({rollout} transitions x {n_epochs} epochs)")
+    return results
+
+
+def bench_logging(backends, calls, env_steps, warmup, repeats):
+    """Per-call cost of the OT2Env episode log for each metrics backend, and its effect on the env step rate."""
+    directory = tempfile.mkdtemp(prefix="metrics_benchmark_")
+    record = {"episode": 3, "cumulative_reward": -41.5, "episode_length": 1000, "mean_distance_to_goal": 0.2,
+              "final_distance_to_goal": 0.1, "terminated": 0, "success_count": 0}
+    results = []
+    try:
+        for backend in backends:
+            # "off": no run attached at all (the reference env step rate)
+            latency = finish = run = None
+            if backend != "off":
+                run = metrics.init("benchmark", name=f"log_{backend}", backend=backend, directory=directory)
+
+                def log():
+                    for _ in range(calls):
+                        run.log(record)
+
+                durations = _timed(log, warmup, repeats)
+                start = time.perf_counter()
+                run.finish()
+                finish = time.perf_counter() - start
+                latency = _stats([d / calls * 1e6 for d in durations])
+
+                # the same in an environment step loop
+                run = metrics.init("benchmark", name=f"env_{backend}", backend=backend, directory=directory)
+            env = _make_env(run)
+            env.reset(seed=0)
+            action = np.zeros(3, dtype=np.float32)
+
+            def steps():
+                for _ in range(env_steps):
+                    # reset on episode end like a VecEnv, so the episode record is logged once per episode
+                    if any(env.step(action)[2:4]):
+                        env.reset()
+
+            durations = _timed(steps, 1, repeats)
+            env.close()
+            if run is not None:
+                run.finish()
+            rate = _stats([env_steps / d for d in durations])
+            results.append({"backend": backend, "log_us": latency, "finish_s": finish, "env_steps_per_s": rate})
+            print(f"[LOGGING] {backend:<7} {latency['mean'] if latency else 0:7.2f} us per log, "
+                  f"env {rate['mean']:8.0f} steps/s")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def estimate(report, n_steps):
+    """
+    Rough training throughput: collecting n_steps per env (env steps + one inference per step)
+    followed by one update, for every measured combination.
+    """
+    env = {r["n_envs"]: r["steps_per_s"]["mean"] for r in report.get("env", [])}
+    inference = {(r["threads"], r["n_envs"]): r["latency_us"]["mean"] for r in report.get("inference", [])}
+    update = {(r["threads"], r["batch_size"]): r for r in report.get("update", [])}
+    rows = []
+    for (threads, batch_size), u in sorted(update.items()):
+        for n_envs, rate in sorted(env.items()):
+            if (threads, n_envs) not in inference:
+                continue
+            collect = n_steps * n_envs / rate + n_steps * inference[(threads, n_envs)] * 1e-6
+            # the update measured on `rollout` transitions scales with the rollout size
+            train = u["seconds"]["mean"] * n_steps * n_envs / u["rollout"]
+            rows.append({"n_envs": n_envs, "threads": threads, "batch_size": batch_size,
+                         "collect_s": collect, "update_s": train,
+                         "steps_per_s": n_steps * n_envs / (collect + train)})
+    return rows
+
+
+def machine_info():
+    return {
+        "hostname": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "available_cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "numpy": np.__version__,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the parts of the OT2 PPO training loop on CPU.")
+    parser.add_argument("--n-envs", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[64, 256, 1024])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--env-steps", type=int, default=2000, help="timed steps per env and repeat")
+    parser.add_argument("--rollout", type=int, default=2048, help="transitions per benchmarked update")
+    parser.add_argument("--n-steps", type=int, default=2048, help="PPO n_steps used for the estimate")
+    parser.add_argument("--backends", nargs="+", default=["off", "none", "jsonl", "sqlite"])
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs (env: 200 steps per warmup run)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--only", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--output", default=None, help="JSON report (default: benchmark_<host>_<time>.json)")
+    args = parser.parse_args()
+
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": machine_info(),
+        "settings": vars(args),
+    }
+    if "env" in args.only:
+        report["env"] = bench_env(args.n_envs, args.env_steps, 200 * args.warmup, args.repeats)
+    if "inference" in args.only:
+        report["inference"] = bench_inference(args.n_envs, args.threads, 1000, args.warmup, args.repeats)
+    if "update" in args.only:
+        report["update"] = bench_update(args.batch_sizes, args.threads, args.rollout, args.warmup, args.repeats)
+    if "logging" in args.only:
+        report["logging"] = bench_logging(args.backends, 10000, args.env_steps, args.warmup, args.repeats)
+    report["estimate"] = estimate(report, args.n_steps)
+
+    if report["estimate"]:
+        print(f"\n{'n_envs':>6} {'threads':>7} {'batch':>6} {'collect s':>10} {'update s':>9} {'steps/s':>9}")
+        for row in sorted(report["estimate"], key=lambda r: -r["steps_per_s"])[:10]:
+            print(f"{row['n_envs']:>6} {row['threads']:>7} {row['batch_size']:>6} {row['collect_s']:>10.2f} "
+                  f"{row['update_s']:>9.2f} {row['steps_per_s']:>9.0f}")
+
+    output = args.output or "benchmark_{}_{}.json".format(platform.node(), datetime.datetime.now().strftime("%Y%m%d_%H%M%S"))
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to {output}")
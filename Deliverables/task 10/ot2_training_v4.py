@@ -1,19 +1,17 @@
 import os
 from stable_baselines3 import PPO
 from stable_baselines3.common.env_checker import check_env
-from wandb.integration.sb3 import WandbCallback
 from ot2_gym_wrapper_v4 import OT2Env  # Import your custom Gym wrapper
-import wandb
+import metrics
 
 # Set the working directory to the script's directory
 script_dir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(script_dir)
 
-# Initialize Wandb
-wandb.init(
+# Start the run (local SQLite backend by default, see metrics.py; METRICS_BACKEND=wandb to use wandb)
+run = metrics.init(
     project="OT2_RL_Training",
     name="PPO_OT2_training_v4",
-    sync_tensorboard=True,
     config={
         "policy": "MlpPolicy",
         "learning_rate": 5e-5,     # Smaller learning rate for stable long-term training
@@ -24,7 +22,7 @@ wandb.init(
 )
 
 # Create the environment
-env = OT2Env(render=False, max_steps=1000)
+env = OT2Env(render=False, max_steps=1000, run=run)
 
 # Check the environment
 check_env(env)
@@ -33,27 +31,24 @@ check_env(env)
 model = PPO(
     policy="MlpPolicy",
     env=env,
-    learning_rate=wandb.config.learning_rate,
-    batch_size=wandb.config.batch_size,
-    gamma=wandb.config.gamma,
+    learning_rate=run.config.learning_rate,
+    batch_size=run.config.batch_size,
+    gamma=run.config.gamma,
     verbose=1,
-    tensorboard_log="./ppo_ot2_tensorboard_v4/",
     device="cpu"
 )
+# Stable-Baselines3 training metrics go to stdout, TensorBoard and the run
+model.set_logger(metrics.sb3_logger(run, formats=("stdout", "tensorboard"), folder="./ppo_ot2_tensorboard_v4/"))
 
 # Train the model
-model.learn(
-    total_timesteps=wandb.config.total_timesteps,
-    callback=WandbCallback(gradient_save_freq=100, verbose=2)
-)
+model.learn(total_timesteps=run.config.total_timesteps)
 
 # Save the trained model
 model_path = "ppo_ot2_model_v4.zip"
 model.save(model_path)
 
-# Save the model to Wandb
-artifact = wandb.Artifact(name="ppo_ot2_model_v4", type="model")
-artifact.add_file(model_path)
-wandb.log_artifact(artifact)
+# Keep the model with the run
+run.log_artifact(model_path, name="ppo_ot2_model_v4.zip", type="model")
+run.finish()
 
 print("Model training completed and saved!")
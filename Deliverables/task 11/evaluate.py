@@ -0,0 +1,161 @@
+# evaluate.py
+# Deterministic evaluation of trained PPO models on headless OT2Env workers.
+#
+# A fixed list of goals is drawn from the working envelope with a seed, so every
+# model is evaluated on exactly the same goals. The goals are split over a process
+# pool; each worker loads the policy once, keeps one headless OT2Env and drives
+# the pipette to its goals with deterministic actions (one episode per goal,
+# starting from the reset position). Reported per model:
+#  - success rate within 1 mm (the OT2Env termination) and within 10 mm
+#  - steps to reach 1 mm / 10 mm (mean and percentiles over the successful goals)
+#  - final and closest distance to the goal
+#  - policy inference latency per action (model.predict, or the NumPy actor of
+#    policy_runtime.py with --backend numpy)
+#
+# Usage:
+#   python evaluate.py final_model_nsteps_3000.zip ppo_ot2_model_v4.zip --goals 1000 --workers 8
+#   python evaluate.py ppo_ot2_model_v4.zip --backend numpy
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from envelope import load_envelope, sample_goals
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+THRESHOLDS = (0.001, 0.01)  # success radii in meters
+CHUNK = 8  # goals per task sent to a worker
+
+_worker = {}
+
+
+def _init_worker(model_path, backend):
+    # Simulation loads textures and URDFs relative to the working directory
+    os.chdir(SCRIPT_DIR)
+    from ot2_wrapper_final import OT2Env
+    if backend == "numpy":
+        from policy_runtime import NumpyPolicy
+        _worker["predict"] = NumpyPolicy(model_path).act
+    else:
+        import torch
+        torch.set_num_threads(1)
+        from stable_baselines3 import PPO
+        model = PPO.load(model_path, device="cpu")
+        _worker["predict"] = lambda obs: model.predict(obs, deterministic=True)[0]
+    _worker["env"] = OT2Env()
+
+
+def _run_goals(job):
+    """Run one episode per goal; returns one result dict per goal."""
+    env = _worker["env"]
+    predict = _worker["predict"]
+    seed, goals = job
+    results = []
+    for k, goal in enumerate(goals):
+        obs, _ = env.reset(seed=seed + k, options={"goal": goal})
+        first = {t: None for t in THRESHOLDS}
+        closest = np.inf
+        latencies = []
+        terminated = truncated = False
+        distance = float(np.linalg.norm(obs[6:9]))
+        while not (terminated or truncated):
+            start = time.perf_counter()
+            action = predict(obs)
+            latencies.append(time.perf_counter() - start)
+            obs, _, terminated, truncated, _ = env.step(action)
+            distance = float(np.linalg.norm(obs[6:9]))
+            closest = min(closest, distance)
+            for t in THRESHOLDS:
+                if first[t] is None and distance < t:
+                    first[t] = env.steps
+        results.append({
+            "goal": [float(g) for g in goal],
+            "steps_to": {str(t): first[t] for t in THRESHOLDS},
+            "final_distance": distance,
+            "closest_distance": closest,
+            "latency": np.array(latencies, dtype=np.float32),
+        })
+    return results
+
+
+def _percentiles(values):
+    if len(values) == 0:
+        return None
+    values = np.asarray(values, dtype=float)
+    return {"mean": float(values.mean()), "p50": float(np.percentile(values, 50)),
+            "p90": float(np.percentile(values, 90)), "p99": float(np.percentile(values, 99)),
+            "max": float(values.max())}
+
+
+def evaluate(model_path, n_goals=1000, workers=4, seed=0, backend="sb3"):
+    """
+    Evaluate one model on n_goals seeded goals.
+
+    :param backend: "sb3" (model.predict) or "numpy" (actor exported with policy_runtime.py).
+
+    :return: report dict (see the top of this file); "episodes" holds the per-goal results.
+    """
+    rng = np.random.default_rng(seed)
+    goals = sample_goals(load_envelope(), n_goals, rng=rng).round(4)
+    jobs = [(seed + i, goals[i:i + CHUNK]) for i in range(0, n_goals, CHUNK)]
+
+    if backend == "numpy" and model_path.endswith(".zip"):
+        from policy_runtime import export_policy
+        model_path = export_policy(model_path)
+
+    start = time.time()
+    with Pool(workers, initializer=_init_worker, initargs=(os.path.abspath(model_path), backend)) as pool:
+        episodes = [r for chunk in pool.map(_run_goals, jobs) for r in chunk]
+    wall = time.time() - start
+
+    latencies = np.concatenate([e.pop("latency") for e in episodes])
+    report = {
+        "model": os.path.basename(model_path),
+        "goals": n_goals,
+        "seed": seed,
+        "backend": backend,
+        "wall_time_s": wall,
+    }
+    for t in THRESHOLDS:
+        steps = [e["steps_to"][str(t)] for e in episodes if e["steps_to"][str(t)] is not None]
+        label = f"{t * 1000:g}mm"
+        report[f"success_rate_{label}"] = len(steps) / n_goals
+        report[f"steps_to_{label}"] = _percentiles(steps)
+    report["final_distance_mm"] = _percentiles([e["final_distance"] * 1000 for e in episodes])
+    report["closest_distance_mm"] = _percentiles([e["closest_distance"] * 1000 for e in episodes])
+    report["latency_us"] = _percentiles(latencies * 1e6)
+    report["episodes"] = episodes
+    return report
+
+
+def _row(report):
+    s1 = report["steps_to_1mm"]
+    return (f"{report['model']:<36} {report['success_rate_1mm'] * 100:6.1f}% {report['success_rate_10mm'] * 100:6.1f}% "
+            f"{(s1['p50'] if s1 else float('nan')):8.0f} {(s1['p90'] if s1 else float('nan')):8.0f} "
+            f"{report['latency_us']['p50']:9.0f} {report['latency_us']['p99']:9.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate PPO models on seeded goals.")
+    parser.add_argument("models", nargs="+", help="model .zip files")
+    parser.add_argument("--goals", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=["sb3", "numpy"], default="sb3")
+    args = parser.parse_args()
+
+    reports = []
+    for model_path in args.models:
+        report = evaluate(model_path, args.goals, args.workers, args.seed, args.backend)
+        output = os.path.splitext(model_path)[0] + ("_eval_numpy.json" if args.backend == "numpy" else "_eval.json")
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[EVAL] {model_path}: {report['wall_time_s']:.1f}s, report saved to {output}")
+        reports.append(report)
+
+    print(f"\n{'model':<36} {'<1mm':>7} {'<10mm':>7} {'p50 stp':>8} {'p90 stp':>8} {'p50 us':>9} {'p99 us':>9}")
+    for report in reports:
+        print(_row(report))
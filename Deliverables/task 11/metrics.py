@@ -0,0 +1,318 @@
+# metrics.py
+# Experiment tracking that works without a network connection.
+#
+# All training scripts, callbacks and environments log through a Run object:
+#
+#   run = metrics.init(project="OT2_RL_Training", name="ppo_v4", config={...})
+#   run.log({"reward": r})              # non-blocking, batched
+#   run.log_artifact("model.zip")
+#   run.finish()
+#
+# Backends (metrics.init(backend=...) or the METRICS_BACKEND environment variable):
+#   sqlite (default)  runs/metrics.db, one row per log() call (the values as JSON)
+#   jsonl             runs/<project>/<name>/metrics.jsonl
+#   wandb             Weights & Biases (needs the network; the key comes from WANDB_API_KEY)
+#   none              discard everything
+#
+# The local backends hand rows to a background thread that writes them in batches,
+# so a log() call in an environment step only costs a queue put.
+
+import os
+import json
+import time
+import queue
+import shutil
+import sqlite3
+import datetime
+import threading
+import numpy as np
+
+METRICS_DIR = os.environ.get("METRICS_DIR", "runs")
+DEFAULT_BACKEND = os.environ.get("METRICS_BACKEND", "sqlite")
+
+BATCH_SIZE = 1000  # rows written per transaction at most
+FLUSH_INTERVAL = 1.0  # seconds a row may wait before it is written
+
+
+class Config(dict):
+    """Run configuration; values can be read as attributes (config.learning_rate) like wandb.config."""
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def _plain(value):
+    # numpy scalars and arrays to Python values that json/sqlite understand
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+class Run:
+    """A run that discards everything (backend "none"); the other backends extend it."""
+    def __init__(self, project, name=None, config=None, directory=METRICS_DIR):
+        self.project = project
+        self.name = name or datetime.datetime.now().strftime("run_%Y%m%d_%H%M%S")
+        self.config = Config(config or {})
+        self.directory = directory
+        self.step = 0
+
+    def log(self, metrics, step=None):
+        """Log a dict of values; without `step` an internal counter is used (like wandb.log)."""
+        if step is None:
+            step = self.step
+            self.step += 1
+        self._log(step, time.time(), metrics)
+
+    def _log(self, step, timestamp, metrics):
+        pass
+
+    def log_artifact(self, path, name=None, type="model"):
+        """Keep a copy of a file with the run; returns the stored path."""
+        return path
+
+    def finish(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.finish()
+
+
+class _BatchedRun(Run):
+    """Run whose rows are written in batches by a background thread."""
+    def __init__(self, project, name=None, config=None, directory=METRICS_DIR,
+                 batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        super().__init__(project, name, config, directory)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._error = None
+        self._opened = threading.Event()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        self._opened.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _log(self, step, timestamp, metrics):
+        self._queue.put((step, timestamp, dict(metrics)))
+
+    def _write_loop(self):
+        # the writer thread owns the file / database connection
+        try:
+            self._open()
+        except Exception as e:
+            self._error = e
+            self._opened.set()
+            return
+        self._opened.set()
+        done = False
+        while not done:
+            rows = []
+            try:
+                rows.append(self._queue.get(timeout=self.flush_interval))
+                while len(rows) < self.batch_size:
+                    rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if rows and rows[-1] is None:
+                rows.pop()
+                done = True
+            if rows:
+                try:
+                    self._write_batch(rows)
+                except Exception as e:  # keep the training alive; reported by finish()
+                    self._error = e
+        self._close()
+
+    def finish(self):
+        """Write everything that is still queued and close the backend."""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        if self._error is not None:
+            raise RuntimeError(f"metrics backend failed for run {self.name}") from self._error
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _write_batch(self, rows):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+class JsonlRun(_BatchedRun):
+    """One directory per run with config.json, metrics.jsonl and the artifacts."""
+    def _open(self):
+        self.run_dir = os.path.join(self.directory, self.project, self.name)
+        os.makedirs(self.run_dir, exist_ok=True)
+        with open(os.path.join(self.run_dir, "config.json"), "w") as f:
+            json.dump({k: _plain(v) for k, v in self.config.items()}, f, indent=2)
+        self._file = open(os.path.join(self.run_dir, "metrics.jsonl"), "a")
+
+    def _write_batch(self, rows):
+        lines = []
+        for step, timestamp, metrics in rows:
+            record = {"_step": step, "_time": timestamp}
+            record.update((k, _plain(v)) for k, v in metrics.items())
+            lines.append(json.dumps(record))
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+    def log_artifact(self, path, name=None, type="model"):
+        os.makedirs(os.path.join(self.directory, self.project, self.name), exist_ok=True)
+        target = os.path.join(self.directory, self.project, self.name, name or os.path.basename(path))
+        shutil.copy(path, target)
+        return target
+
+
+class SQLiteRun(_BatchedRun):
+    """All runs in one database (runs/metrics.db): tables runs, logs and artifacts."""
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.db_path = os.path.join(self.directory, "metrics.db")
+        self._db = sqlite3.connect(self.db_path, timeout=60)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, project TEXT, name TEXT,
+                                             config TEXT, started REAL, finished REAL);
+            CREATE TABLE IF NOT EXISTS logs (run_id INTEGER, step INTEGER, time REAL, data TEXT);
+            CREATE INDEX IF NOT EXISTS logs_run_step ON logs (run_id, step);
+            CREATE TABLE IF NOT EXISTS artifacts (run_id INTEGER, name TEXT, type TEXT, path TEXT);
+        """)
+        config = json.dumps({k: _plain(v) for k, v in self.config.items()})
+        with self._db:
+            self.run_id = self._db.execute(
+                "INSERT INTO runs (project, name, config, started) VALUES (?, ?, ?, ?)",
+                (self.project, self.name, config, time.time())).lastrowid
+
+    def _write_batch(self, rows):
+        # one row per log() call; a row per key made the writer thread the bottleneck
+        values = [(self.run_id, step, timestamp, json.dumps({k: _plain(v) for k, v in metrics.items()}))
+                  for step, timestamp, metrics in rows]
+        with self._db:
+            self._db.executemany("INSERT INTO logs VALUES (?, ?, ?, ?)", values)
+
+    def _close(self):
+        with self._db:
+            self._db.execute("UPDATE runs SET finished = ? WHERE id = ?", (time.time(), self.run_id))
+        self._db.close()
+
+    def log_artifact(self, path, name=None, type="model"):
+        folder = os.path.join(self.directory, "artifacts", f"{self.project}_{self.name}")
+        os.makedirs(folder, exist_ok=True)
+        target = os.path.join(folder, name or os.path.basename(path))
+        shutil.copy(path, target)
+        # a separate connection: the writer thread owns self._db
+        with sqlite3.connect(self.db_path, timeout=60) as db:
+            db.execute("INSERT INTO artifacts VALUES (?, ?, ?, ?)", (self.run_id, name or os.path.basename(path),
+                                                                     type, target))
+        return target
+
+
+class WandbRun(Run):
+    """Weights & Biases, for machines that do have a network connection."""
+    def __init__(self, project, name=None, config=None, directory=METRICS_DIR, **wandb_kwargs):
+        import wandb
+        self._wandb = wandb
+        self._run = wandb.init(project=project, name=name, config=config, **wandb_kwargs)
+        super().__init__(project, self._run.name, dict(self._run.config), directory)
+
+    def log(self, metrics, step=None):
+        # wandb needs one increasing step per run; explicit steps (timesteps) become a metric
+        if step is not None:
+            metrics = dict(metrics, global_step=step)
+        self._run.log(metrics)
+
+    def log_artifact(self, path, name=None, type="model"):
+        artifact = self._wandb.Artifact(name=name or os.path.splitext(os.path.basename(path))[0], type=type)
+        artifact.add_file(path)
+        self._run.log_artifact(artifact)
+        return path
+
+    def finish(self):
+        self._run.finish()
+
+
+BACKENDS = {"none": Run, "jsonl": JsonlRun, "sqlite": SQLiteRun, "wandb": WandbRun}
+
+
+def init(project, name=None, config=None, backend=None, directory=None, **kwargs):
+    """
+    Start a run on the chosen backend.
+
+    :param backend: "sqlite", "jsonl", "wandb" or "none" (default: METRICS_BACKEND or sqlite).
+    :param directory: Where local backends write (default: METRICS_DIR or ./runs).
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown metrics backend {backend!r}, choose from {sorted(BACKENDS)}")
+    return BACKENDS[backend](project, name, config, directory or METRICS_DIR, **kwargs)
+
+
+def sb3_logger(run, formats=("stdout",), folder=None):
+    """
+    Stable-Baselines3 logger that also sends every recorded value (rollout/ep_len_mean,
+    train/loss, ...) to `run`. Use with model.set_logger(); replaces sync_tensorboard.
+    """
+    from stable_baselines3.common.logger import Logger, KVWriter, make_output_format
+
+    class RunOutputFormat(KVWriter):
+        def write(self, key_values, key_excluded, step=0):
+            values = {k: v for k, v in key_values.items()
+                      if isinstance(v, (int, float, np.generic)) and not isinstance(v, bool)}
+            if values:
+                run.log(values, step=step)
+
+        def close(self):
+            pass
+
+    outputs = [make_output_format(f, folder or ".") for f in formats]
+    return Logger(folder, outputs + [RunOutputFormat()])
+
+
+def history(project, name, keys=None, directory=METRICS_DIR):
+    """
+    Read the logged values of a local run back (the latest run with that name).
+
+    :return: dict key -> (steps, values) numpy arrays.
+    """
+    db_path = os.path.join(directory, "metrics.db")
+    jsonl_path = os.path.join(directory, project, name, "metrics.jsonl")
+    result = {}
+
+    def add(step, record):
+        for key, value in record.items():
+            if key.startswith("_") or (keys is not None and key not in keys):
+                continue
+            if isinstance(value, (int, float)):
+                result.setdefault(key, ([], []))
+                result[key][0].append(step)
+                result[key][1].append(value)
+
+    if os.path.exists(db_path):
+        with sqlite3.connect(db_path) as db:
+            row = db.execute("SELECT id FROM runs WHERE project = ? AND name = ? ORDER BY id DESC LIMIT 1",
+                             (project, name)).fetchone()
+            if row is not None:
+                for step, data in db.execute("SELECT step, data FROM logs WHERE run_id = ? ORDER BY step",
+                                             (row[0],)):
+                    add(step, json.loads(data))
+    if not result and os.path.exists(jsonl_path):
+        with open(jsonl_path) as f:
+            for line in f:
+                record = json.loads(line)
+                add(record["_step"], record)
+    return {key: (np.array(steps), np.array(values)) for key, (steps, values) in result.items()}
@@ -1,14 +1,11 @@
-from stable_baselines3 import PPO
-import wandb
-import os
-from ot2_wrapper_final import OT2Env
-from save_best_callback import SaveBestRewardAtEndCallback
+import argparse
+from sweep import run_sweep
 
-os.environ['WANDB_API_KEY'] = 'f0c26550ec9902de91ecb9f54fbbdfc3c6bbb24e'
+# Runs fully offline: trials are trained in parallel on this machine (see sweep.py) and
+# metrics go to the local backend of metrics.py (runs/metrics.db by default).
 
 # Define sweep config
 sweep_config = {
-    "method": "bayes",
     "name": "sweep_michal",
     "metric": {"goal": "minimize", "name": "rollout/ep_len_mean"},
     "parameters": {
@@ -16,36 +13,20 @@ sweep_config = {
     },
 }
 
-sweep_id = wandb.sweep(sweep_config, project="sweep_for_weights")
-
-def main(config=None):
-    run = wandb.init(config, sync_tensorboard=True)
-
-    config = run.config
-    n_steps = config.n_steps  # Get current n_steps from sweep
-
-    print(f"Starting training with n_steps={n_steps}")
-
-    env = OT2Env()
-    env.reset(seed=42)
-
-    log_dir = "./logs_final_hpt"
-    callback = SaveBestRewardAtEndCallback(log_dir=log_dir, n_steps=n_steps)  # Only include n_steps in filename
-
-    model = PPO("MlpPolicy", env, n_steps=n_steps, verbose=1, tensorboard_log=log_dir)
-
-    # Train the model
-    model.learn(total_timesteps=2_000_000, reset_num_timesteps=False, callback=callback)
-
-    # Save the final model locally with n_steps in the filename
-    final_model_filename = f"final_model_nsteps_{n_steps}.zip"
-    model.save(final_model_filename)
-    print(f"Final model saved as {final_model_filename}")
-
-    # Save the final model to W&B
-    run.save(final_model_filename)
-    print(f"Final model uploaded to W&B as {final_model_filename}")
-
-    run.finish()
-
-wandb.agent(sweep_id, main)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline hyperparameter sweep for PPO on OT2Env.")
+    parser.add_argument("--method", choices=["random", "bayes", "asha"], default="bayes")
+    parser.add_argument("--trials", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--cpus-per-worker", type=int, default=1)
+    parser.add_argument("--timesteps", type=int, default=2_000_000)
+    parser.add_argument("--min-timesteps", type=int, default=200_000, help="first rung of asha")
+    parser.add_argument("--env", choices=["sim", "surrogate"], default="sim")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    best = run_sweep(sweep_config["parameters"], f"./logs_final_hpt/{sweep_config['name']}",
+                     method=args.method, trials=args.trials, workers=args.workers,
+                     cpus_per_worker=args.cpus_per_worker, timesteps=args.timesteps,
+                     min_timesteps=args.min_timesteps, env_name=args.env, seed=args.seed)
+    print(f"[SWEEP] best: {best['params']} ({sweep_config['metric']['name']} = {best['score']:.1f})")
@@ -3,18 +3,22 @@ from gymnasium import spaces
 import numpy as np
 from sim_class import Simulation
 import os
-import wandb
+import time
 
 # Set the working directory to the script's directory
 script_dir = os.path.dirname(os.path.abspath(__file__))
 os.chdir(script_dir)
 
 class OT2Env(gym.Env):
-    def __init__(self, render=False, max_steps=1000, use_wandb=True):
+    def __init__(self, render=False, max_steps=1000, run=None, recorder=None):
         super(OT2Env, self).__init__()
         self.render = render
         self.max_steps = max_steps
-        self.use_wandb = use_wandb
+        # metrics.Run to log one record per episode to (None: no metric logging)
+        self.run = run
+        # optional telemetry.TraceRecorder: full per-step trace written in columnar chunks
+        self.recorder = recorder
+        self.episode = -1
 
         # Create the simulation environment
         self.sim = Simulation(num_agents=1, render=render)
@@ -31,6 +35,7 @@ class OT2Env(gym.Env):
         self.steps = 0
         self.goal_position = None
         self.cumulative_reward = 0
+        self.episode_distance = 0  # sum of the distances to the goal, for the episode record
         self.success_count = 0
         self.previous_distance_to_goal = None  # Track progress
 
@@ -56,15 +61,19 @@ class OT2Env(gym.Env):
 
         # Reset the step counter and cumulative reward
         self.steps = 0
+        self.episode += 1
         self.cumulative_reward = 0
+        self.episode_distance = 0
         self.previous_distance_to_goal = np.linalg.norm(relative_position)
 
         return observation, {}
 
     def step(self, action):
+        step_start = time.perf_counter()
         # Execute the action in the simulation
         action = list(action) + [0]  # Append 0 for the "drop" action
         self.sim.run([action])
+        sim_time = time.perf_counter() - step_start
 
         # Get the current pipette position
         state = self.sim.get_states()
@@ -92,22 +101,27 @@ class OT2Env(gym.Env):
         # Increment the step counter and cumulative reward
         self.steps += 1
         self.cumulative_reward += reward
-
-        # Log metrics to Wandb if enabled
-        if self.use_wandb:
-            wandb.log({
-                "reward": reward,
-                "distance_to_goal": distance_to_goal,
-                "steps": self.steps,
+        self.episode_distance += distance_to_goal
+
+        if self.recorder is not None:
+            self.recorder.record(episode=self.episode, step=self.steps, pipette=pipette_position,
+                                 goal=self.goal_position, action=action[:3], distance=distance_to_goal,
+                                 reward=reward, terminated=terminated, truncated=truncated,
+                                 sim_time=sim_time, step_time=time.perf_counter() - step_start)
+
+        # Log one record per episode if a run is given: a record per step roughly halved the
+        # step rate, the per-step trace belongs in the recorder
+        if self.run is not None and (terminated or truncated):
+            self.run.log({
+                "episode": self.episode,
+                "cumulative_reward": self.cumulative_reward,
+                "episode_length": self.steps,
+                "mean_distance_to_goal": self.episode_distance / self.steps,
+                "final_distance_to_goal": distance_to_goal,
                 "terminated": int(terminated),
                 "success_count": self.success_count,
             })
 
-            # Log cumulative reward at the end of the episode
-            if terminated or truncated:
-                wandb.log({"cumulative_reward": self.cumulative_reward})
-                self.cumulative_reward = 0
-
         return observation, reward, terminated, truncated, {}
 
 
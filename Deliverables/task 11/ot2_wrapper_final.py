@@ -1,14 +1,99 @@
+import time
 from math import inf
 import gymnasium as gym
 from gymnasium import spaces
 import numpy as np
 from sim_class import Simulation
+from envelope import load_envelope, sample_goals
+
+
+# reward constants (see OT2Env.step)
+BONUS1_RADIUS, BONUS1_SCALE = 0.006, 100  # values from 0 to 0.6
+BONUS2_RADIUS, BONUS2_SCALE = 0.003, 300  # values from 0 to 0.9
+STEP_PENALTY = -0.05
+GOAL_THRESHOLD = 0.001
+MAX_STEPS = 1000
+
+
+def reward_terms(vectors, init_distance):
+    """
+    Compute all per-step reward terms in one pass.
+
+    :param vectors: (3, 3) float64 buffer with rows
+                    [goal - pipette, action, previous pipette - pipette].
+    :param init_distance: Distance to the goal at the start of the episode.
+    :return: (distance, moved, reward_alignment, reward_distance, reward_bonus1, reward_bonus2)
+    """
+    # the three norms in a single reduction
+    distance, action_norm, moved = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+    # cosine similarity between the direction to the goal and the movement direction
+    alignment = float(vectors[0] @ vectors[1]) / ((distance + 1e-9) * (action_norm + 1e-9))
+    reward_alignment = (alignment + 1) / 2  # values from 0 to 1
+    reward_distance = -2 * distance / init_distance  # Higher reward closer to the goal from -2 to 0
+    reward_bonus1 = BONUS1_SCALE * max(0.0, BONUS1_RADIUS - distance)
+    reward_bonus2 = BONUS2_SCALE * max(0.0, BONUS2_RADIUS - distance)
+    return distance, moved, reward_alignment, reward_distance, reward_bonus1, reward_bonus2
+
+
+class GoalCurriculum:
+    """
+    Curriculum on goal distance and goal tolerance for the continuous-goals mode.
+
+    Goals start close to the pipette with a loose tolerance. Whenever the success rate
+    over the last `window` goals reaches `promote_at`, the maximum goal distance grows by
+    `growth` and the tolerance shrinks by `shrink`, until the full envelope and the
+    final tolerance are reached.
+    """
+    def __init__(self, start_distance=0.05, start_tolerance=0.01, final_tolerance=GOAL_THRESHOLD,
+                 window=100, promote_at=0.8, growth=1.25, shrink=0.8, max_distance=0.5):
+        self.max_goal_distance = start_distance
+        self.tolerance = start_tolerance
+        self.final_tolerance = final_tolerance
+        self.window = window
+        self.promote_at = promote_at
+        self.growth = growth
+        self.shrink = shrink
+        self.max_distance = max_distance
+        self.level = 0
+        self._results = []
+
+    def update(self, success):
+        """Record the outcome of one goal and promote when the recent success rate is high enough."""
+        self._results.append(bool(success))
+        if len(self._results) < self.window:
+            return
+        if sum(self._results) / len(self._results) >= self.promote_at:
+            self.max_goal_distance = min(self.max_goal_distance * self.growth, self.max_distance)
+            self.tolerance = max(self.tolerance * self.shrink, self.final_tolerance)
+            self.level += 1
+        self._results = []
+
+    @property
+    def finished(self):
+        return self.max_goal_distance >= self.max_distance and self.tolerance <= self.final_tolerance
 
 
 class OT2Env(gym.Env):
-    def __init__(self, render=False):
+    def __init__(self, render=False, reward_info=False, verbose=False, continuous_goals=False, curriculum=None,
+                 recorder=None):
+        """
+        :param render: Show the PyBullet GUI.
+        :param reward_info: Return the separate reward terms in the info dict (off for training).
+        :param verbose: Print a summary whenever a goal is reached (off for training).
+        :param continuous_goals: reset() only draws a new goal and keeps the robot where it is,
+                                 instead of rebuilding the robot in PyBullet.
+        :param curriculum: Optional GoalCurriculum (continuous-goals mode) controlling goal distance and tolerance.
+        :param recorder: Optional telemetry.TraceRecorder that gets one row per step.
+        """
         super(OT2Env, self).__init__()
         self.render = render
+        self.reward_info = reward_info
+        self.verbose = verbose
+        self.continuous_goals = continuous_goals
+        self.curriculum = curriculum
+        self.recorder = recorder
+        self.episode = -1
+        self.goal_threshold = curriculum.tolerance if curriculum is not None else GOAL_THRESHOLD
         self.total_distance = 0
         self.initial_distance = 0
 
@@ -28,60 +113,97 @@ class OT2Env(gym.Env):
         # keep track of the number of steps
         self.steps = 0
 
-    def reset(self, seed=None):
+        # working envelope of the pipette (envelope.json, measured by envelope.py)
+        self.envelope = load_envelope()
+
+        # Preallocated buffers, reused on every step
+        # the observation is computed in place; reset() and step() return a copy of it
+        self._observation = np.zeros(9, dtype=np.float32)
+        self._action = np.zeros(4)  # x, y, z velocity + drop flag
+        self._actions = [self._action]  # the simulation expects one action per robot
+        self._vectors = np.zeros((3, 3))  # goal - pipette, action, previous - current pipette
+        self._pipette = np.zeros(3)
+        self.prev_pipette = np.zeros(3)
+
+    def _read_pipette(self, state):
+        # copy the pipette position of our robot into the preallocated buffer
+        self._pipette[:] = state[self._robot_key]['pipette_position']
+        return self._pipette
+
+    def reset(self, seed=None, options=None):
         # being able to set a seed is required for reproducibility
         if seed is not None:
             np.random.seed(seed)
 
-        # Reset the state of the environment to an initial state
-        # set a random goal position for the agent, consisting of x, y, and z coordinates within the working area (you determined these values in the previous datalab task)
-        rand_x = round(np.random.uniform(-0.1871, 0.2532), 4)
-        rand_y = round(np.random.uniform(-0.1707, 0.2197), 4)
-        rand_z = round(np.random.uniform(0.1195, 0.2896), 4)
-
-        #print(f"Goal position: {rand_x}, {rand_y}, {rand_z}")
+        if self.continuous_goals:
+            # Keep the robot where it is; only a new goal is drawn
+            state = self.sim.get_states()
+        else:
+            # Call the environment reset function
+            state = self.sim.reset(num_agents=1)
+        self._robot_key = f'robotId_{self.sim.robotIds[-1]}'
 
-        self.goal_position = np.array([rand_x, rand_y, rand_z])
+        pipette_pos = self._read_pipette(state)
 
-        # Call the environment reset function
-        observation = self.sim.reset(num_agents=1)
+        # Reset the state of the environment to an initial state
+        # set a random goal position for the agent, consisting of x, y, and z coordinates within the measured working envelope
+        if options is not None and options.get('goal') is not None:
+            # a given goal (e.g. the seeded goal list of evaluate.py)
+            self.goal_position = np.asarray(options['goal'], dtype=float)
+        else:
+            self.goal_position = self._sample_goal(pipette_pos).round(4)
 
-        pipette_pos = observation[f'robotId_{self.sim.robotIds[-1]}']['pipette_position']
-        
         # Update the observation in reset and step methods
-        relative_position = self.goal_position - pipette_pos
-
-        self.init_distance = np.linalg.norm(relative_position)
+        observation = self._observation
+        observation[0:3] = pipette_pos
+        observation[3:6] = self.goal_position
+        observation[6:9] = self.goal_position - pipette_pos
 
-        observation = np.concatenate([pipette_pos, self.goal_position, relative_position], dtype=np.float32)
-
-        self.prev_pipette = observation[:3]
+        # guard against a goal drawn (almost) on top of the pipette
+        self.init_distance = max(np.linalg.norm(self.goal_position - pipette_pos), 1e-6)
+        self.prev_pipette[:] = pipette_pos
 
         # Reset the number of steps
         self.steps = 0
+        self.episode += 1
         self.total_distance = 0
 
         info = {} # we don't need to return any additional information
 
-        return observation, info
+        return observation.copy(), info
+
+    def _sample_goal(self, pipette_pos):
+        if self.curriculum is None:
+            return sample_goals(self.envelope)[0]
+        # goals within the current curriculum distance of the pipette (per axis), inside the envelope;
+        # the distance is measured from the nearest envelope point, as the pipette starts below it in z
+        d = self.curriculum.max_goal_distance
+        center = np.clip(pipette_pos, self.envelope['low'], self.envelope['high'])
+        region = dict(self.envelope)
+        region['low'] = np.maximum(self.envelope['low'], center - d)
+        region['high'] = np.minimum(self.envelope['high'], center + d)
+        return sample_goals(region)[0]
 
     def step(self, action):
-        action = np.append(action, 0)
+        step_start = time.perf_counter()
+        self._action[:3] = action
 
         # Call the environment step function
-        observation = self.sim.run([action]) # Why do we need to pass the action as a list? Think about the simulation class.
-
-        pipette_pos = observation[f'robotId_{self.sim.robotIds[-1]}']['pipette_position']
-        relative_position = self.goal_position - pipette_pos
-        observation = np.concatenate([pipette_pos, self.goal_position, relative_position], dtype=np.float32)
-
-        pipette_pos = observation[:3]
-
-        distance = np.linalg.norm(relative_position)
-        # Calculate alignment reward
-        direction_to_goal = relative_position / (distance + 1e-9)  # Normalize direction vector
-        movement_direction = action[:3] / (np.linalg.norm(action[:3]) + 1e-9)  # Normalize action vector, avoid divide by zero
-        alignment = np.dot(direction_to_goal, movement_direction)  # Cosine similarity for directional alignment
+        state = self.sim.run(self._actions) # Why do we need to pass the action as a list? Think about the simulation class.
+        sim_time = time.perf_counter() - step_start
+        pipette_pos = self._read_pipette(state)
+
+        # Fill the reward buffer and compute all terms at once
+        vectors = self._vectors
+        np.subtract(self.goal_position, pipette_pos, out=vectors[0])
+        vectors[1] = self._action[:3]
+        np.subtract(self.prev_pipette, pipette_pos, out=vectors[2])
+        distance, moved, reward_alignment, reward_distance, reward_bonus1, reward_bonus2 = \
+            reward_terms(vectors, self.init_distance)
+
+        observation = self._observation
+        observation[0:3] = pipette_pos
+        observation[6:9] = vectors[0]
 
         '''
             Extremely important to note is that maximum distance from
@@ -90,64 +212,58 @@ class OT2Env(gym.Env):
         '''
 
         # Add movement total reward
-        self.total_distance += np.linalg.norm(self.prev_pipette-pipette_pos)
-        self.prev_pipette = pipette_pos
-
-        # Initialize reward with alignment term (scaled)
-        reward_alignment = (alignment+1)/2  # Scale alignment reward to emphasize directional (values from 0 to 1) 
-
-        # Add distance-based reward
-        reward_distance = -2 * distance/self.init_distance  # Higher reward closer to the goal from -2 to 0
-
-        reward_bonus1 = 100 * max(0, 0.006 - distance) \
-            if distance <= 0.006 else 0  # values from 0 to 0.6
-
-        reward_bonus2 = 300 * max(0, 0.003 - distance) \
-            if distance <= 0.003 else 0  # values from 0 to 0.9
-        
-        step_penalty = -0.05
+        self.total_distance += moved
+        self.prev_pipette[:] = pipette_pos
 
         reward = reward_alignment + reward_distance \
-            + reward_bonus1 + reward_bonus2 + step_penalty
+            + reward_bonus1 + reward_bonus2 + STEP_PENALTY
 
         # increment the number of steps
         self.steps += 1
-        
-        # next we need to check if the if the task has been completed and if the episode should be terminated
-        # To do this we need to calculate the distance between the pipette position and the goal position and if it is below a certain threshold, we will consider the task complete. 
-        # What is a reasonable threshold? Think about the size of the pipette tip and the size of the plants.
-        if distance < 0.001:
+
+        # The task is complete when the pipette is within the goal tolerance (1 mm without a curriculum)
+        terminated = bool(distance < self.goal_threshold)
+        reward_goal = reward_movement = 0
+        if terminated:
             reward_goal = 250 - (self.steps)/5  # values from 250 to 50
             reward_movement = (self.init_distance - self.total_distance) / self.init_distance * 3
             reward += reward_goal + reward_movement
 
-            print(f'Goal reached in {self.steps} steps')
-            print('Initial distance:', self.init_distance)
-            print(f'Total distance covered: {self.total_distance}')
-
-            terminated = True 
-        else:
-            terminated = False
-
-        # next we need to check if the episode should be truncated, we can check if the current number of steps is greater than the maximum number of steps
-        if self.steps >= 1000:
-            truncated = True
-        else:
-            truncated = False
-
-        # in info put a dictionary with seprate rewards
-        info = {
-            'reward_alignment': reward_alignment,
-            'reward_distance': reward_distance,
-            'reward_bonus1': reward_bonus1,
-            'reward_bonus2': reward_bonus2,
-            'reward_step_penalty': step_penalty,
-            'reward_movement': reward_movement if terminated else 0,
-            'reward_goal': reward_goal if terminated else 0,
-            'reward_total': reward
-        }
-
-        return observation, reward, terminated, truncated, info
+            if self.verbose:
+                print(f'Goal reached in {self.steps} steps')
+                print('Initial distance:', self.init_distance)
+                print(f'Total distance covered: {self.total_distance}')
+
+        # the episode is truncated after the maximum number of steps
+        truncated = self.steps >= MAX_STEPS
+
+        if self.curriculum is not None and (terminated or truncated):
+            self.curriculum.update(terminated)
+            self.goal_threshold = self.curriculum.tolerance
+
+        if self.recorder is not None:
+            self.recorder.record(episode=self.episode, step=self.steps, pipette=pipette_pos, goal=self.goal_position,
+                                 action=self._action[:3], distance=distance, reward=reward,
+                                 reward_alignment=reward_alignment, reward_distance=reward_distance,
+                                 reward_bonus=reward_bonus1 + reward_bonus2, reward_goal=reward_goal,
+                                 terminated=terminated, truncated=truncated, sim_time=sim_time,
+                                 step_time=time.perf_counter() - step_start)
+
+        # in info put a dictionary with seprate rewards (only when requested)
+        info = {}
+        if self.reward_info:
+            info = {
+                'reward_alignment': reward_alignment,
+                'reward_distance': reward_distance,
+                'reward_bonus1': reward_bonus1,
+                'reward_bonus2': reward_bonus2,
+                'reward_step_penalty': STEP_PENALTY,
+                'reward_movement': reward_movement,
+                'reward_goal': reward_goal,
+                'reward_total': reward
+            }
+
+        return observation.copy(), reward, terminated, truncated, info
 
     def render(self, mode='human'):
         pass
@@ -0,0 +1,177 @@
+# policy_runtime.py
+# Run a trained PPO controller (Stable-Baselines3 MlpPolicy) with NumPy only.
+#
+# export_policy() reads the actor out of an SB3 model .zip (this needs torch and
+# stable-baselines3, so run it once on the training machine) and writes its weights
+# to a small .npz file. NumpyPolicy loads that file and computes the same action as
+# model.predict(obs, deterministic=True): the mean of the Gaussian policy, clipped to
+# the action space. On the robot host only numpy is imported.
+#
+# The observation is the one of OT2Env (task 11): pipette position, goal position
+# and goal - pipette, 9 values. PID_runner.move_to_policy drives the pipette with it.
+#
+# Usage:
+#   python policy_runtime.py export ppo_ot2_model_v4.zip              # -> ppo_ot2_model_v4.npz
+#   python policy_runtime.py benchmark ppo_ot2_model_v4.zip --n 10000  # numpy vs model.predict
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+# activations of the torch modules SB3 builds the MLP from, applied in place
+ACTIVATIONS = {
+    "tanh": lambda x: np.tanh(x, out=x),
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "identity": lambda x: x,
+}
+TORCH_ACTIVATIONS = {"Tanh": "tanh", "ReLU": "relu", "Identity": "identity"}
+
+
+def export_policy(model_path, output_path=None):
+    """
+    Write the actor of an SB3 PPO model to a NumPy .npz file.
+
+    :param model_path: SB3 model .zip (MlpPolicy, Box observation and action spaces).
+    :param output_path: Target .npz file; defaults to the model path with .npz.
+    :return: path of the written file.
+    """
+    import torch
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.torch_layers import FlattenExtractor
+
+    policy = PPO.load(model_path, device="cpu").policy
+    if policy.squash_output or policy.use_sde or not isinstance(policy.pi_features_extractor, FlattenExtractor):
+        raise ValueError("only MlpPolicy actors with a Gaussian action distribution can be exported")
+
+    arrays = {}
+    activations = []
+    layer = 0
+    for module in list(policy.mlp_extractor.policy_net) + [policy.action_net]:
+        if isinstance(module, torch.nn.Linear):
+            arrays[f"w{layer}"] = module.weight.detach().numpy().astype(np.float32)
+            arrays[f"b{layer}"] = module.bias.detach().numpy().astype(np.float32)
+            activations.append("identity")
+            layer += 1
+        elif type(module).__name__ in TORCH_ACTIVATIONS:
+            activations[-1] = TORCH_ACTIVATIONS[type(module).__name__]
+        else:
+            raise ValueError(f"unsupported layer in the policy network: {module}")
+
+    output_path = output_path or os.path.splitext(model_path)[0] + ".npz"
+    np.savez(output_path, activations=np.array(activations),
+             low=policy.action_space.low.astype(np.float32), high=policy.action_space.high.astype(np.float32),
+             **arrays)
+    return output_path
+
+
+class NumpyPolicy:
+    """
+    Deterministic forward pass of an exported PPO actor.
+
+    The hidden activations are computed in preallocated float32 buffers, so act()
+    allocates nothing but the returned action.
+    """
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.activations = [str(a) for a in data["activations"]]
+            self.weights = [data[f"w{k}"] for k in range(len(self.activations))]
+            self.biases = [data[f"b{k}"] for k in range(len(self.activations))]
+            self.low = data["low"]
+            self.high = data["high"]
+        self._apply = [ACTIVATIONS[a] for a in self.activations]
+        self._obs = np.zeros(self.weights[0].shape[1], dtype=np.float32)
+        self._buffers = [np.zeros(w.shape[0], dtype=np.float32) for w in self.weights]
+
+    @property
+    def obs_size(self):
+        return self.weights[0].shape[1]
+
+    def act(self, obs):
+        """Action for one observation (1-D array)."""
+        x = self._obs
+        x[:] = obs
+        for w, b, apply, out in zip(self.weights, self.biases, self._apply, self._buffers):
+            np.dot(w, x, out=out)
+            out += b
+            x = apply(out)
+        return np.clip(x, self.low, self.high)
+
+    def predict(self, obs):
+        """Actions for a batch of observations, shape (n, obs_size)."""
+        x = np.asarray(obs, dtype=np.float32)
+        for w, b, apply in zip(self.weights, self.biases, self._apply):
+            x = apply(x @ w.T + b)
+        return np.clip(x, self.low, self.high)
+
+
+def observation(pipette, goal, out=None):
+    """OT2Env observation: pipette position, goal position and goal - pipette."""
+    out = np.empty(9, dtype=np.float32) if out is None else out
+    out[0:3] = pipette
+    out[3:6] = goal
+    out[6:9] = out[3:6] - out[0:3]
+    return out
+
+
+def _latency(act, observations):
+    times = np.empty(len(observations))
+    for i, obs in enumerate(observations):
+        start = time.perf_counter()
+        act(obs)
+        times[i] = time.perf_counter() - start
+    times *= 1e6
+    return {"mean": float(times.mean()), "p50": float(np.percentile(times, 50)),
+            "p99": float(np.percentile(times, 99)), "max": float(times.max())}
+
+
+def benchmark(model_path, n=10000, seed=0):
+    """
+    Per-action latency of NumpyPolicy and, when SB3 is available, of model.predict,
+    on n random observations inside the working envelope.
+
+    :param model_path: Exported .npz, or an SB3 .zip (exported first, and compared with model.predict).
+    :return: dict with the latency percentiles in microseconds and the largest action difference.
+    """
+    from envelope import load_envelope, sample_goals
+    if model_path.endswith(".zip"):
+        npz_path = export_policy(model_path)
+    else:
+        npz_path = model_path
+    policy = NumpyPolicy(npz_path)
+
+    envelope = load_envelope()
+    rng = np.random.default_rng(seed)
+    pipettes = sample_goals(envelope, n, rng=rng)
+    goals = sample_goals(envelope, n, rng=rng)
+    observations = np.stack([observation(p, g) for p, g in zip(pipettes, goals)])
+
+    _latency(policy.act, observations[:100])  # warm up
+    report = {"n": n, "numpy_us": _latency(policy.act, observations)}
+    if model_path.endswith(".zip"):
+        import torch
+        from stable_baselines3 import PPO
+        torch.set_num_threads(1)
+        model = PPO.load(model_path, device="cpu")
+        predict = lambda obs: model.predict(obs, deterministic=True)[0]
+        _latency(predict, observations[:100])
+        report["sb3_us"] = _latency(predict, observations)
+        expected = model.predict(observations, deterministic=True)[0]
+        report["max_action_difference"] = float(np.abs(policy.predict(observations) - expected).max())
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a PPO actor to NumPy and benchmark it.")
+    parser.add_argument("command", choices=["export", "benchmark"])
+    parser.add_argument("model", help="SB3 model .zip (or an exported .npz for benchmark)")
+    parser.add_argument("--output", default=None, help="export target (default: model path with .npz)")
+    parser.add_argument("--n", type=int, default=10000, help="observations timed by benchmark")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(f"[EXPORT] actor written to {export_policy(args.model, args.output)}")
+    else:
+        report = benchmark(args.model, args.n)
+        print(json.dumps(report, indent=2))
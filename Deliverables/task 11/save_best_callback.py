@@ -1,30 +1,117 @@
 from stable_baselines3.common.callbacks import BaseCallback
+from collections import deque
 import numpy as np
+import threading
+import torch
+import glob
 import os
 
 
 class SaveBestRewardAtEndCallback(BaseCallback):
-    def __init__(self, log_dir: str, n_steps: int, verbose=1):
+    """
+    Keep the policy weights with the best mean episode return and save them.
+
+    The mean return over the last `window` finished episodes is evaluated when an
+    episode ends (or every `eval_freq` steps). A new best is copied into preallocated
+    tensors in memory; a background thread writes it to best_policy_nsteps_<n>_<t>.pt
+    (only the newest `keep` files are kept). At the end of training the best weights
+    are saved as a full model to best_model_nsteps_<n>.zip.
+    """
+    def __init__(self, log_dir: str, n_steps: int, window=20, eval_freq=None, keep=3, verbose=1):
         super(SaveBestRewardAtEndCallback, self).__init__(verbose)
         self.log_dir = log_dir
-        self.best_mean_reward = -np.inf
-        self.best_model = None
         self.n_steps = n_steps  # Include n_steps in the filename
+        self.window = window
+        self.eval_freq = eval_freq
+        self.keep = keep
+        self.best_mean_reward = -np.inf
+        self.best_timestep = None
+        self._best_state = None  # preallocated copy of the policy weights
+        self._episode_returns = deque(maxlen=window)
+        self._pending = None  # newest snapshot waiting for the writer
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self._writer = None
+
+    def _on_training_start(self) -> None:
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._returns = np.zeros(self.training_env.num_envs)
+        self._best_state = {k: v.detach().clone() for k, v in self.model.policy.state_dict().items()}
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
 
     def _on_step(self) -> bool:
-        # Get the mean reward for the last episodes
-        mean_reward = np.mean(self.locals["rewards"])
-        if mean_reward > self.best_mean_reward:
-            self.best_mean_reward = mean_reward
-            self.best_model = self.model  # Keep the current best model in memory
-            if self.verbose > 0:
-                print(f"New best mean reward: {mean_reward:.2f}")
+        # running return of every environment; only finished episodes are evaluated
+        self._returns += self.locals["rewards"]
+        dones = self.locals["dones"]
+        finished = dones.any()
+        if finished:
+            for i in np.flatnonzero(dones):
+                self._episode_returns.append(self._returns[i])
+                self._returns[i] = 0.0
+
+        if self.eval_freq is not None:
+            if self.n_calls % self.eval_freq == 0:
+                self._evaluate()
+        elif finished:
+            self._evaluate()
         return True
 
+    def _evaluate(self):
+        if len(self._episode_returns) < self.window:
+            return
+        mean_reward = float(np.mean(self._episode_returns))
+        if mean_reward <= self.best_mean_reward:
+            return
+        self.best_mean_reward = mean_reward
+        self.best_timestep = self.num_timesteps
+        # copy the weights in place: no allocation, no file I/O on the training thread
+        with torch.no_grad(), self._lock:
+            for name, value in self.model.policy.state_dict().items():
+                self._best_state[name].copy_(value)
+            self._pending = self.num_timesteps
+        self._wake.set()
+        if self.verbose > 0:
+            print(f"New best mean reward: {mean_reward:.2f} at {self.num_timesteps} timesteps")
+
+    def _write_loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._lock:
+                timestep, self._pending = self._pending, None
+                state = {k: v.clone() for k, v in self._best_state.items()} if timestep is not None else None
+            if state is not None:
+                path = os.path.join(self.log_dir, f"best_policy_nsteps_{self.n_steps}_{timestep}.pt")
+                torch.save(state, path + ".tmp")
+                os.replace(path + ".tmp", path)
+                self._rotate()
+            # a snapshot that arrived while writing sets _wake again, so it is not lost
+            if self._stop and self._pending is None:
+                return
+
+    def _rotate(self):
+        # keep only the newest `keep` checkpoints
+        files = glob.glob(os.path.join(self.log_dir, f"best_policy_nsteps_{self.n_steps}_*.pt"))
+        files.sort(key=lambda f: int(f.rsplit("_", 1)[1][:-3]))
+        for f in files[:-self.keep]:
+            os.remove(f)
+
     def _on_training_end(self) -> None:
+        # let the writer finish the last snapshot
+        self._stop = True
+        self._wake.set()
+        self._writer.join()
+
         # Save the best model when training ends
-        if self.best_model is not None:
+        if self.best_timestep is not None:
+            # swap the best weights in for saving and put the current ones back afterwards
+            current = {k: v.detach().clone() for k, v in self.model.policy.state_dict().items()}
+            self.model.policy.load_state_dict(self._best_state)
             save_path = os.path.join(self.log_dir, f"best_model_nsteps_{self.n_steps}.zip")
-            self.best_model.save(save_path)
+            self.model.save(save_path)
+            self.model.policy.load_state_dict(current)
             if self.verbose > 0:
-                print(f"Best model saved with mean reward at {save_path}")
+                print(f"Best model (mean reward {self.best_mean_reward:.2f} at "
+                      f"{self.best_timestep} timesteps) saved at {save_path}")
@@ -0,0 +1,407 @@
+# surrogate.py
+# Learned surrogate of the OT-2 gantry dynamics for cheap RL pretraining.
+#
+# The joints are velocity controlled with a force limit (apply_actions): the
+# pipette speed goes linearly towards gain * action, but changes by at most
+# `accel` per simulation step. Per axis and per simulation step:
+#
+#   velocity[t] = velocity[t-1] + clip(gain * action[t] - velocity[t-1], -accel, accel)
+#   position[t+1] = clip(position[t] + velocity[t], envelope)
+#
+# (Simulation.reset leaves the pipette below the envelope in z; from there it can
+# only move up.)
+#
+# gain and accel are fitted on logged Simulation rollouts (random piecewise constant
+# actions): gain from the steady-state samples, accel from the speed changes while
+# the speed catches up with a new command. Both use medians, so steps where the pipette is blocked by the
+# plate do not pull the fit. Samples close to the envelope faces are left out of
+# the fit because there the joints hit their limits; the clip reproduces that instead.
+#
+# SurrogateVecEnv steps thousands of environments at once with numpy and gives the
+# same observations and rewards as OT2Env, so a policy can be pretrained on it and
+# fine-tuned on the real simulation afterwards. fidelity_report() compares the model
+# against Simulation open-loop (same action sequences) and closed-loop (P controller).
+#
+# Usage:
+#   python surrogate.py --steps 20000 --report          # fit, save surrogate.npz, write the report
+#   python surrogate.py --benchmark --envs 4096         # environment steps per second
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+from math import inf
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+from envelope import load_envelope, sample_goals
+from ot2_wrapper_final import (BONUS1_RADIUS, BONUS1_SCALE, BONUS2_RADIUS, BONUS2_SCALE,
+                               STEP_PENALTY, GOAL_THRESHOLD, MAX_STEPS)
+
+SURROGATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "surrogate.npz")
+REPORT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "surrogate_report.json")
+
+# Rollout settings
+HOLD_STEPS = (1, 40)  # a random action is held for this many steps (min, max)
+BOUND_MARGIN = 0.002  # samples this close to the envelope are not used in the fit
+NOISE = 1.5e-4  # pipette positions are rounded to 0.1 mm
+STEADY_STEPS = 8  # an action held this long counts as steady state for the gain fit
+
+# Pipette position right after Simulation.reset (joints at zero)
+HOME_POSITION = np.array([0.073, 0.0895, 0.1195])
+
+
+def collect_rollouts(sim, n_steps=20000, seed=0, hold_steps=HOLD_STEPS):
+    """
+    Drive one robot with random piecewise constant actions and log the motion.
+
+    :param sim: Simulation with one robot.
+    :param n_steps: Number of simulation steps to record.
+    :return: dict with "positions" (n_steps + 1, 3) and "actions" (n_steps, 3).
+    """
+    rng = np.random.default_rng(seed)
+    key = f'robotId_{sim.robotIds[0]}'
+    positions = np.empty((n_steps + 1, 3))
+    actions = np.empty((n_steps, 3))
+    positions[0] = sim.get_states()[key]['pipette_position']
+    action = [0.0, 0.0, 0.0, 0]
+    hold = 0
+    for t in range(n_steps):
+        if hold == 0:
+            action[:3] = rng.uniform(-1, 1, 3)
+            hold = int(rng.integers(hold_steps[0], hold_steps[1] + 1))
+        hold -= 1
+        state = sim.run([action])
+        actions[t] = action[:3]
+        positions[t + 1] = state[key]['pipette_position']
+    return {"positions": positions, "actions": actions}
+
+
+class GantrySurrogate:
+    def __init__(self, gain, accel, low, high, home=HOME_POSITION):
+        """
+        :param gain: (3,) steady-state pipette displacement per step for an action of 1, per axis.
+        :param accel: (3,) largest change of that displacement per step, per axis.
+        :param low: Lower corner of the reachable box.
+        :param high: Upper corner of the reachable box.
+        :param home: Pipette position after a reset.
+        """
+        self.gain = np.asarray(gain, dtype=float)
+        self.accel = np.asarray(accel, dtype=float)
+        self.low = np.asarray(low, dtype=float)
+        self.high = np.asarray(high, dtype=float)
+        self.home = np.asarray(home, dtype=float)
+
+    @classmethod
+    def fit(cls, rollouts, envelope, margin=BOUND_MARGIN, steady_steps=STEADY_STEPS):
+        """Fit gain and accel per axis on the output of collect_rollouts."""
+        positions = rollouts["positions"]
+        actions = rollouts["actions"]
+        # velocities[t] is the displacement caused by actions[t]
+        velocities = np.diff(positions, axis=0)
+        # keep steps where the pipette is away from the joint limits before and after the step
+        away = np.all((positions > envelope["low"] + margin) & (positions < envelope["high"] - margin), axis=1)
+        usable = away[:-1] & away[1:]
+
+        # steady state: the same action for the last steady_steps steps
+        same = np.all(actions[1:] == actions[:-1], axis=1)
+        held = np.zeros(len(actions), dtype=int)
+        for t in range(1, len(actions)):
+            held[t] = held[t - 1] + 1 if same[t - 1] else 0
+        steady = usable & (held >= steady_steps)
+        # medians, because the pipette is sometimes blocked by the plate (zero velocity for any action)
+        gain = np.empty(3)
+        for axis in range(3):
+            moving = steady & (np.abs(actions[:, axis]) > 0.2)
+            gain[axis] = np.median(velocities[moving, axis] / actions[moving, axis])
+
+        # accel: size of the speed changes while the speed is still catching up with the command
+        dv = np.diff(velocities, axis=0)
+        previous = velocities[:-1]
+        target = gain * actions[1:]
+        keep = usable[1:] & usable[:-1]
+        accel = np.empty(3)
+        for axis in range(3):
+            changing = keep & (np.abs(target[:, axis] - previous[:, axis]) > 0.25 * gain[axis])
+            # blocked steps (no change at all) and position rounding noise are left out
+            moved = changing & (np.abs(dv[:, axis]) > NOISE)
+            accel[axis] = np.median(np.abs(dv[moved, axis]))
+        return cls(gain, accel, envelope["low"], envelope["high"], home=positions[0])
+
+    def step(self, positions, velocities, actions):
+        """
+        Advance (n, 3) positions and velocities in place by one simulation step.
+
+        :return: (positions, velocities)
+        """
+        velocities += np.clip(self.gain * actions - velocities, -self.accel, self.accel)
+        new_positions = positions + velocities
+        # the reset height is below the z limit; from there the pipette can only go up
+        low = np.minimum(self.low, positions)
+        # the joint stops at its limit
+        blocked = (new_positions < low) | (new_positions > self.high)
+        np.clip(new_positions, low, self.high, out=positions)
+        velocities[blocked] = 0
+        return positions, velocities
+
+    def save(self, path=SURROGATE_PATH):
+        np.savez(path, gain=self.gain, accel=self.accel, low=self.low, high=self.high, home=self.home)
+
+    @classmethod
+    def load(cls, path=SURROGATE_PATH):
+        data = np.load(path)
+        return cls(data["gain"], data["accel"], data["low"], data["high"], data["home"])
+
+
+class SurrogateVecEnv(VecEnv):
+    def __init__(self, model, num_envs=1024, seed=None, random_start=False):
+        """
+        Vectorised stand-in for OT2Env running on a GantrySurrogate.
+
+        Observations, rewards, termination and the MAX_STEPS truncation are the same as
+        in OT2Env. Finished environments are reset automatically (Stable-Baselines3
+        VecEnv convention, with "terminal_observation" in their info).
+
+        :param model: A fitted GantrySurrogate.
+        :param num_envs: Number of environments stepped together.
+        :param random_start: Start episodes anywhere in the envelope instead of the home position.
+        """
+        # same spaces as OT2Env
+        action_space = spaces.Box(low=-1, high=1, dtype=np.float32, shape=(3,))
+        observation_space = spaces.Box(low=-inf, high=inf, dtype=np.float32, shape=(9,))
+        self.render_mode = None
+        super().__init__(num_envs, observation_space, action_space)
+        self.model = model
+        self.random_start = random_start
+        self.rng = np.random.default_rng(seed)
+        self.envelope = {"low": model.low, "high": model.high}
+
+        n = num_envs
+        self.positions = np.zeros((n, 3))
+        self.velocities = np.zeros((n, 3))
+        self.goals = np.zeros((n, 3))
+        self.init_distance = np.ones(n)
+        self.total_distance = np.zeros(n)
+        self.steps = np.zeros(n, dtype=np.int64)
+        self._observations = np.zeros((n, 9), dtype=np.float32)
+        self._actions = np.zeros((n, 3))
+
+    def _reset_envs(self, idx):
+        k = len(idx)
+        if self.random_start:
+            self.positions[idx] = sample_goals(self.envelope, k, rng=self.rng)
+        else:
+            self.positions[idx] = self.model.home
+        self.velocities[idx] = 0
+        self.goals[idx] = sample_goals(self.envelope, k, rng=self.rng).round(4)
+        self.init_distance[idx] = np.maximum(np.linalg.norm(self.goals[idx] - self.positions[idx], axis=1), 1e-6)
+        self.total_distance[idx] = 0
+        self.steps[idx] = 0
+
+    def _fill_observations(self):
+        obs = self._observations
+        obs[:, 0:3] = self.positions
+        obs[:, 3:6] = self.goals
+        obs[:, 6:9] = self.goals - self.positions
+        return obs
+
+    def reset(self):
+        self._reset_envs(np.arange(self.num_envs))
+        return self._fill_observations().copy()
+
+    def step_arrays(self, actions):
+        """
+        Step all environments without building info dicts (the fast path).
+
+        :param actions: (num_envs, 3) velocity commands in [-1, 1].
+        :return: (observations, rewards, terminated, truncated) before the automatic reset.
+        """
+        np.clip(actions, -1, 1, out=self._actions)
+        self.model.step(self.positions, self.velocities, self._actions)
+
+        # same reward terms as OT2Env.step / reward_terms, for all environments at once
+        to_goal = self.goals - self.positions
+        distance = np.sqrt(np.einsum('ij,ij->i', to_goal, to_goal))
+        action_norm = np.sqrt(np.einsum('ij,ij->i', self._actions, self._actions))
+        moved = np.sqrt(np.einsum('ij,ij->i', self.velocities, self.velocities))
+        alignment = np.einsum('ij,ij->i', to_goal, self._actions) / ((distance + 1e-9) * (action_norm + 1e-9))
+        rewards = (alignment + 1) / 2 - 2 * distance / self.init_distance \
+            + BONUS1_SCALE * np.maximum(0.0, BONUS1_RADIUS - distance) \
+            + BONUS2_SCALE * np.maximum(0.0, BONUS2_RADIUS - distance) + STEP_PENALTY
+
+        self.total_distance += moved
+        self.steps += 1
+        terminated = distance < GOAL_THRESHOLD
+        if terminated.any():
+            rewards[terminated] += 250 - self.steps[terminated] / 5 \
+                + (self.init_distance[terminated] - self.total_distance[terminated]) / self.init_distance[terminated] * 3
+        truncated = self.steps >= MAX_STEPS
+        return self._fill_observations(), rewards.astype(np.float32), terminated, truncated
+
+    def step_async(self, actions):
+        self._pending = np.asarray(actions, dtype=float).reshape(self.num_envs, 3)
+
+    def step_wait(self):
+        obs, rewards, terminated, truncated = self.step_arrays(self._pending)
+        dones = terminated | truncated
+        infos = [{} for _ in range(self.num_envs)]
+        done_idx = np.flatnonzero(dones)
+        if len(done_idx):
+            for i in done_idx:
+                infos[i]["terminal_observation"] = obs[i].copy()
+                infos[i]["TimeLimit.truncated"] = bool(truncated[i] and not terminated[i])
+                infos[i]["is_success"] = bool(terminated[i])
+            self._reset_envs(done_idx)
+            obs = self._fill_observations()
+        return obs.copy(), rewards, dones, infos
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+    def _get_indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+
+def _p_control(positions, goals, gain=20.0):
+    return np.clip(gain * (goals - positions), -1, 1)
+
+
+def fidelity_report(model, sim, n_rollouts=10, horizon=200, n_goals=10, max_steps=MAX_STEPS, seed=1):
+    """
+    Compare the surrogate with the real Simulation.
+
+    Open loop: the same random action sequences are replayed from the same start in both,
+    and the position error is reported at a few horizons. Closed loop: a P controller drives
+    to the same goals in both, and success and step counts are compared.
+
+    :param sim: Simulation with one robot (it is reset between rollouts).
+    :return: dict with "open_loop" and "closed_loop" sections (errors in mm).
+    """
+    rng = np.random.default_rng(seed)
+    envelope = {"low": model.low, "high": model.high}
+    checkpoints = [h for h in (1, 10, 50, 100, horizon) if h <= horizon]
+    errors = {h: [] for h in checkpoints}
+    one_step = []
+
+    for k in range(n_rollouts):
+        sim.reset(num_agents=1)
+        rollout = collect_rollouts(sim, horizon, seed=seed * 1000 + k)
+        real, actions = rollout["positions"], rollout["actions"]
+
+        # one step ahead from the real state
+        velocities = np.diff(real, axis=0)
+        predicted, _ = model.step(real[1:-1].copy(), velocities[:-1].copy(), actions[1:])
+        one_step.append(predicted - real[2:])
+
+        # open loop from the same start
+        position = real[:1].copy()
+        velocity = np.zeros((1, 3))
+        for t in range(1, horizon + 1):
+            model.step(position, velocity, actions[t - 1:t])
+            if t in errors:
+                errors[t].append(np.linalg.norm(position[0] - real[t]))
+
+    one_step = np.vstack(one_step)
+    open_loop = {
+        "one_step_rmse_mm": (np.sqrt(np.mean(np.square(one_step), axis=0)) * 1000).round(4).tolist(),
+        "drift_mm": {str(h): {"mean": round(float(np.mean(e)) * 1000, 3), "max": round(float(np.max(e)) * 1000, 3)}
+                     for h, e in errors.items()},
+    }
+
+    # closed loop on the same goals
+    goals = sample_goals(envelope, n_goals, rng=rng)
+    closed = []
+    for goal in goals:
+        sim.reset(num_agents=1)
+        key = f'robotId_{sim.robotIds[0]}'
+        real = np.array(sim.get_states()[key]['pipette_position'], dtype=float)
+        real_steps = max_steps
+        for t in range(max_steps):
+            if np.linalg.norm(goal - real) < GOAL_THRESHOLD:
+                real_steps = t
+                break
+            state = sim.run([list(_p_control(real, goal)) + [0]])
+            real = np.array(state[key]['pipette_position'], dtype=float)
+
+        position = model.home[None].copy()
+        velocity = np.zeros((1, 3))
+        surrogate_steps = max_steps
+        for t in range(max_steps):
+            if np.linalg.norm(goal - position[0]) < GOAL_THRESHOLD:
+                surrogate_steps = t
+                break
+            model.step(position, velocity, _p_control(position, goal[None]))
+        closed.append({"goal": goal.round(4).tolist(), "real_steps": real_steps, "surrogate_steps": surrogate_steps})
+
+    real_ok = np.array([c["real_steps"] < max_steps for c in closed])
+    sur_ok = np.array([c["surrogate_steps"] < max_steps for c in closed])
+    both = real_ok & sur_ok
+    step_diff = [abs(c["real_steps"] - c["surrogate_steps"]) for c, b in zip(closed, both) if b]
+    closed_loop = {
+        "real_success": int(real_ok.sum()),
+        "surrogate_success": int(sur_ok.sum()),
+        "agreement": float(np.mean(real_ok == sur_ok)),
+        "mean_step_difference": float(np.mean(step_diff)) if step_diff else None,
+        "goals": closed,
+    }
+    return {"open_loop": open_loop, "closed_loop": closed_loop}
+
+
+def benchmark(model, num_envs=4096, n_steps=1000):
+    """Environment steps per second of SurrogateVecEnv.step_arrays with random actions."""
+    env = SurrogateVecEnv(model, num_envs=num_envs, seed=0)
+    env.reset()
+    actions = np.random.default_rng(0).uniform(-1, 1, (num_envs, 3))
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        env.step_arrays(actions)
+    return num_envs * n_steps / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the gantry surrogate and check it against the simulation.")
+    parser.add_argument("--steps", type=int, default=20000, help="simulation steps logged for the fit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=SURROGATE_PATH)
+    parser.add_argument("--report", action="store_true", help="write the fidelity report")
+    parser.add_argument("--benchmark", action="store_true", help="only benchmark an existing model")
+    parser.add_argument("--envs", type=int, default=4096)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        model = GantrySurrogate.load(args.output)
+        print(f"[SURROGATE] {benchmark(model, args.envs):,.0f} env steps/s with {args.envs} envs")
+    else:
+        from sim_class import Simulation
+        sim = Simulation(num_agents=1, render=False)
+        start_time = time.time()
+        rollouts = collect_rollouts(sim, args.steps, args.seed)
+        model = GantrySurrogate.fit(rollouts, load_envelope())
+        model.save(args.output)
+        print(f"[SURROGATE] Fitted on {args.steps} steps in {time.time() - start_time:.1f}s, saved to {args.output}")
+        if args.report:
+            report = fidelity_report(model, sim, seed=args.seed + 1)
+            with open(REPORT_PATH, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"[SURROGATE] One-step RMSE (mm): {report['open_loop']['one_step_rmse_mm']}")
+            print(f"[SURROGATE] Drift (mm): {report['open_loop']['drift_mm']}")
+            print(f"[SURROGATE] Closed loop: real {report['closed_loop']['real_success']}, "
+                  f"surrogate {report['closed_loop']['surrogate_success']} goals reached, "
+                  f"mean step difference {report['closed_loop']['mean_step_difference']}")
+        sim.close()
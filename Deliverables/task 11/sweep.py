@@ -0,0 +1,283 @@
+# sweep.py
+# Local hyperparameter sweeps for PPO on OT2Env, several trials at a time.
+#
+# Trials run on a process pool; each worker is pinned to its own CPU cores
+# (os.sched_setaffinity, where available) and torch uses only those cores, so
+# concurrent trials do not fight over threads. Three search methods:
+#   random  parameters drawn independently from the search space
+#   bayes   tree-structured Parzen estimator (TPE) after a few random trials
+#   asha    asynchronous successive halving: every trial starts with a small budget
+#           and only the best 1/eta of each rung is trained further (parameters of new
+#           trials are drawn at random)
+#
+# Every finished trial (or rung) is appended to <sweep dir>/trials.jsonl and
+# summary.json holds the best result so far. The search space uses the same
+# format as the old wandb sweep config:
+#   {"n_steps": {"distribution": "int_uniform", "min": 2048, "max": 4096},
+#    "learning_rate": {"distribution": "log_uniform_values", "min": 1e-5, "max": 1e-3},
+#    "batch_size": {"values": [64, 128, 256]}}
+
+import os
+import json
+import math
+import time
+import queue
+import multiprocessing
+from multiprocessing.util import Finalize
+import numpy as np
+import metrics
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+N_STARTUP = 5  # random trials before TPE takes over
+TPE_GAMMA = 0.25  # fraction of trials counted as "good" by TPE
+TPE_CANDIDATES = 64
+ASHA_ETA = 3
+
+
+# ----- search space -----
+
+def from_unit(spec, u):
+    """Map u in [0, 1) to a parameter value."""
+    if "values" in spec:
+        return spec["values"][min(int(u * len(spec["values"])), len(spec["values"]) - 1)]
+    lo, hi = spec["min"], spec["max"]
+    distribution = spec.get("distribution", "uniform")
+    if distribution == "int_uniform":
+        return int(min(math.floor(lo + u * (hi - lo + 1)), hi))
+    if distribution == "log_uniform_values":
+        return float(math.exp(math.log(lo) + u * (math.log(hi) - math.log(lo))))
+    return float(lo + u * (hi - lo))
+
+
+def to_unit(spec, value):
+    """Inverse of from_unit (middle of the bin for discrete values)."""
+    if "values" in spec:
+        return (spec["values"].index(value) + 0.5) / len(spec["values"])
+    lo, hi = spec["min"], spec["max"]
+    distribution = spec.get("distribution", "uniform")
+    if distribution == "int_uniform":
+        return (value - lo + 0.5) / (hi - lo + 1)
+    if distribution == "log_uniform_values":
+        return (math.log(value) - math.log(lo)) / (math.log(hi) - math.log(lo))
+    return (value - lo) / (hi - lo)
+
+
+def sample_random(space, rng):
+    return {name: from_unit(spec, rng.random()) for name, spec in space.items()}
+
+
+def _kde_log_density(points, samples, bandwidth):
+    # (n_candidates,) log density of a Gaussian KDE on [0, 1]^d, per dimension product
+    diff = (samples[:, None, :] - points[None, :, :]) / bandwidth
+    log_k = -0.5 * np.sum(diff ** 2, axis=2) - samples.shape[1] * np.log(bandwidth * np.sqrt(2 * np.pi))
+    top = log_k.max(axis=1, keepdims=True)
+    return (top + np.log(np.mean(np.exp(log_k - top), axis=1, keepdims=True)))[:, 0]
+
+
+def sample_tpe(space, history, rng, gamma=TPE_GAMMA, n_candidates=TPE_CANDIDATES):
+    """
+    Propose parameters with a tree-structured Parzen estimator.
+
+    :param history: list of (params, score) of finished trials (lower score is better).
+    """
+    names = list(space)
+    scores = np.array([s for _, s in history])
+    units = np.array([[to_unit(space[n], p[n]) for n in names] for p, _ in history])
+    n_good = max(1, int(math.ceil(gamma * len(history))))
+    order = np.argsort(scores)
+    good, bad = units[order[:n_good]], units[order[n_good:]]
+    if len(bad) == 0:
+        return sample_random(space, rng)
+    bandwidth = max(0.05, len(history) ** (-1 / (len(names) + 4)) * 0.3)
+    # candidates around the good points
+    centres = good[rng.integers(0, len(good), n_candidates)]
+    candidates = np.clip(centres + rng.normal(0, bandwidth, centres.shape), 0, 1 - 1e-9)
+    score = _kde_log_density(good, candidates, bandwidth) - _kde_log_density(bad, candidates, bandwidth)
+    best = candidates[int(np.argmax(score))]
+    return {name: from_unit(space[name], u) for name, u in zip(names, best)}
+
+
+# ----- workers -----
+
+def _init_worker(cpu_queue, threads):
+    # pin this worker to a free CPU set and keep torch inside it; the set goes back to the
+    # queue when the worker exits. A replacement for a worker that died without returning
+    # its set finds none free and runs unpinned instead of waiting for one.
+    try:
+        cpus = cpu_queue.get_nowait()
+    except queue.Empty:
+        cpus = None
+    else:
+        Finalize(None, cpu_queue.put, args=(cpus,), exitpriority=10)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    # Simulation loads textures and URDFs relative to the working directory
+    os.chdir(SCRIPT_DIR)
+
+
+def make_env(env_name, seed, n_envs=64):
+    if env_name == "surrogate":
+        from stable_baselines3.common.vec_env import VecMonitor
+        from surrogate import GantrySurrogate, SurrogateVecEnv
+        return VecMonitor(SurrogateVecEnv(GantrySurrogate.load(), num_envs=n_envs, seed=seed))
+    from ot2_wrapper_final import OT2Env
+    env = OT2Env()
+    env.reset(seed=seed)
+    return env
+
+
+def train_trial(trial_id, params, timesteps, trial_dir, env_name="sim", seed=0, project=None):
+    """
+    Train (or continue training) one PPO trial up to `timesteps` and score it.
+
+    The model is saved in trial_dir so ASHA can continue it on a higher rung.
+
+    :return: dict with trial, timesteps, score (mean episode length, lower is better) and seconds.
+    """
+    from stable_baselines3 import PPO
+    from save_best_callback import SaveBestRewardAtEndCallback
+
+    start = time.time()
+    os.makedirs(trial_dir, exist_ok=True)
+    model_path = os.path.join(trial_dir, "model.zip")
+    env = make_env(env_name, seed + trial_id)
+    if os.path.exists(model_path):
+        model = PPO.load(model_path, env=env, device="cpu")
+    else:
+        model = PPO("MlpPolicy", env, seed=seed + trial_id, device="cpu", verbose=0, **params)
+    run = metrics.init(project=project or "sweep", name=f"trial_{trial_id}_{timesteps}", config=params)
+    model.set_logger(metrics.sb3_logger(run, formats=()))
+    callback = SaveBestRewardAtEndCallback(log_dir=trial_dir, n_steps=model.n_steps, verbose=0)
+    model.learn(total_timesteps=max(timesteps - model.num_timesteps, 0), reset_num_timesteps=False,
+                callback=callback)
+    model.save(model_path)
+
+    lengths = [info["l"] for info in model.ep_info_buffer]
+    score = float(np.mean(lengths)) if lengths else float("inf")
+    run.log({"score": score})
+    run.finish()
+    env.close()
+    return {"trial": trial_id, "timesteps": int(model.num_timesteps), "score": score,
+            "seconds": time.time() - start}
+
+
+# ----- orchestration -----
+
+def _cpu_sets(workers, cpus_per_worker):
+    if not hasattr(os, "sched_getaffinity"):
+        return [None] * workers
+    available = sorted(os.sched_getaffinity(0))
+    sets = []
+    for k in range(workers):
+        # wrap around when there are more workers than cores
+        first = (k * cpus_per_worker) % len(available)
+        sets.append(set(available[first:first + cpus_per_worker]))
+    return sets
+
+
+def rungs(min_timesteps, max_timesteps, eta=ASHA_ETA):
+    """Training budgets of the ASHA rungs."""
+    budgets = []
+    budget = min_timesteps
+    while budget < max_timesteps:
+        budgets.append(int(budget))
+        budget *= eta
+    return budgets + [int(max_timesteps)]
+
+
+def run_sweep(space, sweep_dir, method="random", trials=10, workers=4, cpus_per_worker=1,
+              timesteps=2_000_000, min_timesteps=100_000, eta=ASHA_ETA, env_name="sim", seed=0):
+    """
+    Run a sweep and return the best trial.
+
+    :param space: Search space (see the top of this file).
+    :param method: "random", "bayes" or "asha".
+    :param trials: Number of parameter sets tried.
+    :param timesteps: Training budget of a full trial (the top rung for ASHA).
+    :param min_timesteps: Budget of the first ASHA rung.
+    :return: dict of the best finished trial (params, score, timesteps).
+    """
+    os.makedirs(sweep_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    budgets = rungs(min_timesteps, timesteps, eta) if method == "asha" else [int(timesteps)]
+    params = {}  # trial id -> parameters
+    results = {}  # (trial id, rung) -> score
+    promoted = set()  # (trial id, rung) already continued
+    history = []  # (params, score) of trials that reached the full budget (or any rung for asha)
+    best = None
+    project = os.path.basename(os.path.normpath(sweep_dir))
+
+    running = {}  # async result -> (trial id, rung)
+    log_path = os.path.join(sweep_dir, "trials.jsonl")
+
+    def next_job():
+        # ASHA: promote the best unpromoted trial of the highest possible rung first
+        if method == "asha":
+            for k in reversed(range(len(budgets) - 1)):
+                done = [(s, t) for (t, r), s in results.items() if r == k]
+                n_top = len(done) // eta
+                for s, t in sorted(done)[:n_top]:
+                    if (t, k) not in promoted:
+                        promoted.add((t, k))
+                        return t, k + 1
+        if len(params) < trials:
+            trial = len(params)
+            if method == "bayes" and len(history) >= N_STARTUP:
+                params[trial] = sample_tpe(space, history, rng)
+            else:
+                params[trial] = sample_random(space, rng)
+            return trial, 0
+        return None
+
+    with multiprocessing.Manager() as manager:
+        cpu_queue = manager.Queue()
+        for cpus in _cpu_sets(workers, cpus_per_worker):
+            cpu_queue.put(cpus)
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(cpu_queue, cpus_per_worker))
+        try:
+            while True:
+                while len(running) < workers:
+                    job = next_job()
+                    if job is None:
+                        break
+                    trial, rung = job
+                    result = pool.apply_async(train_trial, (trial, params[trial], budgets[rung],
+                                                            os.path.join(sweep_dir, f"trial_{trial}"),
+                                                            env_name, seed, project))
+                    running[result] = job
+                if not running:
+                    break
+
+                time.sleep(0.5)
+                for result in [r for r in running if r.ready()]:
+                    trial, rung = running.pop(result)
+                    try:
+                        outcome = result.get()
+                        score = outcome["score"]
+                        status = "ok"
+                    except Exception as e:  # a failing trial must not stop the sweep
+                        outcome = {"trial": trial, "error": repr(e)}
+                        score = float("inf")
+                        status = "failed"
+                    results[(trial, rung)] = score
+                    history.append((params[trial], score))
+                    record = dict(outcome, rung=rung, params=params[trial], status=status)
+                    with open(log_path, "a") as f:
+                        f.write(json.dumps(record) + "\n")
+                    print(f"[SWEEP] trial {trial} rung {rung} ({budgets[rung]} steps): "
+                          f"score {score:.1f} {params[trial]}")
+
+                    # best = best score among trials on the highest rung reached so far
+                    if best is None or (rung, -score) > (best["rung"], -best["score"]):
+                        best = {"trial": trial, "rung": rung, "timesteps": budgets[rung],
+                                "score": score, "params": params[trial]}
+                        with open(os.path.join(sweep_dir, "summary.json"), "w") as f:
+                            json.dump({"method": method, "space": space, "best": best}, f, indent=2)
+        finally:
+            pool.terminate()
+            pool.join()
+    return best
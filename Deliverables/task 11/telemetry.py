@@ -0,0 +1,236 @@
+# telemetry.py
+# Local per-step telemetry for simulation and RL runs.
+#
+# TraceRecorder keeps one preallocated numpy buffer per column. Recording a step
+# only copies values into the buffers; when a chunk is full it is handed to a
+# background thread that writes it to disk, while recording continues in a second
+# set of buffers. Chunks are written as Parquet files when pyarrow is installed and
+# as .npz files otherwise. Vector columns (pipette position, action) are stored as
+# one column per component (pipette_x, pipette_y, pipette_z).
+#
+# The query functions read a trace directory back into numpy arrays, so a run can be
+# analysed without a live logging service:
+#
+#   with TraceRecorder("traces/run_1") as recorder:
+#       env = OT2Env(recorder=recorder)
+#       ...
+#   trace = load_trace("traces/run_1", columns=["episode", "reward"])
+#   summary = episode_summary("traces/run_1")
+#
+# A recorder belongs to one environment: the episode ids of two envs would collide,
+# and the recorder (with its writer thread) cannot cross a SubprocVecEnv process
+# boundary. With a vectorised env, create one recorder per env inside the env
+# factory, each with its own directory.
+
+import os
+import re
+import glob
+import queue
+import threading
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+CHUNK_SIZE = 65536  # rows per chunk file
+CHUNK_NAME = re.compile(r"part-(\d+)\.(parquet|npz)$")
+
+# name: (dtype, components)
+STEP_COLUMNS = {
+    "episode": (np.int32, 1),
+    "step": (np.int32, 1),
+    "pipette": (np.float32, 3),
+    "goal": (np.float32, 3),
+    "action": (np.float32, 3),
+    "distance": (np.float32, 1),
+    "reward": (np.float32, 1),
+    "reward_alignment": (np.float32, 1),
+    "reward_distance": (np.float32, 1),
+    "reward_bonus": (np.float32, 1),
+    "reward_goal": (np.float32, 1),
+    "terminated": (np.bool_, 1),
+    "truncated": (np.bool_, 1),
+    "sim_time": (np.float32, 1),  # seconds spent in Simulation.run
+    "step_time": (np.float32, 1),  # seconds for the whole env step
+}
+
+AXES = "xyz"
+
+
+def _allocate(columns, rows):
+    return {name: np.zeros((rows, width) if width > 1 else rows, dtype=dtype)
+            for name, (dtype, width) in columns.items()}
+
+
+def _next_chunk_index(directory):
+    # one past the highest finished chunk; leftover .tmp files and gaps do not count
+    indices = [int(match.group(1)) for match in map(CHUNK_NAME.match, os.listdir(directory)) if match]
+    return max(indices) + 1 if indices else 0
+
+
+def _flat_columns(buffers, rows):
+    """Split vector columns into one array per component, truncated to `rows`."""
+    flat = {}
+    for name, values in buffers.items():
+        if values.ndim == 1:
+            flat[name] = values[:rows]
+        else:
+            for k in range(values.shape[1]):
+                flat[f"{name}_{AXES[k] if values.shape[1] <= 3 else k}"] = values[:rows, k]
+    return flat
+
+
+class TraceRecorder:
+    def __init__(self, directory, columns=STEP_COLUMNS, chunk_size=CHUNK_SIZE, max_pending=4):
+        """
+        :param directory: Directory the chunk files are written to (created if needed).
+        :param columns: dict name -> (dtype, components) of the recorded columns.
+        :param chunk_size: Rows per chunk file.
+        :param max_pending: Chunks that may wait for the writer before record() blocks.
+        """
+        self.directory = directory
+        self.columns = columns
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
+        # continue numbering after chunks already in the directory
+        self.chunk_index = _next_chunk_index(directory)
+        self.rows = 0
+        self.total_rows = 0
+        self._buffers = _allocate(columns, chunk_size)
+        # finished buffers come back here from the writer, so they are reused instead of reallocated
+        self._free = queue.Queue()
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def record(self, **values):
+        """Record one row; columns that are not given are left at zero."""
+        i = self.rows
+        buffers = self._buffers
+        for name, value in values.items():
+            buffers[name][i] = value
+        self.rows = i + 1
+        if self.rows == self.chunk_size:
+            self._submit()
+
+    def _submit(self):
+        if self._error is not None:
+            raise RuntimeError("telemetry writer failed") from self._error
+        self._pending.put((self.chunk_index, self._buffers, self.rows))
+        self.chunk_index += 1
+        self.total_rows += self.rows
+        self.rows = 0
+        try:
+            self._buffers = self._free.get_nowait()
+        except queue.Empty:
+            self._buffers = _allocate(self.columns, self.chunk_size)
+        # rows that are not overwritten must not keep values of an older chunk
+        for values in self._buffers.values():
+            values.fill(0)
+
+    def _write_loop(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                self._pending.task_done()
+                return
+            index, buffers, rows = item
+            try:
+                write_chunk(self.directory, index, _flat_columns(buffers, rows))
+            except Exception as e:  # reported on the next submit/flush
+                self._error = e
+            self._free.put(buffers)
+            self._pending.task_done()
+
+    def flush(self):
+        """Write the partial chunk and wait until everything is on disk."""
+        if self.rows:
+            self._submit()
+        self._pending.join()
+        if self._error is not None:
+            raise RuntimeError("telemetry writer failed") from self._error
+
+    def close(self):
+        self.flush()
+        self._pending.put(None)
+        self._writer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_chunk(directory, index, columns):
+    """Write one chunk (dict of equal-length 1-D arrays) atomically."""
+    if pq is not None:
+        path = os.path.join(directory, f"part-{index:05d}.parquet")
+        table = pa.table(columns)
+        pq.write_table(table, path + ".tmp")
+    else:
+        path = os.path.join(directory, f"part-{index:05d}.npz")
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **columns)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def _read_chunk(path, columns):
+    if path.endswith(".parquet"):
+        if pq is None:
+            raise ImportError(f"pyarrow is needed to read {path}")
+        table = pq.read_table(path, columns=columns)
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+    with np.load(path) as data:
+        names = columns if columns is not None else data.files
+        return {name: data[name] for name in names}
+
+
+def load_trace(directory, columns=None, episodes=None):
+    """
+    Read a trace directory back into memory.
+
+    :param columns: Flat column names to read (default: all), e.g. ["episode", "pipette_x"].
+    :param episodes: Only keep rows of these episodes.
+    :return: dict of column name -> numpy array, in recording order.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, "part-*.parquet")) +
+                   glob.glob(os.path.join(directory, "part-*.npz")))
+    if columns is not None and episodes is not None and "episode" not in columns:
+        columns = list(columns) + ["episode"]
+    chunks = [_read_chunk(path, columns) for path in paths]
+    if not chunks:
+        return {}
+    trace = {name: np.concatenate([c[name] for c in chunks]) for name in chunks[0]}
+    if episodes is not None:
+        keep = np.isin(trace["episode"], episodes)
+        trace = {name: values[keep] for name, values in trace.items()}
+    return trace
+
+
+def episode_summary(directory):
+    """
+    Per-episode statistics of an OT2Env trace.
+
+    :return: dict of arrays: episode, length, return, success, final_distance,
+             mean_step_time (seconds).
+    """
+    trace = load_trace(directory, columns=["episode", "reward", "terminated", "distance", "step_time"])
+    if not trace:
+        return {}
+    episodes, index, counts = np.unique(trace["episode"], return_inverse=True, return_counts=True)
+    last = np.cumsum(counts) - 1 if np.all(np.diff(trace["episode"]) >= 0) else \
+        np.array([np.flatnonzero(index == k)[-1] for k in range(len(episodes))])
+    return {
+        "episode": episodes,
+        "length": counts,
+        "return": np.bincount(index, weights=trace["reward"]),
+        "success": np.bincount(index, weights=trace["terminated"]) > 0,
+        "final_distance": trace["distance"][last],
+        "mean_step_time": np.bincount(index, weights=trace["step_time"]) / counts,
+    }
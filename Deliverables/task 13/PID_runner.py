@@ -9,23 +9,31 @@
 # Author: Michal Batkowski
 # Date: 2025-04-01
 
+import os
+import json
 import numpy as np
 import time
 import pybullet as p
 from sim_class import Simulation
 from PID_Controller import PID
+from envelope import load_envelope, sample_goals
+from policy_runtime import NumpyPolicy, observation
 
-# === Bounds ===
-low_bound = np.array([-0.187, -0.1705, 0.1695])
-high_bound = np.array([0.001, 0.2195, 0.2908])
+# === Bounds === (measured once by envelope.py, stored in envelope.json)
+ENVELOPE = load_envelope()
+low_bound = ENVELOPE['low']
+high_bound = ENVELOPE['high']
 
-# Example gains; can be tuned
-best_gains = {
+# Fallback gains, used when no tuned gains file is present
+DEFAULT_GAINS = {
     'x': (5, 0.1, 0.01),
     'y': (5, 0.1, 0.01),
     'z': (5, 0.1, 0.01)
 }
 
+# Gains file written by PID_tuner.py
+GAINS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pid_gains.json")
+
 # Tolerance for accuracy in meters
 # 0.01 m (10 mm) for ILO 8.7 C; 0.001 m (1 mm) for ILO 8.7 D
 DEFAULT_TOLERANCE = 0.001
@@ -34,12 +42,29 @@ DEFAULT_TOLERANCE = 0.001
 DT = 0.01
 
 
+def load_gains(path=GAINS_PATH):
+    """
+    Load per-axis (Kp, Ki, Kd) gains from a gains file written by PID_tuner.py.
+    Falls back to DEFAULT_GAINS when the file does not exist.
+    :param path: Path to the JSON gains file.
+    :return: dict {'x': (Kp, Ki, Kd), 'y': ..., 'z': ...}
+    """
+    if not os.path.exists(path):
+        return dict(DEFAULT_GAINS)
+    with open(path, "r") as f:
+        data = json.load(f)
+    return {axis: tuple(data[axis]) for axis in ('x', 'y', 'z')}
+
+
+best_gains = load_gains()
+
+
 def generate_random_target():
-    """Generate a random target position within the specified bounds."""
-    return np.random.uniform(low=low_bound, high=high_bound)
+    """Generate a random target position within the working envelope."""
+    return sample_goals(ENVELOPE)[0]
 
 
-def move_to(sim, pid_x, pid_y, pid_z, target, tolerance=DEFAULT_TOLERANCE, max_steps=500):
+def move_to(sim, pid_x, pid_y, pid_z, target, tolerance=DEFAULT_TOLERANCE, max_steps=500, trace=None):
     """
     Move the pipette to the desired target using the PID controllers.
     :param sim: The Simulation instance.
@@ -49,6 +74,7 @@ def move_to(sim, pid_x, pid_y, pid_z, target, tolerance=DEFAULT_TOLERANCE, max_s
     :param target: Target (x, y, z) to reach.
     :param tolerance: Error tolerance in meters.
     :param max_steps: Maximum number of simulation steps.
+    :param trace: Optional list; the pipette position of every step is appended to it.
     :return: (bool, final_error) success flag, and final 3D absolute error.
     """
     for step in range(max_steps):
@@ -57,6 +83,8 @@ def move_to(sim, pid_x, pid_y, pid_z, target, tolerance=DEFAULT_TOLERANCE, max_s
         # We assume a single robot (robotIds[0])
         robot_id_key = list(states.keys())[0]
         current_pos = np.array(states[robot_id_key]["pipette_position"], dtype=float)
+        if trace is not None:
+            trace.append(current_pos)
 
         # Compute errors
         error_x = target[0] - current_pos[0]
@@ -86,9 +114,56 @@ def move_to(sim, pid_x, pid_y, pid_z, target, tolerance=DEFAULT_TOLERANCE, max_s
     return False, final_error
 
 
-def run_random_tests(n=5, tolerance=DEFAULT_TOLERANCE):
+def move_to_policy(sim, policy, target, tolerance=DEFAULT_TOLERANCE, max_steps=500, trace=None):
+    """
+    Move the pipette to the desired target with a trained RL controller instead of the PIDs.
+    :param sim: The Simulation instance.
+    :param policy: NumpyPolicy (policy_runtime.py) exported from a PPO model trained on OT2Env.
+    :param target: Target (x, y, z) to reach.
+    :param tolerance: Error tolerance in meters (per axis, as in move_to).
+    :param max_steps: Maximum number of simulation steps.
+    :param trace: Optional list; the pipette position of every step is appended to it.
+    :return: (bool, final_error) success flag, and final 3D absolute error.
+    """
+    target = np.asarray(target, dtype=float)
+    obs = np.zeros(9, dtype=np.float32)
+    actions = [[0.0, 0.0, 0.0, 0]]
+    for step in range(max_steps):
+        states = sim.get_states()
+        robot_id_key = list(states.keys())[0]
+        current_pos = np.array(states[robot_id_key]["pipette_position"], dtype=float)
+        if trace is not None:
+            trace.append(current_pos)
+
+        if np.all(np.abs(target - current_pos) < tolerance):
+            return True, np.abs(target - current_pos)
+
+        # The policy outputs the joint velocities directly, as in OT2Env.step
+        actions[0][:3] = policy.act(observation(current_pos, target, out=obs))
+        sim.run(actions, num_steps=1)
+
+    return False, np.abs(target - current_pos)
+
+
+def move_to_trajectory(sim, targets, gains=None, tolerance=DEFAULT_TOLERANCE, max_steps=500, drop=False):
+    """
+    Visit several targets in one Simulation.run_trajectory call (PID loop inside the simulation).
+    :param sim: The Simulation instance.
+    :param targets: List of (x, y, z) targets, visited in order.
+    :param gains: Per-axis gains dict; defaults to best_gains.
+    :param drop: Release a droplet at every reached target.
+    :return: (list of success flags, list of final 3D absolute errors)
+    """
+    gains = gains or best_gains
+    result = sim.run_trajectory(waypoints=targets, gains=[gains[axis] for axis in ('x', 'y', 'z')],
+                                tolerance=tolerance, max_steps=max_steps, dt=DT, drop=drop)
+    return result['reached'], [np.array(e) for e in result['final_error']]
+
+
+def run_random_tests(n=5, tolerance=DEFAULT_TOLERANCE, policy_path=None):
     """
     Create a simulation, run N random tests, and summarize errors.
+    :param policy_path: Exported RL controller (.npz, see policy_runtime.py) used instead of the PIDs.
     """
     # Create the simulation with a single agent
     sim = Simulation(num_agents=1, render=True, rgb_array=False)
@@ -97,6 +172,7 @@ def run_random_tests(n=5, tolerance=DEFAULT_TOLERANCE):
     pid_x = PID(*best_gains['x'])
     pid_y = PID(*best_gains['y'])
     pid_z = PID(*best_gains['z'])
+    policy = NumpyPolicy(policy_path) if policy_path else None
 
     total_errors = []
 
@@ -105,7 +181,10 @@ def run_random_tests(n=5, tolerance=DEFAULT_TOLERANCE):
         print(f"\n[TEST {i+1}] Target = {target}")
         start_time = time.time()
 
-        success, final_error = move_to(sim, pid_x, pid_y, pid_z, target, tolerance=tolerance)
+        if policy is not None:
+            success, final_error = move_to_policy(sim, policy, target, tolerance=tolerance)
+        else:
+            success, final_error = move_to(sim, pid_x, pid_y, pid_z, target, tolerance=tolerance)
         end_time = time.time()
 
         print(f"  Reached target: {success}")
@@ -134,3 +213,4 @@ if __name__ == "__main__":
     run_random_tests(n=5, tolerance=0.001)
 
     # For 10 mm accuracy, use: run_random_tests(n=5, tolerance=0.01)
+    # With an exported RL controller: run_random_tests(n=5, tolerance=0.01, policy_path="ppo_ot2_model_v4.npz")
@@ -0,0 +1,257 @@
+# PID_tuner.py
+# Automatic per-axis tuning of the PID gains used by PID_runner.move_to.
+#
+# Every candidate (Kp, Ki, Kd) set is evaluated on a pool of headless Simulation
+# instances (one per worker process). The joints of the OT-2 gantry are independent,
+# so one rollout scores all three axes at once: a candidate applies its own gains to
+# x, y and z and each axis is judged on its own settling time and overshoot.
+# Every rollout has a fixed length and keeps controlling after the pipette first enters
+# the tolerance band (a hold window of HOLD_STEPS), so gains that reach the target and
+# then drift away again are penalised for the steps outside the band and for the
+# largest error after entry.
+# The search is a coarse log-spaced grid followed by a few rounds of finer grids
+# around the best gains found so far for each axis.
+#
+# The result is written to pid_gains.json, which PID_runner.load_gains() picks up.
+#
+# Usage:
+#   python PID_tuner.py --workers 8 --targets 6
+
+import os
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+from multiprocessing import Pool
+from sim_class import Simulation
+from PID_Controller import PID
+from PID_runner import generate_random_target, GAINS_PATH, DEFAULT_GAINS, DEFAULT_TOLERANCE, DT
+from envelope import home_robot
+
+AXES = ('x', 'y', 'z')
+
+# Coarse search ranges (log-spaced)
+KP_RANGE = (0.5, 50.0)
+KI_RANGE = (0.001, 5.0)
+KD_RANGE = (0.0001, 0.5)
+GAIN_RANGES = (KP_RANGE, KI_RANGE, KD_RANGE)
+
+# Velocity scale of the PID output, as in PID_runner.move_to
+VELOCITY_SCALE = 5.0
+# Steps the rollout keeps running after max_steps, so every axis that enters the band is held
+HOLD_STEPS = 200
+
+# Weight of overshoot (in mm) relative to settling steps in the objective
+OVERSHOOT_WEIGHT = 10.0
+# Weight of every step spent outside the tolerance after the first entry
+OUTSIDE_WEIGHT = 5.0
+# Weight of the largest error (in mm) after the first entry
+HOLD_ERROR_WEIGHT = 10.0
+# Extra penalty for an axis that never settles within the rollout
+FAILURE_PENALTY = 500
+
+# Headless simulation owned by each worker process
+_worker_sim = None
+
+
+def _init_worker(script_dir):
+    """Create one headless simulation per worker process."""
+    global _worker_sim
+    # Simulation loads textures and URDFs relative to the working directory
+    os.chdir(script_dir)
+    _worker_sim = Simulation(num_agents=1, render=False)
+
+
+def rollout(sim, pids, target, steps):
+    """
+    Run the PID loop of PID_runner.move_to for a fixed number of steps (no stop at the target).
+    :param pids: (pid_x, pid_y, pid_z) controllers.
+    :return: (steps, 3) array of pipette positions.
+    """
+    robot_key = f'robotId_{sim.robotIds[0]}'
+    trace = np.empty((steps, 3))
+    for step in range(steps):
+        position = np.array(sim.get_states()[robot_key]["pipette_position"], dtype=float)
+        trace[step] = position
+        velocity = [VELOCITY_SCALE * pid.compute(target[k], position[k], DT) for k, pid in enumerate(pids)]
+        sim.run([velocity + [0]], num_steps=1)
+    return trace
+
+
+def axis_metrics(trace, start, target, tolerance):
+    """
+    Compute per-axis settling and hold metrics from a fixed-length trajectory.
+    :param trace: (n_steps, 3) array of pipette positions.
+    :param start: Start position of the move.
+    :param target: Target position of the move.
+    :return: dict of (3,) arrays: settle_steps (first step after which the axis stays inside the
+             tolerance; len(trace) + FAILURE_PENALTY if it is outside at the end), outside_steps
+             (steps outside the tolerance after the first entry), hold_error (largest error after
+             the first entry, meters; the final error if the axis never enters) and overshoot (meters).
+    """
+    error = target - trace
+    outside = np.abs(error) >= tolerance
+    n = len(trace)
+    settle_steps = np.full(3, n + FAILURE_PENALTY, dtype=float)
+    outside_steps = np.zeros(3)
+    hold_error = np.abs(error[-1])
+    for axis in range(3):
+        # last step at which the axis was still outside the tolerance band
+        idx = np.flatnonzero(outside[:, axis])
+        if len(idx) == 0:
+            settle_steps[axis] = 0
+        elif idx[-1] < n - 1:
+            settle_steps[axis] = idx[-1] + 1
+        inside = np.flatnonzero(~outside[:, axis])
+        if len(inside):
+            entry = inside[0]
+            outside_steps[axis] = np.count_nonzero(outside[entry:, axis])
+            hold_error[axis] = np.max(np.abs(error[entry:, axis]))
+
+    # overshoot is travel past the target in the direction of the move
+    direction = np.sign(target - start)
+    overshoot = np.max(-error * direction, axis=0).clip(min=0)
+    return {"settle_steps": settle_steps, "outside_steps": outside_steps, "hold_error": hold_error,
+            "overshoot": overshoot}
+
+
+def evaluate_gains(gains, targets, tolerance=DEFAULT_TOLERANCE, max_steps=500):
+    """
+    Run one candidate on all targets in the worker's simulation.
+    Every rollout lasts max_steps + HOLD_STEPS steps from the home position.
+    :param gains: dict {'x': (Kp, Ki, Kd), 'y': ..., 'z': ...}
+    :param targets: list of (x, y, z) targets, each approached from the home position.
+    :return: dict with the per-axis objective and the mean of every metric of axis_metrics.
+    """
+    sim = _worker_sim
+    metrics = []
+    for target in targets:
+        target = np.asarray(target, dtype=float)
+        home_robot(sim)
+        pids = [PID(*gains[axis]) for axis in AXES]
+        trace = rollout(sim, pids, target, max_steps + HOLD_STEPS)
+        metrics.append(axis_metrics(trace, trace[0], target, tolerance))
+
+    mean = {name: np.mean([m[name] for m in metrics], axis=0) for name in metrics[0]}
+    objective = (mean['settle_steps'] + OUTSIDE_WEIGHT * mean['outside_steps']
+                 + HOLD_ERROR_WEIGHT * mean['hold_error'] * 1000 + OVERSHOOT_WEIGHT * mean['overshoot'] * 1000)
+    return dict({name: value.tolist() for name, value in mean.items()}, gains=gains, objective=objective.tolist())
+
+
+def _evaluate(args):
+    return evaluate_gains(*args)
+
+
+def coarse_grid(points_per_gain):
+    """Log-spaced (Kp, Ki, Kd) grid over the full search range."""
+    kp = np.geomspace(*KP_RANGE, points_per_gain)
+    ki = np.geomspace(*KI_RANGE, points_per_gain)
+    kd = np.geomspace(*KD_RANGE, points_per_gain)
+    return list(itertools.product(kp, ki, kd))
+
+
+def fine_grid(center, span, points_per_gain):
+    """
+    Log-spaced (Kp, Ki, Kd) grid around center, each gain within center / span .. center * span,
+    clipped to its search range.
+    """
+    axes = [np.unique(np.clip(np.geomspace(g / span, g * span, points_per_gain), low, high))
+            for g, (low, high) in zip(center, GAIN_RANGES)]
+    return list(itertools.product(*axes))
+
+
+def tune(workers=os.cpu_count(), n_targets=6, coarse_points=5, fine_points=3, rounds=3,
+         tolerance=DEFAULT_TOLERANCE, max_steps=500, seed=0, output_path=GAINS_PATH):
+    """
+    Coarse-to-fine per-axis gain search on a process pool of headless simulations.
+    :param workers: Number of worker processes (one Simulation each).
+    :param n_targets: Number of seeded random targets every candidate is scored on.
+    :param coarse_points: Grid points per gain in the coarse stage.
+    :param fine_points: Grid points per gain in each refinement round.
+    :param rounds: Number of refinement rounds; the span shrinks every round.
+    :param output_path: Where the gains file is written.
+    :return: dict with the best gains and their scores per axis.
+    """
+    np.random.seed(seed)
+    targets = [generate_random_target() for _ in range(n_targets)]
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    best = {axis: {'gains': DEFAULT_GAINS[axis], 'objective': np.inf} for axis in AXES}
+
+    def update_best(results):
+        for result in results:
+            for i, axis in enumerate(AXES):
+                if result['objective'][i] < best[axis]['objective']:
+                    best[axis] = {
+                        'gains': tuple(result['gains'][axis]),
+                        'objective': result['objective'][i],
+                        'settle_steps': result['settle_steps'][i],
+                        'outside_steps': result['outside_steps'][i],
+                        'hold_error': result['hold_error'][i],
+                        'overshoot': result['overshoot'][i],
+                    }
+
+    start_time = time.time()
+    with Pool(workers, initializer=_init_worker, initargs=(script_dir,)) as pool:
+        # Stage 1: the same coarse grid is applied to all axes at once
+        candidates = [{axis: g for axis in AXES} for g in coarse_grid(coarse_points)]
+        print(f"[TUNE] Coarse stage: {len(candidates)} candidates on {workers} workers")
+        update_best(pool.map(_evaluate, [(c, targets, tolerance, max_steps) for c in candidates]))
+
+        # Stage 2: refine each axis around its own best gains
+        span = 4.0
+        for r in range(rounds):
+            grids = [fine_grid(best[axis]['gains'], span, fine_points) for axis in AXES]
+            # clipping can shorten a grid; its axis repeats its best gains for the extra candidates
+            size = max(len(grid) for grid in grids)
+            grids = [grid + [tuple(best[axis]['gains'])] * (size - len(grid)) for grid, axis in zip(grids, AXES)]
+            candidates = [dict(zip(AXES, g)) for g in zip(*grids)]
+            print(f"[TUNE] Refinement round {r + 1}: {len(candidates)} candidates, span x{span:.2f}")
+            update_best(pool.map(_evaluate, [(c, targets, tolerance, max_steps) for c in candidates]))
+            span = span ** 0.5
+
+    elapsed = time.time() - start_time
+
+    gains_file = {axis: [float(g) for g in best[axis]['gains']] for axis in AXES}
+    gains_file['meta'] = {
+        'tolerance': tolerance,
+        'max_steps': max_steps,
+        'hold_steps': HOLD_STEPS,
+        'n_targets': n_targets,
+        'seed': seed,
+        'settle_steps': {axis: best[axis]['settle_steps'] for axis in AXES},
+        'outside_steps': {axis: best[axis]['outside_steps'] for axis in AXES},
+        'hold_error': {axis: best[axis]['hold_error'] for axis in AXES},
+        'overshoot': {axis: best[axis]['overshoot'] for axis in AXES},
+        'tuning_time_s': round(elapsed, 1),
+    }
+    with open(output_path, "w") as f:
+        json.dump(gains_file, f, indent=2)
+
+    print("\n=== Tuned Gains ===")
+    for axis in AXES:
+        kp, ki, kd = best[axis]['gains']
+        print(f"  {axis}: Kp={kp:.4g} Ki={ki:.4g} Kd={kd:.4g} | "
+              f"settle={best[axis]['settle_steps']:.1f} steps, outside after entry={best[axis]['outside_steps']:.1f} "
+              f"steps, hold error={best[axis]['hold_error'] * 1000:.2f} mm, overshoot={best[axis]['overshoot'] * 1000:.2f} mm")
+    print(f"Saved to {output_path} ({elapsed:.1f}s)")
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune per-axis PID gains for the OT-2 pipette.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--targets", type=int, default=6)
+    parser.add_argument("--coarse-points", type=int, default=5)
+    parser.add_argument("--fine-points", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--max-steps", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=GAINS_PATH)
+    args = parser.parse_args()
+
+    tune(workers=args.workers, n_targets=args.targets, coarse_points=args.coarse_points,
+         fine_points=args.fine_points, rounds=args.rounds, tolerance=args.tolerance,
+         max_steps=args.max_steps, seed=args.seed, output_path=args.output)
@@ -0,0 +1,278 @@
+# benchmark_cv.py
+# End-to-end benchmark of the root pipeline (root_pipeline.process_plate): plate image
+# -> crop -> prediction -> closing -> root selection -> skeleton -> tips and lengths.
+#
+# The plates come from synthetic_plates.py (procedural 4112x3006 plates, or the task 4
+# test_patched_dataset plate) and are cached in --data as png + ground truth. Every
+# (dataset size, workers) combination is run --repeats times after a warm-up:
+#   throughput   plates per second over the whole dataset (image loading included);
+#                workers > 1 process the plates in a multiprocessing Pool (one
+#                OpenCV thread per worker)
+#   latency      per-plate wall time percentiles
+#   stages       mean time and peak/transient RSS of every stage (profiling.Profiler)
+#   memory       peak RSS of the worker processes
+#   accuracy     detected tips against the ground truth tips (recall, precision, error)
+#
+# The JSON report holds the git commit, so runs of different commits can be compared:
+#
+#   python benchmark_cv.py
+#   python benchmark_cv.py --sizes 8 32 --workers 1 2 4 --repeats 3 --output before.json
+#   python benchmark_cv.py --source dataset --model unet.h5
+#   python benchmark_cv.py --compare before.json after.json
+
+import os
+import json
+import time
+import argparse
+import platform
+import datetime
+import subprocess
+import multiprocessing as mp
+import numpy as np
+import cv2
+from profiling import Profiler
+from skeleton import set_num_threads, BACKENDS
+from root_pipeline import TIP_METHODS
+from synthetic_plates import generate, load_truth
+
+# Set the working directory to the script's directory
+script_dir = os.path.dirname(os.path.abspath(__file__))
+os.chdir(script_dir)
+
+TIP_TOLERANCE = 25  # px, a detected tip within this distance of a true tip is a match
+
+_model = None
+_closing = "auto"
+_skeleton = "skimage"
+_tips = "graph"
+
+
+def _load_model(model_path):
+    if model_path:
+        from keras.models import load_model
+        from plate_inference import uint8_model
+        return uint8_model(load_model(model_path, custom_objects={"f1": lambda y_true, y_pred: y_pred}))
+    from plate_inference import ThresholdModel
+    return ThresholdModel()
+
+
+def _init_worker(model_path, warmup_path, closing_method="auto", skeleton_backend="skimage", tip_method="graph",
+                 single_thread=False):
+    global _model, _closing, _skeleton, _tips
+    _closing = closing_method
+    _skeleton = skeleton_backend
+    _tips = tip_method
+    if single_thread:
+        # one OpenCV / skeleton thread per worker process, the pool provides the parallelism
+        cv2.setNumThreads(1)
+        set_num_threads(1)
+    _model = _load_model(model_path)
+    if warmup_path:
+        _run_plate(warmup_path)
+
+
+def _run_plate(path):
+    # one plate in this process; returns what the parent needs (no masks)
+    from root_pipeline import process_plate
+    profiler = Profiler()
+    start = time.perf_counter()
+    with profiler.stage("load"):
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    result = process_plate(image, _model, profiler, name=path, closing_method=_closing,
+                           skeleton_backend=_skeleton, tip_method=_tips)
+    seconds = time.perf_counter() - start
+    oy, ox = result["origin"]
+    tips = [(int(y) + oy, int(x) + ox) for y, x in result["tips"]]
+    # the stages reset the peak RSS, so the peak of the process is the highest stage peak
+    return {"path": path, "seconds": seconds, "records": profiler.records, "counters": profiler.plates[0]["counters"],
+            "tips": tips, "peak_rss_mb": max(r["peak_rss_mb"] for r in profiler.records), "pid": os.getpid()}
+
+
+def match_tips(detected, truth, tolerance=TIP_TOLERANCE):
+    """
+    Greedy one-to-one matching of detected tips to true tips, closest pairs first.
+
+    Returns:
+        dict: matched, detected, truth, recall, precision, mean_error_px
+    """
+    pairs = sorted((np.hypot(d[0] - t[0], d[1] - t[1]), i, j)
+                   for i, d in enumerate(detected) for j, t in enumerate(truth))
+    used_d, used_t, errors = set(), set(), []
+    for distance, i, j in pairs:
+        if distance > tolerance:
+            break
+        if i in used_d or j in used_t:
+            continue
+        used_d.add(i)
+        used_t.add(j)
+        errors.append(distance)
+    return {"matched": len(errors), "detected": len(detected), "truth": len(truth),
+            "recall": len(errors) / len(truth) if truth else 1.0,
+            "precision": len(errors) / len(detected) if detected else 1.0,
+            "mean_error_px": float(np.mean(errors)) if errors else None}
+
+
+def _stats(values):
+    values = np.asarray(values, dtype=float)
+    return {"mean": float(values.mean()), "std": float(values.std()), "min": float(values.min()),
+            "max": float(values.max()), "repeats": values.tolist()}
+
+
+def _percentiles(values):
+    values = np.asarray(values, dtype=float)
+    return {f"p{q}": float(np.percentile(values, q)) for q in (50, 90, 99)} | {"mean": float(values.mean())}
+
+
+def bench_config(paths, workers, model_path, repeats, closing_method="auto", skeleton_backend="skimage",
+                 tip_method="graph"):
+    """Run the dataset `repeats` times with `workers` processes."""
+    durations, results = [], []
+    if workers == 1:
+        _init_worker(model_path, paths[0], closing_method, skeleton_backend, tip_method)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run = [_run_plate(path) for path in paths]
+            durations.append(time.perf_counter() - start)
+            results.extend(run)
+    else:
+        # the pool (and model) is created once per configuration, outside the timing
+        initargs = (model_path, paths[0], closing_method, skeleton_backend, tip_method, True)
+        with mp.get_context("spawn").Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            for _ in range(repeats):
+                start = time.perf_counter()
+                run = pool.map(_run_plate, paths, chunksize=1)
+                durations.append(time.perf_counter() - start)
+                results.extend(run)
+
+    merged = Profiler()
+    for result in results:
+        merged.records.extend(result["records"])
+    truth = {path: load_truth(path)[1] for path in set(paths)}
+    accuracy = [match_tips(r["tips"], truth[r["path"]]) for r in results[:len(paths)]]
+    counters = {}
+    for result in results[:len(paths)]:
+        for name, value in result["counters"].items():
+            counters.setdefault(name, []).append(value)
+    peaks = {}
+    for result in results:
+        peaks[result["pid"]] = max(peaks.get(result["pid"], 0), result["peak_rss_mb"])
+    matched = sum(a["matched"] for a in accuracy)
+    errors = [a["mean_error_px"] * a["matched"] for a in accuracy if a["matched"]]
+    return {
+        "plates": len(paths),
+        "workers": workers,
+        "seconds": _stats(durations),
+        "plates_per_s": len(paths) / float(np.mean(durations)),
+        "latency_s": _percentiles([r["seconds"] for r in results]),
+        "stages": merged.stages(),
+        "counters": {name: float(np.mean(v)) for name, v in counters.items()},
+        "peak_rss_mb": {"max": max(peaks.values()), "sum_workers": sum(peaks.values())},
+        "accuracy": {
+            "recall": matched / max(1, sum(a["truth"] for a in accuracy)),
+            "precision": matched / max(1, sum(a["detected"] for a in accuracy)),
+            "mean_error_px": sum(errors) / matched if matched else None,
+        },
+    }
+
+
+def git_commit():
+    """Short hash of HEAD (with "-dirty" for uncommitted changes), None outside a git checkout."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no", "."],
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine_info():
+    return {
+        "hostname": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "available_cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def print_results(results):
+    print(f"\n{'plates':>6} {'workers':>7} {'plates/s':>9} {'p50 s':>7} {'p90 s':>7} {'peak MB':>8} {'recall':>7}")
+    for row in results:
+        print(f"{row['plates']:>6} {row['workers']:>7} {row['plates_per_s']:>9.2f} {row['latency_s']['p50']:>7.3f} "
+              f"{row['latency_s']['p90']:>7.3f} {row['peak_rss_mb']['max']:>8.0f} {row['accuracy']['recall']:>7.2f}")
+    stages = results[-1]["stages"]
+    print(f"\n{'stage':<14}{'mean ms':>10}{'share':>8}{'trans MB':>10}   ({results[-1]['plates']} plates, "
+          f"{results[-1]['workers']} workers)")
+    for name, s in stages.items():
+        print(f"{name:<14}{s['mean_s'] * 1e3:>10.1f}{s['share']:>8.1%}{s['transient_mb']:>10.1f}")
+
+
+def compare(old_path, new_path):
+    """Print the throughput and stage time changes between two reports."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"[COMPARE] {old.get('commit')} ({old_path}) -> {new.get('commit')} ({new_path})")
+    old_rows = {(r["plates"], r["workers"]): r for r in old["results"]}
+    print(f"\n{'plates':>6} {'workers':>7} {'old plates/s':>13} {'new plates/s':>13} {'change':>8}")
+    for row in new["results"]:
+        key = (row["plates"], row["workers"])
+        if key in old_rows:
+            before, after = old_rows[key]["plates_per_s"], row["plates_per_s"]
+            print(f"{key[0]:>6} {key[1]:>7} {before:>13.2f} {after:>13.2f} {after / before - 1:>+8.1%}")
+    old_stages, new_stages = old["results"][-1]["stages"], new["results"][-1]["stages"]
+    print(f"\n{'stage':<14}{'old ms':>10}{'new ms':>10}{'change':>9}")
+    for name in new_stages:
+        if name in old_stages:
+            before, after = old_stages[name]["mean_s"] * 1e3, new_stages[name]["mean_s"] * 1e3
+            print(f"{name:<14}{before:>10.1f}{after:>10.1f}{after / before - 1:>+9.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the root pipeline on generated plates.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 16], help="plates per dataset")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--source", choices=["synthetic", "dataset"], default="synthetic")
+    parser.add_argument("--roots", type=int, default=5, help="seedlings per synthetic plate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", default="bench_plates", help="plate cache directory")
+    parser.add_argument("--model", default=None, help="Keras .h5 model (default: stand-in threshold model)")
+    parser.add_argument("--closing", choices=["auto", "opencv", "bits", "downsample"], default="auto",
+                        help="closing method (morphology.closing)")
+    parser.add_argument("--skeleton", choices=BACKENDS, default="skimage", help="thinning backend (skeleton.py)")
+    parser.add_argument("--tips", choices=TIP_METHODS, default="graph", help="tip detection (root_pipeline.py)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default=None, help="JSON report (default: benchmark_cv_<commit>_<time>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        raise SystemExit
+
+    commit = git_commit()
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "machine": machine_info(),
+        "settings": vars(args),
+        "results": [],
+    }
+    for size in args.sizes:
+        paths = generate(args.data, size, args.seed, args.source, args.roots, raw=bool(args.model))
+        for workers in args.workers:
+            print(f"[BENCH] {size} plates, {workers} workers")
+            report["results"].append(bench_config(paths, workers, args.model, args.repeats, args.closing,
+                                                    args.skeleton, args.tips))
+    print_results(report["results"])
+
+    output = args.output or "benchmark_cv_{}_{}.json".format(commit or "nogit", datetime.datetime.now().strftime("%Y%m%d_%H%M%S"))
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to {output}")
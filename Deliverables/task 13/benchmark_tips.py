@@ -0,0 +1,91 @@
+# benchmark_tips.py
+# Speed and agreement of the tip detection methods (root_pipeline.TIP_METHODS) on the
+# benchmark plates of synthetic_plates.py.
+#
+# Every plate is run through root_pipeline.process_plate once; the tip methods are then
+# timed on its labeled mask and skeleton:
+#   graph (full scan)   extract_bottom_tips without the select_roots boxes (previous pipeline)
+#   graph               extract_bottom_tips on the box crops
+#   endpoints           endpoint_tips, 3x3 neighbour count, no graph
+#   geodesic            endpoint_tips with the connectivity check from the top node
+# Agreement is measured against "graph" (tips within TIP_TOLERANCE px of a graph tip),
+# accuracy against the ground truth tips of the plates.
+#
+#   python benchmark_tips.py
+#   python benchmark_tips.py --n 32 --roots 8 --output tips.json
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+import cv2
+from benchmark_cv import match_tips, TIP_TOLERANCE, _load_model
+from root_pipeline import process_plate, extract_bottom_tips, detect_tips, box_slices, TIP_METHODS
+from synthetic_plates import generate, load_truth
+
+# Set the working directory to the script's directory
+script_dir = os.path.dirname(os.path.abspath(__file__))
+os.chdir(script_dir)
+
+
+def _timed(function, repeats):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def bench_plate(labeled_mask, skeleton, slices, repeats):
+    """Mean seconds and tips of every method on one plate."""
+    runs = {"graph (full scan)": _timed(lambda: extract_bottom_tips(labeled_mask, skeleton), repeats)}
+    for method in TIP_METHODS:
+        runs[method] = _timed(lambda: detect_tips(labeled_mask, skeleton, method, slices), repeats)
+    return runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tip detection methods: speed and agreement.")
+    parser.add_argument("--n", type=int, default=16, help="plates")
+    parser.add_argument("--roots", type=int, default=5, help="seedlings per synthetic plate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", default="bench_plates", help="plate cache directory")
+    parser.add_argument("--model", default=None, help="Keras .h5 model (default: stand-in threshold model)")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", default=None, help="JSON report")
+    args = parser.parse_args()
+
+    model = _load_model(args.model)
+    paths = generate(args.data, args.n, args.seed, "synthetic", args.roots, raw=bool(args.model))
+    seconds, agreement, accuracy = {}, {}, {}
+    for path in paths:
+        result = process_plate(cv2.imread(path, cv2.IMREAD_GRAYSCALE), model)
+        oy, ox = result["origin"]
+        truth = load_truth(path)[1]
+        runs = bench_plate(result["labeled_mask"], result["skeleton"], box_slices(result["boxes"]), args.repeats)
+        for name, (duration, tips) in runs.items():
+            seconds.setdefault(name, []).append(duration)
+            agreement.setdefault(name, []).append(match_tips(tips, runs["graph"][1]))
+            accuracy.setdefault(name, []).append(match_tips([(y + oy, x + ox) for y, x in tips], truth))
+
+    report = {}
+    print(f"\n{'method':<20}{'mean ms':>9}{'speedup':>9}{'agree':>8}{'mean px':>9}{'recall':>8}{'precision':>10}")
+    for name in seconds:
+        matched = sum(a["matched"] for a in agreement[name])
+        errors = [a["mean_error_px"] * a["matched"] for a in agreement[name] if a["matched"]]
+        report[name] = {
+            "mean_ms": float(np.mean(seconds[name]) * 1e3),
+            "agreement": matched / max(1, sum(max(a["detected"], a["truth"]) for a in agreement[name])),
+            "agreement_error_px": sum(errors) / matched if matched else None,
+            "recall": sum(a["matched"] for a in accuracy[name]) / max(1, sum(a["truth"] for a in accuracy[name])),
+            "precision": sum(a["matched"] for a in accuracy[name]) / max(1, sum(a["detected"] for a in accuracy[name])),
+        }
+        row = report[name]
+        print(f"{name:<20}{row['mean_ms']:>9.2f}{report['graph (full scan)']['mean_ms'] / row['mean_ms']:>9.1f}"
+              f"{row['agreement']:>8.1%}{row['agreement_error_px'] or 0:>9.2f}{row['recall']:>8.1%}{row['precision']:>10.1%}")
+    print(f"\n[TIPS] {len(paths)} plates, agreement = tips within {TIP_TOLERANCE} px of the graph tips")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "methods": report}, f, indent=2)
+        print(f"[TIPS] report saved to {args.output}")
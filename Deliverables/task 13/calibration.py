@@ -0,0 +1,217 @@
+# calibration.py
+# Plate pixel -> robot XYZ calibration, fitted once per plate texture and stored in
+# plate_calibration.json.
+#
+# The notebook converted the root tips one by one with a scalar px -> m factor
+# (150 mm over the padded plate height) and a hard-coded plate origin, so any
+# rotation, skew or perspective of the plate under the camera ended up in the drop
+# position. A PlateCalibration holds a 4x3 projective matrix M mapping (y, x, 1) of
+# the plate pixels to homogeneous robot coordinates (X, Y, Z, w):
+#   affine       last row (0, 0, 1), least-squares fit from 3 or more reference points
+#   homography   full matrix (perspective of the camera), DLT fit from 4 or more points
+# from_scale() gives the old notebook mapping (the fallback for plates without a
+# calibration). to_robot() converts an (n, 2) array of tips in one call, to_pixels()
+# maps pipette positions back onto the plate (drop verification), and
+# path_planner.plan_tips() plans directly from pixel tips.
+#
+#   python calibration.py fit plate_01 points.json --model homography
+#   python calibration.py list
+#
+# points.json holds the reference points: [{"px": [y, x], "robot": [X, Y, Z]}, ...]
+
+import os
+import json
+import argparse
+import datetime
+import numpy as np
+
+CALIBRATION_VERSION = 1
+CALIBRATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plate_calibration.json")
+MODELS = ("affine", "homography")
+
+# Old notebook mapping: plate side in mm and robot position of plate pixel (0, 0)
+PLATE_SIZE_MM = 150
+PLATE_ORIGIN_ROBOT = (0.10775, 0.088 - 0.026, 0.057)
+
+
+def _homogeneous(points):
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    return np.column_stack([points, np.ones(len(points))])
+
+
+def _normalisation(points):
+    # similarity moving the points to their centroid with mean distance sqrt(2) (Hartley)
+    centroid = points.mean(axis=0)
+    spread = np.linalg.norm(points - centroid, axis=1).mean()
+    scale = np.sqrt(2) / spread if spread > 0 else 1.0
+    transform = np.eye(points.shape[1] + 1)
+    transform[:-1, :-1] *= scale
+    transform[:-1, -1] = -scale * centroid
+    return transform
+
+
+class PlateCalibration:
+    def __init__(self, matrix, model="affine", texture=None, residual_m=None):
+        """
+        :param matrix: (4, 3) matrix from (y, x, 1) plate pixels to homogeneous (X, Y, Z, w)
+        :param model: "affine" or "homography"
+        :param texture: plate texture the calibration belongs to
+        :param residual_m: RMS error at the reference points (meters), None when not fitted
+        """
+        self.matrix = np.asarray(matrix, dtype=float).reshape(4, 3)
+        self.model = model
+        self.texture = texture
+        self.residual_m = residual_m
+
+    def __repr__(self):
+        residual = "" if self.residual_m is None else f", residual {self.residual_m * 1e3:.3f} mm"
+        return f"PlateCalibration({self.model}, texture={self.texture!r}{residual})"
+
+    @classmethod
+    def from_scale(cls, plate_size_px, plate_size_mm=PLATE_SIZE_MM, origin=PLATE_ORIGIN_ROBOT, texture=None):
+        """
+        The old notebook conversion: pixel rows along robot X, columns along robot Y,
+        plate_size_mm over plate_size_px, constant Z.
+        """
+        factor = plate_size_mm / plate_size_px / 1000  # mm -> m
+        matrix = [[factor, 0, origin[0]],
+                  [0, factor, origin[1]],
+                  [0, 0, origin[2]],
+                  [0, 0, 1]]
+        return cls(matrix, "affine", texture)
+
+    @classmethod
+    def fit(cls, pixels, robot, model="affine", texture=None):
+        """
+        Fit the calibration to reference points.
+
+        Parameters:
+            pixels (array-like): (n, 2) plate pixels (y, x).
+            robot (array-like): (n, 3) robot positions of these pixels.
+            model (str): "affine" (n >= 3) or "homography" (n >= 4).
+
+        Returns:
+            PlateCalibration: with residual_m, the RMS error at the reference points.
+        """
+        pixels = np.asarray(pixels, dtype=float).reshape(-1, 2)
+        robot = np.asarray(robot, dtype=float).reshape(-1, 3)
+        if len(pixels) != len(robot):
+            raise ValueError(f"{len(pixels)} pixels and {len(robot)} robot positions")
+        needed = {"affine": 3, "homography": 4}.get(model)
+        if needed is None:
+            raise ValueError(f"unknown calibration model {model!r}, expected one of {MODELS}")
+        if len(pixels) < needed:
+            raise ValueError(f"model={model!r} needs at least {needed} reference points, got {len(pixels)}")
+
+        # normalised coordinates keep the fit well conditioned (pixels ~1e3, robot ~1e-1)
+        t_px, t_robot = _normalisation(pixels), _normalisation(robot)
+        p = _homogeneous(pixels) @ t_px.T
+        r = (np.column_stack([robot, np.ones(len(robot))]) @ t_robot.T)[:, :3]
+        if model == "affine":
+            solution = np.linalg.lstsq(p, r, rcond=None)[0].T
+            normalised = np.vstack([solution, [0, 0, 1]])
+        else:
+            # DLT: m_i . p - r_i (m_w . p) = 0 for i = X, Y, Z; M is the null vector
+            rows = np.zeros((3 * len(p), 12))
+            for i in range(3):
+                rows[i::3, 3 * i:3 * i + 3] = p
+                rows[i::3, 9:12] = -r[:, i:i + 1] * p
+            normalised = np.linalg.svd(rows)[2][-1].reshape(4, 3)
+        matrix = np.linalg.inv(t_robot) @ normalised @ t_px
+        matrix /= matrix[3, 2]  # w = 1 at pixel (0, 0); also fixes the sign of the DLT solution
+
+        calibration = cls(matrix, model, texture)
+        error = calibration.to_robot(pixels) - robot
+        calibration.residual_m = float(np.sqrt(np.mean(np.sum(error ** 2, axis=1))))
+        return calibration
+
+    def to_robot(self, tips):
+        """
+        Robot positions of plate pixels.
+
+        Parameters:
+            tips (array-like): (n, 2) plate pixels (y, x), e.g. root_pipeline tips.
+
+        Returns:
+            np.ndarray: (n, 3) robot XYZ.
+        """
+        projected = _homogeneous(tips) @ self.matrix.T
+        return projected[:, :3] / projected[:, 3:]
+
+    def to_pixels(self, positions):
+        """
+        Plate pixels (y, x) under robot positions (only X and Y are used), e.g. where a drop landed.
+
+        Returns:
+            np.ndarray: (n, 2) plate pixels.
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+        plane = self.matrix[[0, 1, 3]]  # (y, x, 1) -> (X, Y, w) of the plate plane
+        pixels = _homogeneous(positions[:, :2]) @ np.linalg.inv(plane).T
+        return pixels[:, :2] / pixels[:, 2:]
+
+    def to_dict(self):
+        return {"model": self.model, "matrix": self.matrix.tolist(), "residual_m": self.residual_m}
+
+    @classmethod
+    def from_dict(cls, data, texture=None):
+        return cls(data["matrix"], data["model"], texture, data.get("residual_m"))
+
+    def save(self, path=CALIBRATION_PATH):
+        """Store the calibration under its texture in the calibration file (other textures are kept)."""
+        if self.texture is None:
+            raise ValueError("a calibration needs a texture to be saved")
+        data = _read(path) if os.path.exists(path) else {"version": CALIBRATION_VERSION, "plates": {}}
+        data["plates"][self.texture] = dict(self.to_dict(), created=datetime.datetime.now().isoformat(timespec="seconds"))
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+
+
+def _read(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    if data.get("version") != CALIBRATION_VERSION:
+        raise ValueError(f"{path} has calibration version {data.get('version')}, "
+                         f"expected {CALIBRATION_VERSION}; re-fit with calibration.py")
+    return data
+
+
+def load_calibration(texture, path=CALIBRATION_PATH):
+    """
+    Load the calibration of a plate texture.
+
+    :param texture: plate texture name (the notebook's plate_name)
+    :param path: calibration file
+    :return: PlateCalibration, or None when the texture has not been calibrated
+    """
+    if not os.path.exists(path):
+        return None
+    entry = _read(path)["plates"].get(texture)
+    return None if entry is None else PlateCalibration.from_dict(entry, texture)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit and list plate pixel -> robot calibrations.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fit = commands.add_parser("fit", help="fit a texture's calibration from reference points")
+    fit.add_argument("texture")
+    fit.add_argument("points", help='JSON list of {"px": [y, x], "robot": [X, Y, Z]}')
+    fit.add_argument("--model", choices=MODELS, default="affine")
+    fit.add_argument("--output", default=CALIBRATION_PATH)
+    listing = commands.add_parser("list", help="show the stored calibrations")
+    listing.add_argument("--path", default=CALIBRATION_PATH)
+    args = parser.parse_args()
+
+    if args.command == "fit":
+        with open(args.points) as f:
+            points = json.load(f)
+        calibration = PlateCalibration.fit([p["px"] for p in points], [p["robot"] for p in points], args.model,
+                                           args.texture)
+        calibration.save(args.output)
+        print(f"[CALIBRATION] {calibration} from {len(points)} points, saved to {args.output}")
+    else:
+        plates = _read(args.path)["plates"] if os.path.exists(args.path) else {}
+        for texture, entry in plates.items():
+            print(f"[CALIBRATION] {PlateCalibration.from_dict(entry, texture)} ({entry.get('created')})")
+        if not plates:
+            print(f"[CALIBRATION] no calibrations in {args.path}")
@@ -0,0 +1,248 @@
+# envelope.py
+# Working-envelope calibration of the OT-2 pipette, stored as a versioned artifact.
+#
+# `python envelope.py` measures the envelope once on headless simulations (one
+# process per corner) and writes envelope.json. Everything that needs bounds
+# (OT2Env goal sampling, PID_runner, path_planner) calls load_envelope() instead of
+# re-running the corner exploration of task 9 or hard-coding its own numbers.
+#
+# Optionally (--grid N) an N x N x N grid of targets is driven to, recording whether
+# each one was reached and how many control steps it took.
+
+import os
+import json
+import time
+import argparse
+import itertools
+import datetime
+import numpy as np
+from multiprocessing import Pool
+
+ENVELOPE_VERSION = 1
+ENVELOPE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "envelope.json")
+README_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "README.md")
+
+# Used when no envelope.json is present (values of the first calibration run)
+DEFAULT_ENVELOPE = {
+    "version": ENVELOPE_VERSION,
+    "low": [-0.187, -0.17, 0.17],
+    "high": [0.253, 0.219, 0.289],
+}
+
+# The limits are rounded inward to this resolution (m): the corner runs are not
+# deterministic to 0.1 mm, and the rounded box stays the same between calibrations
+ENVELOPE_RESOLUTION = 0.001
+
+# Corner exploration settings
+CORNER_SPEED = 0.9
+MAX_CORNER_STEPS = 400
+STALL_STEPS = 10  # the joint counts as stopped after this many steps without movement
+STALL_DISTANCE = 1e-6
+
+# Grid reachability settings
+GRID_TOLERANCE = 0.001
+GRID_MAX_STEPS = 500
+GRID_GAIN = 10.0
+
+_worker_sim = None
+
+
+def load_envelope(path=ENVELOPE_PATH):
+    """
+    Load the working envelope.
+
+    :param path: Path of the envelope artifact.
+    :return: dict with "low" and "high" as numpy arrays (plus "grid" when calibrated with one).
+    """
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        if data.get("version") != ENVELOPE_VERSION:
+            raise ValueError(f"{path} has envelope version {data.get('version')}, "
+                             f"expected {ENVELOPE_VERSION}; re-run envelope.py")
+    else:
+        data = dict(DEFAULT_ENVELOPE)
+    data["low"] = np.array(data["low"], dtype=float)
+    data["high"] = np.array(data["high"], dtype=float)
+    return data
+
+
+def contains(envelope, points, check_z=True):
+    """
+    Boolean mask of points (n, 3) that lie inside the envelope.
+
+    :param check_z: If False only x and y are checked (targets that are only approached in x,y).
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    axes = 3 if check_z else 2
+    inside = (points >= envelope["low"]) & (points <= envelope["high"])
+    return np.all(inside[:, :axes], axis=1)
+
+
+def sample_goals(envelope, n=1, margin=0.0, rng=np.random):
+    """
+    Draw goals uniformly inside the envelope.
+
+    :param margin: Distance kept from every face of the envelope (meters).
+    :param rng: numpy RandomState/Generator (or the np.random module).
+    :return: (n, 3) array of goals.
+    """
+    low = envelope["low"] + margin
+    high = envelope["high"] - margin
+    goals = rng.uniform(low, high, size=(n, 3))
+
+    grid = envelope.get("grid")
+    if grid is not None:
+        # redraw goals whose nearest grid point was not reachable
+        points = np.array(grid["points"])
+        reached = np.array(grid["reached"], dtype=bool)
+        for _ in range(100):
+            nearest = np.argmin(np.linalg.norm(goals[:, None, :] - points[None], axis=-1), axis=1)
+            bad = ~reached[nearest]
+            if not bad.any():
+                break
+            goals[bad] = rng.uniform(low, high, size=(int(bad.sum()), 3))
+    return goals
+
+
+def _init_worker(script_dir):
+    global _worker_sim
+    # Simulation loads textures and URDFs relative to the working directory
+    os.chdir(script_dir)
+    from sim_class import Simulation
+    _worker_sim = Simulation(num_agents=1, render=False)
+
+
+def home_robot(sim):
+    """Put every joint back at zero, or at its nearest limit when zero is outside the limits."""
+    import pybullet as p
+    for robotId in sim.robotIds:
+        for joint in range(3):
+            # zero is below the lower limit of the z joint (0.05); start inside the limits,
+            # otherwise the downward corners stall at the unreachable reset height
+            lower, upper = p.getJointInfo(robotId, joint)[8:10]
+            p.resetJointState(robotId, joint, targetValue=min(max(0.0, lower), upper), targetVelocity=0)
+
+
+def _pipette_position(sim):
+    states = sim.get_states()
+    return np.array(states[f'robotId_{sim.robotIds[0]}']['pipette_position'], dtype=float)
+
+
+def explore_corner(direction):
+    """Drive from the home position in `direction` (signs per axis) until every joint stops."""
+    sim = _worker_sim
+    home_robot(sim)
+    action = [CORNER_SPEED * d for d in direction] + [0]
+    position = _pipette_position(sim)
+    still = 0
+    for _ in range(MAX_CORNER_STEPS):
+        sim.run([action])
+        new_position = _pipette_position(sim)
+        still = still + 1 if np.max(np.abs(new_position - position)) < STALL_DISTANCE else 0
+        position = new_position
+        if still >= STALL_STEPS:
+            break
+    return position.tolist()
+
+
+def reach_target(target):
+    """Drive to target with a proportional controller; returns (reached, steps)."""
+    sim = _worker_sim
+    home_robot(sim)
+    target = np.asarray(target, dtype=float)
+    for step in range(GRID_MAX_STEPS):
+        error = target - _pipette_position(sim)
+        if np.all(np.abs(error) < GRID_TOLERANCE):
+            return True, step
+        sim.run([list(GRID_GAIN * error) + [0]])
+    return False, GRID_MAX_STEPS
+
+
+def calibrate(workers=8, grid_points=0, output_path=ENVELOPE_PATH):
+    """
+    Measure the working envelope on a pool of headless simulations and save it.
+
+    :param workers: Number of worker processes.
+    :param grid_points: Grid points per axis for the reachability grid (0 = no grid).
+    :param output_path: Where the artifact is written.
+    :return: The envelope dict that was saved.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    directions = list(itertools.product((-1, 1), repeat=3))
+    start_time = time.time()
+
+    with Pool(workers, initializer=_init_worker, initargs=(script_dir,)) as pool:
+        corners = np.array(pool.map(explore_corner, directions))
+        # inner box: every corner reaches at least this far, so all points of the box are reachable
+        signs = np.array(directions)
+        low = np.array([corners[signs[:, a] < 0, a].max() for a in range(3)])
+        high = np.array([corners[signs[:, a] > 0, a].min() for a in range(3)])
+        # round inward (the small tolerance keeps values already on the grid, e.g. -0.187, in place)
+        low = np.ceil(low / ENVELOPE_RESOLUTION - 1e-6) * ENVELOPE_RESOLUTION
+        high = np.floor(high / ENVELOPE_RESOLUTION + 1e-6) * ENVELOPE_RESOLUTION
+        print(f"[ENVELOPE] low={low.round(4)} high={high.round(4)}")
+
+        grid = None
+        if grid_points > 0:
+            # keep the grid slightly inside the bounds so every target is strictly interior
+            axes = [np.linspace(l + GRID_TOLERANCE, h - GRID_TOLERANCE, grid_points) for l, h in zip(low, high)]
+            points = np.array(list(itertools.product(*axes)))
+            results = pool.map(reach_target, points.tolist())
+            grid = {
+                "points": points.round(5).tolist(),
+                "reached": [bool(r) for r, _ in results],
+                "steps": [int(s) for _, s in results],
+            }
+            print(f"[ENVELOPE] Grid: {sum(grid['reached'])}/{len(points)} targets reached")
+
+    envelope = {
+        "version": ENVELOPE_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "low": low.round(5).tolist(),
+        "high": high.round(5).tolist(),
+        "resolution": ENVELOPE_RESOLUTION,
+        "corners": corners.round(5).tolist(),
+    }
+    if grid is not None:
+        envelope["grid"] = grid
+
+    with open(output_path, "w") as f:
+        json.dump(envelope, f, indent=2)
+    print(f"[ENVELOPE] Saved to {output_path} ({time.time() - start_time:.1f}s)")
+    return envelope
+
+
+def write_readme_table(envelope, readme_path=README_PATH):
+    """Replace the 'Working Envelope of the Pipette' table in a README with the artifact values."""
+    table = "## Working Envelope of the Pipette\n\n"
+    table += "| Axis | Lower Limit | Upper Limit |\n"
+    table += "|------|-------------|-------------|\n"
+    for axis, l, h in zip("XYZ", envelope["low"], envelope["high"]):
+        table += f"| {axis}    | {l:<11.4f} | {h:<11.4f} |\n"
+    table += "\n"
+
+    content = open(readme_path).read() if os.path.exists(readme_path) else ""
+    if "## Working Envelope of the Pipette" in content:
+        before, _, after = content.partition("## Working Envelope of the Pipette")
+        section, sep, after = after.partition("\n---")
+        # keep any text of the section below the old table
+        notes = "\n".join(line for line in section.split("\n")[1:] if not line.startswith("|")).strip()
+        content = before + table + (notes + "\n\n" if notes else "") + sep.lstrip("\n") + after
+    else:
+        content = content + "\n\n" + table
+    with open(readme_path, "w") as f:
+        f.write(content)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the pipette working envelope once and store it.")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--grid", type=int, default=0, help="grid points per axis for the reachability grid")
+    parser.add_argument("--output", default=ENVELOPE_PATH)
+    parser.add_argument("--readme", action="store_true", help="also update the table in README.md")
+    args = parser.parse_args()
+
+    envelope = calibrate(workers=args.workers, grid_points=args.grid, output_path=args.output)
+    if args.readme:
+        write_readme_table(envelope)
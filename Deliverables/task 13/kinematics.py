@@ -0,0 +1,85 @@
+# kinematics.py
+# Forward and inverse kinematics of the OT-2 pipette for any number of robots at once.
+#
+# The gantry is three prismatic joints along the world axes (x and y point the
+# other way than the joint axes), and the robot base is fixed by a constraint.
+# So the pipette position is an affine function of the joint positions:
+#
+#   pipette = base + pipette_offset + sign * joints,   sign = (-1, -1, 1)
+#
+# Base positions and joint limits are read once when the helper is created;
+# after that only the joint states have to be queried from PyBullet.
+
+import numpy as np
+import pybullet as p
+
+JOINTS = [0, 1, 2]
+JOINT_SIGN = np.array([-1.0, -1.0, 1.0])
+
+
+class PipetteKinematics:
+    def __init__(self, robot_ids, pipette_offset):
+        """
+        Cache the base pose and joint limits of every robot.
+
+        :param robot_ids: PyBullet body ids of the robots.
+        :param pipette_offset: (x, y, z) offset of the pipette tip from the base at zero joint positions.
+        """
+        self.robot_ids = list(robot_ids)
+        self.pipette_offset = np.asarray(pipette_offset, dtype=float)
+        # (n_robots, 3) base positions; constant because the base is constrained in place
+        self.base_positions = np.array([p.getBasePositionAndOrientation(r)[0] for r in self.robot_ids],
+                                       dtype=float).reshape(-1, 3)
+        self.origin = self.base_positions + self.pipette_offset
+        # joint limits (lower, upper), shape (n_robots, 3) each
+        info = [[p.getJointInfo(r, j) for j in JOINTS] for r in self.robot_ids]
+        self.joint_lower = np.array([[i[8] for i in row] for row in info], dtype=float).reshape(-1, 3)
+        self.joint_upper = np.array([[i[9] for i in row] for row in info], dtype=float).reshape(-1, 3)
+
+    def index(self, robot_id):
+        """Row of robot_id in the cached arrays."""
+        return self.robot_ids.index(robot_id)
+
+    def forward(self, joint_positions, rows=slice(None)):
+        """
+        Map joint positions to pipette positions.
+
+        :param joint_positions: (n, 3) joint positions (or (3,) for a single robot).
+        :param rows: Which robots the joint positions belong to (default: all).
+        :return: Pipette positions with the same shape as joint_positions.
+        """
+        return self.origin[rows] + JOINT_SIGN * np.asarray(joint_positions, dtype=float)
+
+    def inverse(self, pipette_positions, rows=slice(None), clip=True):
+        """
+        Map pipette positions to the joint positions that reach them.
+
+        :param pipette_positions: (n, 3) pipette positions (or (3,) for a single robot).
+        :param rows: Which robots the positions belong to (default: all).
+        :param clip: Clip the result to the joint limits.
+        :return: Joint positions with the same shape as pipette_positions.
+        """
+        joints = JOINT_SIGN * (np.asarray(pipette_positions, dtype=float) - self.origin[rows])
+        if clip:
+            joints = np.clip(joints, self.joint_lower[rows], self.joint_upper[rows])
+        return joints
+
+    def envelope(self):
+        """(low, high) pipette positions reachable within the joint limits, per robot."""
+        a = self.forward(self.joint_lower)
+        b = self.forward(self.joint_upper)
+        return np.minimum(a, b), np.maximum(a, b)
+
+    def read_joint_states(self):
+        """
+        Query all robots' joint states.
+
+        :return: (raw states per robot, (n_robots, 3) joint positions)
+        """
+        raw = [p.getJointStates(r, JOINTS) for r in self.robot_ids]
+        positions = np.array([[s[0] for s in states] for states in raw], dtype=float).reshape(-1, 3)
+        return raw, positions
+
+    def pipette_positions(self):
+        """(n_robots, 3) current pipette positions."""
+        return self.forward(self.read_joint_states()[1])
@@ -0,0 +1,268 @@
+# morphology.py
+# Fast closing of binary masks with large structuring elements.
+#
+# The 32x32 ellipse closing of the predicted mask (root_pipeline.close_mask) was one
+# of the slowest postprocessing stages: for a non-rectangular kernel cv2.morphologyEx
+# visits every kernel pixel for every image pixel. Rectangles (the 31x31 and 15x15
+# squares of task 8 / task 6) are already decomposed into separable row and column
+# passes by OpenCV and stay on cv2.
+#
+# method="bits" computes the same result as cv2.morphologyEx exactly, for every kernel
+# made of one contiguous run per row (ellipse, rectangle, cross): the mask rows are
+# packed into uint64 words (64 pixels per word), the horizontal runs of the kernel are
+# built incrementally with word shifts, shared between kernel rows of the same run,
+# and the kernel rows are combined by slicing rows of the packed image.
+#
+# method="downsample" closes a max-pooled mask (factor x factor blocks) with the
+# scaled kernel. It is approximate, with a bounded error: the result contains the
+# mask and never extends beyond the mask dilated with the kernel's bounding box, so
+# a root pixel is never lost and nothing is added farther than half the kernel size
+# (in x and y) from a root. Boundaries come out thicker than with the exact closing;
+# use it where only the components and their boxes matter.
+#
+#   python morphology.py                      # task 4 test plate mask, 32x32 ellipse
+#   python morphology.py mask.png --sizes 32 51 --shapes ellipse rect
+
+import time
+import argparse
+import numpy as np
+import cv2
+
+SHAPES = {"ellipse": cv2.MORPH_ELLIPSE, "rect": cv2.MORPH_RECT, "cross": cv2.MORPH_CROSS}
+METHODS = ("auto", "opencv", "bits", "downsample")
+
+
+def structuring_element(kernel_size, shape="ellipse"):
+    """cv2 structuring element of (width, height) `kernel_size`."""
+    return cv2.getStructuringElement(SHAPES[shape], tuple(kernel_size))
+
+
+def _row_runs(kernel):
+    # (row, first column, last column) of every kernel row; rows must be one contiguous run
+    runs = []
+    for i, row in enumerate(kernel):
+        columns = np.flatnonzero(row)
+        if len(columns) == 0:
+            continue
+        if columns[-1] - columns[0] + 1 != len(columns):
+            raise ValueError("method='bits' needs one contiguous run of ones per kernel row")
+        runs.append((i, int(columns[0]), int(columns[-1])))
+    return runs
+
+
+# === Packed rows ===
+
+def pack_rows(mask):
+    """
+    Pack every row of a mask into little-endian uint64 words: bit j of word k is pixel 64k + j.
+
+    Returns:
+        np.ndarray: (rows, ceil(width / 64)) uint64
+    """
+    h, w = mask.shape
+    words = -(-w // 64)
+    padded = np.zeros((h, words * 64), dtype=np.uint8)
+    padded[:, :w] = mask != 0
+    return np.packbits(padded, axis=1, bitorder="little").view("<u8")
+
+
+def unpack_rows(packed, width):
+    """uint8 (0/1) mask from pack_rows()."""
+    return np.unpackbits(packed.view(np.uint8), axis=1, count=width, bitorder="little")
+
+
+def _read_columns(packed, offset, fill_word):
+    # out[:, x] = packed[:, x + offset] (in pixels); words that would read past the array get fill_word
+    if offset == 0:
+        return packed
+    whole, bits = divmod(offset, 64)  # floor division: offset -1 is word -1, bit 63
+    n = packed.shape[1]
+    lo, hi = max(0, -whole), min(n, n - whole - (1 if bits else 0))
+    if lo >= hi:
+        return np.full_like(packed, fill_word)
+    out = np.empty_like(packed)
+    out[:, :lo] = fill_word
+    out[:, hi:] = fill_word
+    if bits == 0:
+        out[:, lo:hi] = packed[:, lo + whole:hi + whole]
+        return out
+    target = out[:, lo:hi]
+    np.right_shift(packed[:, lo + whole:hi + whole], np.uint64(bits), out=target)
+    target |= packed[:, lo + whole + 1:hi + whole + 1] << np.uint64(64 - bits)
+    return out
+
+
+def _morph_bits(packed, width, kernel, anchor, dilate):
+    # cv2.dilate / cv2.erode semantics: dst(y, x) = max/min over the kernel ones (i, j) of
+    # src(y + i - ay, x + j - ax); pixels outside the image are ignored
+    ax, ay = anchor
+    combine = np.bitwise_or if dilate else np.bitwise_and
+    fill_word = np.uint64(0 if dilate else 0xFFFFFFFFFFFFFFFF)
+    # margin words on both sides, so the windows also exist for positions left and right of the image
+    margin = -(-kernel.shape[1] // 64) + 1
+    rows, words = packed.shape
+    padded = np.full((rows, words + 2 * margin), fill_word, dtype=packed.dtype)
+    padded[:, margin:margin + words] = packed
+    tail = width % 64
+    if not dilate and tail:
+        # bits beyond the width read as "outside"
+        padded[:, margin + words - 1] |= fill_word << np.uint64(tail)
+
+    runs = _row_runs(kernel)
+    # forward windows: window[L](x) = combine of src(x .. x + L - 1). Windows of powers of two
+    # by doubling; any other length from two overlapping power windows (OR/AND are idempotent)
+    lengths = {c1 - c0 + 1 for _, c0, c1 in runs}
+    powers = {1: padded}
+    while 2 * max(powers) <= max(lengths):
+        p = max(powers)
+        powers[2 * p] = combine(powers[p], _read_columns(powers[p], p, fill_word))
+    windows = dict(powers)
+    for length in lengths - set(powers):
+        p = max(q for q in powers if q <= length)
+        windows[length] = combine(powers[p], _read_columns(powers[p], length - p, fill_word))
+
+    # every kernel row adds its window, moved to the row's columns, from row y + dy
+    out = np.full_like(padded, fill_word)
+    shifted = {}
+    for i, c0, c1 in runs:
+        key = (c1 - c0 + 1, c0 - ax)
+        if key not in shifted:
+            shifted[key] = _read_columns(windows[key[0]], key[1], fill_word)
+        row = shifted[key]
+        dy = i - ay
+        if 0 <= dy < rows:
+            combine(out[:rows - dy], row[dy:], out=out[:rows - dy])
+        elif -rows < dy < 0:
+            combine(out[-dy:], row[:rows + dy], out=out[-dy:])
+    out = out[:, margin:margin + words]
+    if tail:
+        out[:, -1] &= (np.uint64(1) << np.uint64(tail)) - np.uint64(1)
+    return out
+
+
+def close_bits(mask, kernel, anchor=None):
+    """
+    Binary closing with the packed-row engine; equal to cv2.morphologyEx(mask, MORPH_CLOSE, kernel) > 0.
+
+    Parameters:
+        mask (np.ndarray): 2D mask, nonzero = foreground.
+        kernel (np.ndarray): Structuring element with one contiguous run of ones per row.
+        anchor (tuple): (x, y) anchor, default the kernel centre as in OpenCV.
+
+    Returns:
+        np.ndarray: uint8 (0/1) closed mask.
+    """
+    kh, kw = kernel.shape
+    anchor = anchor or (kw // 2, kh // 2)
+    width = mask.shape[1]
+    dilated = _morph_bits(pack_rows(mask), width, kernel, anchor, dilate=True)
+    closed = _morph_bits(dilated, width, kernel, anchor, dilate=False)
+    return unpack_rows(closed, width)
+
+
+def close_downsample(mask, kernel_size, shape="ellipse", factor=4):
+    """
+    Approximate closing on a max-pooled mask (see the module comment for the error bound).
+
+    Returns:
+        np.ndarray: uint8 (0/1) closed mask.
+    """
+    if not 1 <= factor <= 15:
+        raise ValueError("factor must be between 1 and 15")
+    h, w = mask.shape
+    binary = (mask != 0).view(np.uint8)
+    ph, pw = -(-h // factor), -(-w // factor)
+    padded = np.zeros((ph * factor, pw * factor), dtype=np.uint8)
+    padded[:h, :w] = binary * np.uint8(255)
+    # block mean > 0 <=> any pixel of the block is set (255 / 15^2 >= 1, so no rounding to 0)
+    pooled = (cv2.resize(padded, (pw, ph), interpolation=cv2.INTER_AREA) > 0).view(np.uint8)
+    small = tuple(max(1, round(k / factor)) for k in kernel_size)
+    closed = cv2.morphologyEx(pooled, cv2.MORPH_CLOSE, structuring_element(small, shape))
+    upsampled = cv2.resize(closed, (pw * factor, ph * factor), interpolation=cv2.INTER_NEAREST)[:h, :w]
+    # bound: never beyond the mask dilated with the kernel's bounding box, never less than the mask
+    dilated = cv2.dilate(binary, np.ones(tuple(kernel_size)[::-1], dtype=np.uint8))
+    return (upsampled & dilated) | binary
+
+
+def closing(mask, kernel_size=(32, 32), shape="ellipse", method="auto", factor=4):
+    """
+    Morphological closing of a binary mask.
+
+    Parameters:
+        mask (np.ndarray): 2D mask, nonzero = foreground.
+        kernel_size (tuple): (width, height) of the structuring element.
+        shape (str): "ellipse", "rect" or "cross".
+        method (str): "opencv" (cv2.morphologyEx), "bits" (exact, packed rows),
+                      "downsample" (approximate, bounded error) or "auto" (cv2 for
+                      rectangles, which OpenCV already separates, "bits" otherwise).
+        factor (int): Block size of the downsample method.
+
+    Returns:
+        np.ndarray: uint8 (0/1) closed mask.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown closing method: {method}")
+    if method == "downsample":
+        return close_downsample(mask, kernel_size, shape, factor)
+    kernel = structuring_element(kernel_size, shape)
+    if method == "opencv" or (method == "auto" and shape == "rect"):
+        binary = (mask != 0).astype(np.uint8)
+        return cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+    return close_bits(mask, kernel)
+
+
+def closing_error(reference, result):
+    """
+    Difference of a closing result from the exact one.
+
+    Returns:
+        dict: missed / extra pixels, their share of the reference foreground, and the largest
+              distance (px) of an extra pixel from the reference foreground.
+    """
+    reference, result = reference != 0, result != 0
+    missed = reference & ~result
+    extra = result & ~reference
+    distance = 0.0
+    if extra.any():
+        distance = float(cv2.distanceTransform((~reference).astype(np.uint8), cv2.DIST_L2, 5)[extra].max())
+    total = max(1, int(reference.sum()))
+    return {"missed": int(missed.sum()), "extra": int(extra.sum()), "missed_share": float(missed.sum() / total),
+            "extra_share": float(extra.sum() / total), "max_extra_distance_px": distance}
+
+
+def _timed(function, repeats):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return (time.perf_counter() - start) / repeats, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Closing methods against cv2.morphologyEx on plate masks.")
+    parser.add_argument("masks", nargs="*", help="mask images (default: the task 4 test plate mask)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[32])
+    parser.add_argument("--shapes", nargs="+", choices=list(SHAPES), default=["ellipse"])
+    parser.add_argument("--factor", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.masks:
+        masks = [(path, cv2.imread(path, cv2.IMREAD_GRAYSCALE)) for path in args.masks]
+    else:
+        from synthetic_plates import dataset_plate
+        masks = [("test_patched_dataset", dataset_plate()[1])]
+
+    for name, mask in masks:
+        print(f"\n[MASK] {name} {mask.shape}, {np.count_nonzero(mask) / mask.size:.1%} foreground")
+        print(f"{'kernel':<14}{'method':<12}{'ms':>9}{'speedup':>9}{'missed':>9}{'extra':>9}{'max dist':>9}")
+        for shape in args.shapes:
+            for size in args.sizes:
+                reference_s, reference = _timed(lambda: closing(mask, (size, size), shape, "opencv"), args.repeats)
+                for method in ("opencv", "bits", "downsample"):
+                    seconds, result = _timed(lambda: closing(mask, (size, size), shape, method, args.factor),
+                                             args.repeats)
+                    error = closing_error(reference, result)
+                    print(f"{shape + ' ' + str(size):<14}{method:<12}{seconds * 1e3:>9.1f}"
+                          f"{reference_s / seconds:>9.1f}{error['missed']:>9}{error['extra']:>9}"
+                          f"{error['max_extra_distance_px']:>9.1f}")
@@ -0,0 +1,253 @@
+# path_planner.py
+# Orders root-tip inoculation targets so the gantry travels as little as possible.
+#
+# The three gantry axes are driven independently and move at the same time, so the
+# time to go from a to b is set by the slowest axis (a Chebyshev-style metric),
+# not by the straight-line distance. Routes are open paths that start at the current
+# pipette position:
+#  - up to EXACT_MAX_N tips: exact Held-Karp dynamic programming
+#  - more tips: nearest neighbour construction followed by 2-opt improvement
+#
+# Several plates can be planned as one batch: each plate's route starts where the
+# previous one ended, and the cycle time of the whole batch is estimated.
+# plan_tips() plans from the pixel tips of the CV pipeline with a plate calibration
+# (calibration.py).
+
+import itertools
+import numpy as np
+from envelope import load_envelope, contains
+
+# Working envelope of the pipette (envelope.json, measured by envelope.py)
+ENVELOPE = load_envelope()
+
+# Rough motion model used for time estimates; tune to the robot at hand
+AXIS_SPEED = np.array([0.1, 0.1, 0.1])  # m/s per axis
+SETTLE_TIME = 0.25  # s spent converging to within tolerance at each target
+DROP_TIME = 0.05  # s per inoculation
+PLATE_SWAP_TIME = 30.0  # s to replace a plate between batches
+
+# Largest problem solved exactly with Held-Karp
+EXACT_MAX_N = 9
+
+
+def travel_time(a, b, axis_speed=AXIS_SPEED):
+    """Time for the gantry to travel from a to b (axes move simultaneously)."""
+    return np.max(np.abs(np.asarray(b) - np.asarray(a)) / axis_speed, axis=-1)
+
+
+def time_matrix(points, axis_speed=AXIS_SPEED):
+    """Pairwise travel times between all points, shape (n, n)."""
+    points = np.asarray(points, dtype=float)
+    return travel_time(points[:, None, :], points[None, :, :], axis_speed)
+
+
+def route_cost(order, cost):
+    """Total cost of visiting the nodes of `order` in sequence (open path)."""
+    return sum(cost[order[k], order[k + 1]] for k in range(len(order) - 1))
+
+
+def _held_karp(cost):
+    """Exact shortest open path over all nodes starting at node 0."""
+    n = len(cost)
+    if n <= 2:
+        return list(range(n))
+    others = range(1, n)
+    # best[(subset, last)] = (cost, previous node)
+    best = {(1 << k, k): (cost[0, k], 0) for k in others}
+    for size in range(2, n):
+        for subset in itertools.combinations(others, size):
+            bits = sum(1 << k for k in subset)
+            for last in subset:
+                prev_bits = bits & ~(1 << last)
+                best[(bits, last)] = min(
+                    (best[(prev_bits, k)][0] + cost[k, last], k)
+                    for k in subset if k != last
+                )
+    full = sum(1 << k for k in others)
+    last = min(others, key=lambda k: best[(full, k)][0])
+
+    # walk back through the table
+    order = []
+    bits = full
+    while last != 0:
+        order.append(last)
+        bits, last = bits & ~(1 << last), best[(bits, last)][1]
+    return [0] + order[::-1]
+
+
+def _nearest_neighbour(cost):
+    """Greedy open path starting at node 0."""
+    n = len(cost)
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    order = [0]
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, cost[order[-1]])
+        nxt = int(np.argmin(row))
+        visited[nxt] = True
+        order.append(nxt)
+    return order
+
+
+def _two_opt(order, cost):
+    """Improve an open path (first node fixed) by reversing segments until no move helps."""
+    order = list(order)
+    n = len(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = order[i - 1], order[i]
+            for j in range(i + 1, n):
+                c = order[j]
+                d = order[j + 1] if j + 1 < n else None
+                # replace edges (a, b) and (c, d) by (a, c) and (b, d)
+                delta = cost[a, c] - cost[a, b]
+                if d is not None:
+                    delta += cost[b, d] - cost[c, d]
+                if delta < -1e-12:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    b = order[i]
+                    improved = True
+    return order
+
+
+def order_tips(goals, start, axis_speed=AXIS_SPEED, exact_max_n=EXACT_MAX_N):
+    """
+    Order inoculation goals to minimise gantry travel time.
+
+    Parameters:
+        goals (array-like): (n, 3) robot-space goals.
+        start (array-like): Current (x, y, z) pipette position.
+        axis_speed (np.ndarray): Speed of each axis in m/s.
+        exact_max_n (int): Solve exactly with Held-Karp up to this many goals.
+
+    Returns:
+        list: Indices into `goals` in visiting order.
+    """
+    goals = np.asarray(goals, dtype=float).reshape(-1, 3)
+    if len(goals) == 0:
+        return []
+    cost = time_matrix(np.vstack([start, goals]), axis_speed)
+    if len(goals) <= exact_max_n:
+        order = _held_karp(cost)
+    else:
+        order = _two_opt(_nearest_neighbour(cost), cost)
+    return [k - 1 for k in order[1:]]
+
+
+def estimate_cycle_time(goals, order, start, axis_speed=AXIS_SPEED,
+                        settle_time=SETTLE_TIME, drop_time=DROP_TIME):
+    """
+    Estimate the time needed to visit and inoculate `goals` in `order` from `start`.
+
+    Returns:
+        dict: travel, settle and drop time plus the total, all in seconds.
+    """
+    goals = np.asarray(goals, dtype=float).reshape(-1, 3)
+    path = np.vstack([start, goals[order]]) if len(order) else np.asarray(start, dtype=float)[None]
+    travel = float(np.sum(travel_time(path[:-1], path[1:], axis_speed)))
+    settle = settle_time * len(order)
+    drops = drop_time * len(order)
+    return {
+        "travel_s": travel,
+        "settle_s": settle,
+        "drop_s": drops,
+        "total_s": travel + settle + drops,
+    }
+
+
+def plan_plate(goals, start, axis_speed=AXIS_SPEED, exact_max_n=EXACT_MAX_N, envelope=ENVELOPE, check_z=True):
+    """
+    Drop goals outside the working envelope, order the rest and estimate the cycle time.
+
+    Parameters:
+        check_z (bool): If False, goals only need to be inside the envelope in x and y
+                        (inoculation targets on the plate lie below the lowest pipette position).
+
+    Returns:
+        dict: "order" (indices into goals), "rejected" (indices outside the envelope),
+              "end" (last position) and "cycle" (see estimate_cycle_time).
+    """
+    # the pipette stops at the envelope boundary, so times are computed on the clipped goals
+    inside = contains(envelope, goals, check_z)
+    goals = np.clip(np.asarray(goals, dtype=float).reshape(-1, 3), envelope["low"], envelope["high"])
+    valid = np.flatnonzero(inside)
+    rejected = np.flatnonzero(~inside).tolist()
+    sub_order = order_tips(goals[valid], start, axis_speed, exact_max_n)
+    order = valid[sub_order].tolist()
+    end = goals[order[-1]] if order else np.asarray(start, dtype=float)
+    return {
+        "order": order,
+        "rejected": rejected,
+        "end": end,
+        "cycle": estimate_cycle_time(goals, order, start, axis_speed),
+    }
+
+
+def plan_tips(tips, calibration, start, axis_speed=AXIS_SPEED, exact_max_n=EXACT_MAX_N, envelope=ENVELOPE,
+              check_z=False):
+    """
+    plan_plate for root tips in plate pixels.
+
+    Parameters:
+        tips (array-like): (n, 2) plate pixels (y, x) of the tips.
+        calibration (PlateCalibration): Plate pixel -> robot mapping (calibration.py).
+        check_z (bool): Also require the goals inside the envelope in z. Off by default: the
+                        calibrated goals have the plate Z, below the lowest pipette position,
+                        and a drop only needs the XY alignment.
+
+    Returns:
+        dict: plan_plate result plus "goals", the (n, 3) robot goals of all tips (indexed by "order").
+    """
+    goals = calibration.to_robot(tips)
+    plan = plan_plate(goals, start, axis_speed, exact_max_n, envelope, check_z)
+    plan["goals"] = goals
+    return plan
+
+
+def plan_batch(plates, start, axis_speed=AXIS_SPEED, plate_swap_time=PLATE_SWAP_TIME, exact_max_n=EXACT_MAX_N,
+               envelope=ENVELOPE, check_z=True):
+    """
+    Plan a batch of plates handled one after another by the same robot.
+
+    Parameters:
+        plates (list): One (n_i, 3) array of robot-space goals per plate.
+        start (array-like): Pipette position before the first plate.
+        plate_swap_time (float): Seconds needed to replace a plate.
+        check_z (bool): As in plan_plate. Pass False for goals derived from plate pixels
+                        (calibration.to_robot): they have the plate Z, below the envelope,
+                        and would all be rejected.
+
+    Returns:
+        dict: "plates" (plan_plate result per plate), "total_s" (batch cycle time)
+              and "tips_per_hour".
+    """
+    plans = []
+    position = np.asarray(start, dtype=float)
+    total = 0.0
+    n_tips = 0
+    for k, goals in enumerate(plates):
+        plan = plan_plate(goals, position, axis_speed, exact_max_n, envelope, check_z)
+        plans.append(plan)
+        total += plan["cycle"]["total_s"] + (plate_swap_time if k > 0 else 0.0)
+        n_tips += len(plan["order"])
+        position = plan["end"]
+    return {
+        "plates": plans,
+        "total_s": total,
+        "tips_per_hour": 3600.0 * n_tips / total if total > 0 else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    # Compare the planned route with the detection order on random plates
+    np.random.seed(0)
+    start = np.array([0.073, 0.0895, 0.1195])
+    for n in (5, 9, 20):
+        goals = np.random.uniform([0.11, 0.06, 0.057], [0.25, 0.21, 0.057], size=(n, 3))
+        goals[:, 2] = ENVELOPE["low"][2]
+        naive = estimate_cycle_time(goals, list(range(n)), start)
+        plan = plan_plate(goals, start)
+        print(f"[PLAN] {n:2d} tips | detection order: {naive['travel_s']:.2f}s travel | "
+              f"planned: {plan['cycle']['travel_s']:.2f}s travel")
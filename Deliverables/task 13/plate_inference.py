@@ -0,0 +1,320 @@
+# plate_inference.py
+# Plate preprocessing and memory-lean UNet inference for the Task 13 pipeline.
+#
+# The notebooks used to turn the grayscale plate into a 3-channel float64 copy
+# (np.repeat(..., 3) / 255.0) before patching: 24 bytes per pixel for a model whose
+# three input channels are identical. Here the plate stays uint8 and single-channel
+# until a small batch of tiles is handed to the model:
+#   - uint8_model(model) wraps a Keras model so the cast, the scaling to [0, 1] and
+#     the copy to three channels happen inside the graph; the batches are uint8
+#   - any other model gets float32 3-channel batches of `batch_size` tiles only
+#
+# The tiles are numpy.lib.stride_tricks views of the plate: tiles that lie fully
+# inside the plate are passed to the model without a copy, only the border tiles
+# that reach into the zero padding are filled into a small reusable buffer. The
+# thresholded predictions are written straight into a preallocated mask, which can
+# be the full camera frame (`out` + `origin`), so there is no padded copy, no
+# unpatchify, no padding crop and no reverse crop.
+#
+# peak_rss()/reset_peak_rss() read and reset the peak resident memory of the process
+# (Linux /proc, ru_maxrss elsewhere), so the saving can be measured:
+#
+#   python plate_inference.py textures/_plates/plate_01.png --model unet.h5
+#   python plate_inference.py --size 3000    # synthetic plate, stand-in threshold model
+
+import os
+import sys
+import argparse
+import numpy as np
+import cv2
+
+PATCH_SIZE = 256
+BATCH_SIZE = 16  # tiles per model call
+THRESHOLD = 0.5
+
+
+# === Crop & format (moved from task13_pipelineV2.ipynb) ===
+
+def crop_initial(image, initial_crop=100):
+    return image[:, initial_crop:-initial_crop][:-initial_crop, :]
+
+
+def find_edges(line, threshold=70):
+    left_edge, right_edge = None, None
+    n = len(line)
+    for i in range(1, n):
+        if line[i - 1] < threshold <= line[i] or line[i - 1] >= threshold > line[i]:
+            left_edge = i
+            break
+    for i in range(n - 1, 0, -1):
+        if line[i] < threshold <= line[i - 1] or line[i] >= threshold > line[i - 1]:
+            right_edge = i
+            break
+    return left_edge, right_edge
+
+
+def format_slices(image):
+    horizontal_line = image[image.shape[0] // 2, :]
+    vertical_line = image[:, image.shape[1] // 2]
+    left_x, right_x = find_edges(horizontal_line)
+    top_y, bottom_y = find_edges(vertical_line)
+    side_length = max(right_x - left_x, bottom_y - top_y)
+    right_x = left_x + side_length
+    bottom_y = top_y + side_length
+    return slice(top_y, bottom_y), slice(left_x, right_x)
+
+
+def format_crop(image):
+    return image[format_slices(image)]
+
+
+def plate_region(image, initial_crop=100):
+    """
+    Locate the plate in a full camera image.
+
+    Returns:
+        tuple: (plate view of `image`, (top, left) of the plate in `image`)
+    """
+    rows, cols = format_slices(crop_initial(image, initial_crop))
+    top, left = rows.start, cols.start + initial_crop
+    return image[top:top + (rows.stop - rows.start), left:left + (cols.stop - cols.start)], (top, left)
+
+
+def padding(shape, patch_size=PATCH_SIZE):
+    """
+    Padding that makes an image divisible by patch_size (always at least one pixel, as before).
+
+    Returns:
+        tuple: (pad_top, pad_bottom, pad_left, pad_right)
+    """
+    h, w = shape[:2]
+    pad_h = ((h // patch_size) + 1) * patch_size - h
+    pad_w = ((w // patch_size) + 1) * patch_size - w
+    return pad_h // 2, pad_h - (pad_h // 2), pad_w // 2, pad_w - (pad_w // 2)
+
+
+# === Models ===
+
+def uint8_model(model):
+    """
+    Wrap a Keras segmentation model so it takes (n, P, P, 1) uint8 tiles.
+
+    Parameters:
+        model (keras.Model): Model trained on 3-channel images scaled to [0, 1].
+
+    Returns:
+        keras.Model: Model with the cast, scaling and channel copy in the graph.
+    """
+    from keras import layers, Model
+    from keras import backend as K
+
+    height, width = model.input_shape[1:3]
+    inputs = layers.Input(shape=(height, width, 1), dtype="uint8")
+    scaled = layers.Lambda(lambda t: K.repeat_elements(K.cast(t, "float32") / 255.0, 3, axis=-1))(inputs)
+    wrapped = Model(inputs, model(scaled))
+    wrapped.uint8_input = True
+    return wrapped
+
+
+class ThresholdModel:
+    """
+    Stand-in for the UNet where no trained model is available (benchmarks, CI):
+    the "probability" of a pixel is its scaled intensity, so bright pixels become roots.
+    Accepts uint8 single-channel and float 3-channel batches like the real models.
+    """
+    def __init__(self, level=0.5, uint8_input=True):
+        self.level = level
+        # False: behave like an unwrapped Keras model that needs float 3-channel input
+        self.uint8_input = uint8_input
+
+    def predict(self, batch, verbose=0):
+        x = batch[..., :1]
+        scale = 255.0 if batch.dtype == np.uint8 else 1.0
+        return (x.astype(np.float32) / scale) * (THRESHOLD / self.level)
+
+
+def _model_input(tiles, model):
+    # uint8 models take the tiles as they are; others get a float32 3-channel copy of this batch only
+    if getattr(model, "uint8_input", False):
+        return tiles
+    batch = np.empty(tiles.shape[:3] + (3,), dtype=np.float32)
+    np.multiply(tiles, 1 / 255.0, out=batch[..., :1], casting="unsafe")
+    batch[..., 1] = batch[..., 0]
+    batch[..., 2] = batch[..., 0]
+    return batch
+
+
+# === Tiling ===
+
+def tile_batches(image, patch_size=PATCH_SIZE, batch_size=BATCH_SIZE):
+    """
+    Cut a plate into the tiles of its zero-padded version without padding it.
+
+    Yields:
+        tuple: (tiles, origins) with tiles an (n, P, P, 1) uint8 array and origins the
+        (y, x) of every tile in `image` (negative inside the padding). Tiles that lie
+        fully inside the image are strided views of it; border tiles are copied into a
+        buffer that is reused, so a batch is only valid until the next one is taken.
+    """
+    h, w = image.shape
+    pad_top, _, pad_left, _ = padding(image.shape, patch_size)
+    ys = np.arange(-pad_top, h, patch_size)
+    xs = np.arange(-pad_left, w, patch_size)
+    full_y = (ys >= 0) & (ys + patch_size <= h)
+    full_x = (xs >= 0) & (xs + patch_size <= w)
+
+    # interior tiles: one (rows, cols, P, P) view, no copy
+    if full_y.any() and full_x.any():
+        y0, x0 = ys[full_y][0], xs[full_x][0]
+        s0, s1 = image.strides
+        interior = np.lib.stride_tricks.as_strided(
+            image[y0:, x0:], shape=(full_y.sum(), full_x.sum(), patch_size, patch_size),
+            strides=(patch_size * s0, patch_size * s1, s0, s1), writeable=False)
+        row_origins = ys[full_y]
+        col_origins = xs[full_x]
+        for r, y in enumerate(row_origins):
+            for c in range(0, len(col_origins), batch_size):
+                tiles = interior[r, c:c + batch_size]
+                yield tiles[..., np.newaxis], [(y, x) for x in col_origins[c:c + batch_size]]
+
+    # border tiles: the part inside the image is copied into a zeroed buffer
+    border = [(y, x) for y, fy in zip(ys, full_y) for x, fx in zip(xs, full_x) if not (fy and fx)]
+    buffer = np.zeros((batch_size, patch_size, patch_size, 1), dtype=np.uint8)
+    for start in range(0, len(border), batch_size):
+        origins = border[start:start + batch_size]
+        buffer.fill(0)
+        for k, (y, x) in enumerate(origins):
+            top, left = max(y, 0), max(x, 0)
+            bottom, right = min(y + patch_size, h), min(x + patch_size, w)
+            buffer[k, top - y:bottom - y, left - x:right - x, 0] = image[top:bottom, left:right]
+        yield buffer[:len(origins)], origins
+
+
+# === Inference ===
+
+def predict_mask(image, model, patch_size=PATCH_SIZE, batch_size=BATCH_SIZE, threshold=THRESHOLD,
+                 out=None, origin=(0, 0)):
+    """
+    Predict the binary root mask of a formatted (cropped, square) grayscale plate.
+
+    Parameters:
+        image (np.ndarray): 2-D uint8 plate image.
+        model: Keras model (ideally wrapped with uint8_model) or anything with predict(batch).
+        batch_size (int): Tiles per model call; bounds the float memory of unwrapped models.
+        out (np.ndarray): Optional preallocated uint8 mask the prediction is written into,
+            e.g. the size of the full camera image (see plate_region).
+        origin (tuple): (top, left) of `image` inside `out`.
+
+    Returns:
+        np.ndarray: `out`, or a new uint8 mask (0/1) with the shape of `image`.
+    """
+    h, w = image.shape
+    if out is None:
+        out = np.zeros((h, w), dtype=np.uint8)
+    oy, ox = origin
+    for tiles, origins in tile_batches(image, patch_size, batch_size):
+        probabilities = model.predict(_model_input(tiles, model), verbose=0)
+        for probability, (y, x) in zip(probabilities, origins):
+            # only the part of the tile inside the image is written
+            top, left = max(y, 0), max(x, 0)
+            bottom, right = min(y + patch_size, h), min(x + patch_size, w)
+            target = out[oy + top:oy + bottom, ox + left:ox + right]
+            np.greater(probability[top - y:bottom - y, left - x:right - x, 0], threshold, out=target.view(bool))
+    return out
+
+
+def predict_mask_float64(image, model, patch_size=PATCH_SIZE, threshold=THRESHOLD):
+    """The previous notebook path (float64 3-channel copy of the whole plate), kept for comparison."""
+    pad_top, pad_bottom, pad_left, pad_right = padding(image.shape, patch_size)
+    padded = cv2.copyMakeBorder(image, pad_top, pad_bottom, pad_left, pad_right, cv2.BORDER_CONSTANT, value=0)
+    rows, cols = padded.shape[0] // patch_size, padded.shape[1] // patch_size
+    padded_input = np.repeat(padded[..., np.newaxis], 3, axis=-1) / 255.0
+    patches = padded_input.reshape(rows, patch_size, cols, patch_size, 3).swapaxes(1, 2)
+    patches_flat = patches.reshape(-1, patch_size, patch_size, 3)
+    preds = model.predict(patches_flat, verbose=0)
+    preds_bin = (preds > threshold).astype(np.uint8).reshape(rows, cols, patch_size, patch_size)
+    mask = preds_bin.swapaxes(1, 2).reshape(padded.shape)
+    return mask[pad_top:-pad_bottom, pad_left:-pad_right]
+
+
+# === Memory ===
+
+def _status_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return None
+
+
+def peak_rss():
+    """Peak resident memory of this process in MB (since start or the last reset_peak_rss())."""
+    if os.path.exists("/proc/self/status"):
+        return _status_kb("VmHWM") / 1024
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss():
+    """Current resident memory of this process in MB (peak_rss() where /proc is not available)."""
+    if os.path.exists("/proc/self/status"):
+        return _status_kb("VmRSS") / 1024
+    return peak_rss()
+
+
+def reset_peak_rss():
+    """
+    Reset the peak to the current resident memory (Linux only).
+
+    Returns:
+        bool: False when the peak cannot be reset on this system.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def measure(function, *args, **kwargs):
+    """
+    Run function(*args, **kwargs) and report its transient memory.
+
+    Returns:
+        tuple: (result, {"rss_before_mb", "peak_rss_mb", "transient_mb"})
+    """
+    reset_peak_rss()
+    before = current_rss()
+    result = function(*args, **kwargs)
+    peak = peak_rss()
+    return result, {"rss_before_mb": before, "peak_rss_mb": peak, "transient_mb": peak - before}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak memory of plate inference, float64 path vs uint8 path.")
+    parser.add_argument("image", nargs="?", help="plate image (default: synthetic --size x --size plate)")
+    parser.add_argument("--model", default=None, help="Keras .h5 model (default: stand-in threshold model)")
+    parser.add_argument("--size", type=int, default=3000)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.image:
+        plate = format_crop(crop_initial(cv2.imread(args.image, cv2.IMREAD_GRAYSCALE)))
+    else:
+        plate = np.random.default_rng(0).integers(0, 256, (args.size, args.size), dtype=np.uint8)
+    if args.model:
+        from keras.models import load_model
+        model = load_model(args.model, custom_objects={"f1": lambda y_true, y_pred: y_pred})
+        fast_model = uint8_model(model)
+    else:
+        model, fast_model = ThresholdModel(uint8_input=False), ThresholdModel()
+
+    print(f"[MEM] plate {plate.shape}, {plate.nbytes / 1e6:.1f} MB")
+    old, old_mem = measure(predict_mask_float64, plate, model)
+    del old
+    new, new_mem = measure(predict_mask, plate, fast_model, batch_size=args.batch_size)
+    for name, mem in (("float64 3-channel", old_mem), ("uint8 1-channel", new_mem)):
+        print(f"[MEM] {name:<18} RSS before {mem['rss_before_mb']:7.1f} MB | peak {mem['peak_rss_mb']:7.1f} MB | "
+              f"transient {mem['transient_mb']:7.1f} MB")
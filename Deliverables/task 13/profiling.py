@@ -0,0 +1,192 @@
+# profiling.py
+# Stage timers, peak-memory sampling and per-plate counters for the root pipeline
+# (root_pipeline.py, task13_pipelineV2.ipynb).
+#
+# Every `with profiler.stage(name):` block records its wall time, its peak resident
+# memory (plate_inference.peak_rss, reset when the stage starts) and the memory it
+# leaves allocated. profiler.count() attaches counters such as tiles, components and
+# skeleton pixels to the current plate. The report is exported as JSON, and
+# summary() prints a table of all stages across plates:
+#
+#   profiler = Profiler()
+#   with profiler.plate("plate_01"):
+#       with profiler.stage("closing"):
+#           closed = close_mask(mask)
+#       profiler.count("components", n)
+#   profiler.save("timings.json")
+#   print(profiler.summary())
+#
+# capture="cprofile" or "pyinstrument" additionally profiles the code inside the
+# stages; save() writes the capture next to the JSON report (timings.prof for
+# cProfile, to be opened with snakeviz or pstats; timings.html for pyinstrument).
+
+import json
+import time
+import platform
+from contextlib import contextmanager, nullcontext
+from plate_inference import peak_rss, current_rss, reset_peak_rss
+
+
+class Profiler:
+    def __init__(self, enabled=True, memory=True, capture=None):
+        """
+        :param enabled: False makes every call a no-op (default profiler of process_plate)
+        :param memory: sample the peak resident memory of every stage
+        :param capture: None, "cprofile" or "pyinstrument"
+        """
+        self.enabled = enabled
+        self.memory = memory and enabled
+        self.records = []  # one dict per stage call
+        self.plates = []  # one dict per plate: name, seconds, counters
+        self.counters = {}  # counters recorded outside a plate
+        self._plate = None
+        self._depth = 0
+        self._open = []  # running peaks of the enclosing stages
+        self.capture = capture if enabled else None
+        self._capturer = None
+        if self.capture == "cprofile":
+            import cProfile
+            self._capturer = cProfile.Profile()
+        elif self.capture == "pyinstrument":
+            try:
+                from pyinstrument import Profiler as Sampler
+            except ImportError:
+                raise ImportError("capture='pyinstrument' requires pyinstrument (pip install pyinstrument)")
+            self._capturer = Sampler()
+        elif self.capture is not None:
+            raise ValueError(f"Unknown capture mode: {capture}")
+
+    @contextmanager
+    def plate(self, name=None):
+        """Group the stages and counters inside the block under one plate."""
+        if not self.enabled:
+            yield
+            return
+        self._plate = {"name": name if name is not None else f"plate_{len(self.plates)}",
+                       "seconds": 0.0, "counters": {}}
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._plate["seconds"] = time.perf_counter() - start
+            self.plates.append(self._plate)
+            self._plate = None
+
+    def stage(self, name):
+        """Time the block as stage `name`."""
+        if not self.enabled:
+            return nullcontext()
+        return self._stage(name)
+
+    @contextmanager
+    def _stage(self, name):
+        if self.memory:
+            # a nested stage resets the peak: keep what the enclosing stages reached so far
+            peak = peak_rss()
+            self._open = [max(p, peak) for p in self._open]
+            reset_peak_rss()
+            before = current_rss()
+            self._open.append(before)
+        self._depth += 1
+        if self._capturer is not None and self._depth == 1:
+            self._start_capture()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if self._capturer is not None and self._depth == 1:
+                self._stop_capture()
+            self._depth -= 1
+            record = {"plate": self._plate["name"] if self._plate else None, "stage": name, "seconds": seconds}
+            if self.memory:
+                peak = max(self._open.pop(), peak_rss())
+                self._open = [max(p, peak) for p in self._open]
+                record.update(peak_rss_mb=peak, transient_mb=peak - before, retained_mb=current_rss() - before)
+            self.records.append(record)
+
+    def _start_capture(self):
+        if self.capture == "cprofile":
+            self._capturer.enable()
+        else:
+            self._capturer.start()
+
+    def _stop_capture(self):
+        if self.capture == "cprofile":
+            self._capturer.disable()
+        else:
+            self._capturer.stop()
+
+    def count(self, name, value):
+        """Add `value` to counter `name` of the current plate."""
+        if not self.enabled:
+            return
+        counters = self._plate["counters"] if self._plate is not None else self.counters
+        counters[name] = counters.get(name, 0) + value
+
+    def stages(self):
+        """
+        Statistics per stage over all plates, in the order the stages first ran.
+
+        :return: {stage: {"calls", "total_s", "mean_s", "min_s", "max_s", "share", "peak_rss_mb", "transient_mb"}}
+        """
+        grouped = {}
+        for record in self.records:
+            grouped.setdefault(record["stage"], []).append(record)
+        total = sum(r["seconds"] for r in self.records) or 1.0
+        stats = {}
+        for name, records in grouped.items():
+            seconds = [r["seconds"] for r in records]
+            stats[name] = {"calls": len(records), "total_s": sum(seconds), "mean_s": sum(seconds) / len(seconds),
+                           "min_s": min(seconds), "max_s": max(seconds), "share": sum(seconds) / total}
+            if self.memory:
+                stats[name]["peak_rss_mb"] = max(r["peak_rss_mb"] for r in records)
+                stats[name]["transient_mb"] = max(r["transient_mb"] for r in records)
+        return stats
+
+    def report(self):
+        return {"machine": {"python": platform.python_version(), "platform": platform.platform(),
+                            "processor": platform.processor()},
+                "stages": self.stages(), "plates": self.plates, "counters": self.counters,
+                "records": self.records}
+
+    def save(self, path):
+        """Write the JSON report to `path`, and the capture (if any) next to it."""
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        stem = path[:-5] if path.endswith(".json") else path
+        if self.capture == "cprofile":
+            self._capturer.dump_stats(stem + ".prof")
+        elif self.capture == "pyinstrument":
+            with open(stem + ".html", "w") as f:
+                f.write(self._capturer.output_html())
+
+    def summary(self):
+        """Table of the stage statistics, plus the mean of every plate counter and the counters outside plates."""
+        stats = self.stages()
+        header = f"{'stage':<14}{'calls':>6}{'total s':>10}{'mean ms':>10}{'max ms':>10}{'share':>8}"
+        if self.memory:
+            header += f"{'peak MB':>10}{'trans MB':>10}"
+        lines = [header, "-" * len(header)]
+        for name, s in stats.items():
+            line = (f"{name:<14}{s['calls']:>6}{s['total_s']:>10.3f}{s['mean_s'] * 1e3:>10.1f}"
+                    f"{s['max_s'] * 1e3:>10.1f}{s['share']:>8.1%}")
+            if self.memory:
+                line += f"{s['peak_rss_mb']:>10.1f}{s['transient_mb']:>10.1f}"
+            lines.append(line)
+        if self.plates:
+            counters = {}
+            for plate in self.plates:
+                for name, value in plate["counters"].items():
+                    counters.setdefault(name, []).append(value)
+            mean_plate = sum(p["seconds"] for p in self.plates) / len(self.plates)
+            lines.append(f"{len(self.plates)} plates, {mean_plate:.3f} s per plate")
+            lines.extend(f"  {name}: {sum(v) / len(v):.1f} per plate" for name, v in counters.items())
+        lines.extend(f"  {name}: {value}" for name, value in self.counters.items())
+        if self.capture == "cprofile":
+            import io
+            import pstats
+            stream = io.StringIO()
+            pstats.Stats(self._capturer, stream=stream).sort_stats("cumulative").print_stats(15)
+            lines.append(stream.getvalue())
+        return "\n".join(lines)
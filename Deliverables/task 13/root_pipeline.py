@@ -0,0 +1,383 @@
+# root_pipeline.py
+# Root detection stages of the Task 13 pipeline as plain functions, so they can be
+# run, profiled and benchmarked outside the notebook:
+#
+#   crop/format -> prediction -> closing -> root selection (bounding boxes)
+#   -> skeletonization (skeleton.py, per root) -> bottom tips and root lengths
+#
+# The skeleton graph is the pixel graph skan's skeleton_to_csgraph builds (one node
+# per skeleton pixel, 8-connected edges weighted with the pixel distance); shortest
+# paths are taken with scipy.sparse.csgraph instead of networkx.
+#
+# Tip detection (TIP_METHODS):
+#   "graph"       lowest node of the skeleton graph of every root (extract_bottom_tips)
+#   "endpoints"   lowest skeleton endpoint of every root from a 3x3 neighbour count,
+#                 no graph (endpoint_tips)
+#   "geodesic"    "endpoints", keeping only endpoints connected to the top of the root
+#                 (shortest paths on the skeleton graph)
+#
+# process_plate() runs all stages on one camera image and records every stage in a
+# profiling.Profiler:
+#
+#   python root_pipeline.py textures/_plates/plate_01.png --model unet.h5 --report timings.json
+#   python root_pipeline.py plate.png --capture cprofile     # also writes timings.prof
+
+import argparse
+import numpy as np
+import cv2
+from scipy import ndimage
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from plate_inference import plate_region, predict_mask, PATCH_SIZE
+from profiling import Profiler
+from morphology import closing
+from skeleton import skeletonize
+
+CLOSING_KERNEL = (32, 32)
+TIP_METHODS = ("graph", "endpoints", "geodesic")
+
+# 8-neighbourhood offsets and their pixel distances
+NEIGHBOURS = [(dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if (dy, dx) != (0, 0)]
+NEIGHBOUR_KERNEL = np.ones((3, 3), dtype=np.float32)  # 3x3 count, the pixel itself included
+
+
+def close_mask(mask, kernel_size=CLOSING_KERNEL, method="auto"):
+    """
+    Apply morphological closing (ellipse) to a single predicted mask.
+
+    Parameters:
+        method (str): morphology.closing method; "auto" gives the cv2.morphologyEx result, faster.
+    """
+    return closing(mask, kernel_size, "ellipse", method)
+
+
+def calculate_iou(box1, box2):
+    """
+    Calculate the Intersection over Union (IoU) of two bounding boxes.
+
+    Parameters:
+        box1 (tuple): Bounding box 1 (x_min, y_min, x_max, y_max).
+        box2 (tuple): Bounding box 2 (x_min, y_min, x_max, y_max).
+
+    Returns:
+        float: IoU value.
+    """
+    x_min = max(box1[0], box2[0])
+    y_min = max(box1[1], box2[1])
+    x_max = min(box1[2], box2[2])
+    y_max = min(box1[3], box2[3])
+
+    inter_area = max(0, x_max - x_min) * max(0, y_max - y_min)
+    area_box1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
+    area_box2 = (box2[2] - box2[0]) * (box2[3] - box2[1])
+    union_area = area_box1 + area_box2 - inter_area
+    return round(inter_area / union_area, 6) if union_area > 0 else 0
+
+
+def select_roots(preprocessed_mask, original_mask, iou_threshold=0.001, size_threshold=2000,
+                 bottom_y_cutoff_ratio=0.85, top_y_cutoff=100, min_x_distance=20):
+    """
+    Select one bounding box per root (apply_strict_bboxes_with_top_cutoff_and_proximity of the notebook):
+    - size + bottom cutoff
+    - IoU suppression
+    - post-filter top strip exclusion (y_min < top_y_cutoff)
+    - post-filter proximity suppression (too-close boxes -> keep biggest)
+
+    Returns:
+        tuple: (uint16 labeled mask of the original mask inside the kept boxes,
+                list of kept boxes (x_min, y_min, x_max, y_max, component id, area))
+    """
+    h, w = original_mask.shape
+    bottom_cutoff = int(h * bottom_y_cutoff_ratio)
+
+    labeled_preprocessed, num_labels = ndimage.label(preprocessed_mask > 0)
+    bboxes = []
+    for comp_id, box in enumerate(ndimage.find_objects(labeled_preprocessed), start=1):
+        if box is None:
+            continue
+        y_min, y_max = box[0].start, box[0].stop - 1
+        x_min, x_max = box[1].start, box[1].stop - 1
+        area = (x_max - x_min) * (y_max - y_min)
+        if area >= size_threshold and y_min < bottom_cutoff:
+            bboxes.append((x_min, y_min, x_max, y_max, comp_id, area))
+
+    # --- IoU suppression ---
+    bboxes = sorted(bboxes, key=lambda box: box[5], reverse=True)
+    filtered = []
+    for box in bboxes:
+        keep = True
+        for kept in filtered:
+            if calculate_iou(box[:4], kept[:4]) > iou_threshold:
+                if box[5] <= kept[5]:
+                    keep = False
+                    break
+        if keep:
+            filtered.append(box)
+
+    # --- Post-filter: remove boxes intersecting the top cutoff ---
+    filtered = [box for box in filtered if box[1] >= top_y_cutoff]
+
+    # --- Post-filter: remove boxes too close in X axis ---
+    kept_indices = set(range(len(filtered)))
+    for i in range(len(filtered)):
+        if i not in kept_indices:
+            continue
+        x_min_i, _, x_max_i, _, _, area_i = filtered[i]
+        for j in range(i + 1, len(filtered)):
+            if j not in kept_indices:
+                continue
+            x_min_j, _, x_max_j, _, _, area_j = filtered[j]
+            x_gap = min(abs(x_min_i - x_max_j), abs(x_min_j - x_max_i))
+            if x_gap < min_x_distance:
+                if area_i >= area_j:
+                    kept_indices.discard(j)
+                else:
+                    kept_indices.discard(i)
+                    break
+    final = [filtered[k] for k in sorted(kept_indices)]
+
+    # --- Labeled mask: every root pixel inside a kept box gets the box index ---
+    labeled_output = np.zeros(original_mask.shape, dtype=np.uint16)
+    for box_idx, (x_min, y_min, x_max, y_max, _, _) in enumerate(final, start=1):
+        region = original_mask[y_min:y_max + 1, x_min:x_max + 1] > 0
+        labeled_output[y_min:y_max + 1, x_min:x_max + 1][region] = box_idx
+    return labeled_output, final
+
+
+def box_slices(boxes):
+    """(rows, cols) slices of the select_roots boxes, in label order (as ndimage.find_objects)."""
+    return [(slice(y_min, y_max + 1), slice(x_min, x_max + 1)) for x_min, y_min, x_max, y_max, _, _ in boxes]
+
+
+def skeleton_graph(skeleton):
+    """
+    Pixel graph of a skeleton, as skan's skeleton_to_csgraph.
+
+    Returns:
+        tuple: (csr_matrix of edge lengths between skeleton pixels, (rows, cols) of the pixels
+                in raster order)
+    """
+    rows, cols = np.nonzero(skeleton)
+    h, w = skeleton.shape
+    flat = rows.astype(np.int64) * w + cols
+    sources, targets, weights = [], [], []
+    for dy, dx in NEIGHBOURS:
+        ny, nx = rows + dy, cols + dx
+        inside = (ny >= 0) & (ny < h) & (nx >= 0) & (nx < w)
+        index = np.flatnonzero(inside)
+        neighbour = ny[inside].astype(np.int64) * w + nx[inside]
+        position = np.minimum(np.searchsorted(flat, neighbour), len(flat) - 1)
+        found = flat[position] == neighbour
+        sources.append(index[found])
+        targets.append(position[found])
+        weights.append(np.full(found.sum(), np.hypot(dy, dx)))
+    graph = csr_matrix((np.concatenate(weights), (np.concatenate(sources), np.concatenate(targets))),
+                       shape=(len(flat), len(flat)))
+    return graph, (rows, cols)
+
+
+def _root_skeletons(labeled_mask, skeleton, boxes=None):
+    # (root id, skeleton of that root in its bounding box, (y0, x0) of the box);
+    # boxes (box_slices) save the full-frame ndimage.find_objects scan
+    for root_id, box in enumerate(boxes or ndimage.find_objects(labeled_mask), start=1):
+        if box is None:
+            continue
+        region = labeled_mask[box] == root_id
+        if boxes and not region.any():
+            continue
+        yield root_id, region & skeleton[box], (box[0].start, box[1].start)
+
+
+def _top_bottom(graph, rows):
+    # only pixels with an edge are graph nodes (like the networkx graph of the notebook)
+    nodes = np.flatnonzero(np.diff(graph.indptr))
+    if len(nodes) == 0:
+        return None
+    top = nodes[np.argmin(rows[nodes])]
+    bottom = nodes[np.argmax(rows[nodes])]
+    return top, bottom
+
+
+def extract_bottom_tips(labeled_mask, skeleton=None, boxes=None):
+    """
+    Extract bottom tips (max y) from each labeled root in the skeletonized mask.
+    Only includes roots whose top node is in the top half of the image.
+
+    Parameters:
+        boxes (list): Bounding slices of the roots (box_slices(); default: ndimage.find_objects).
+
+    Returns:
+        list: (y, x) coordinates in pixel space.
+    """
+    if skeleton is None:
+        skeleton = skeletonize(labeled_mask, labels=labeled_mask, boxes=boxes)
+    half_height = labeled_mask.shape[0] // 2
+    tips = []
+    for _, root_skeleton, (y0, x0) in _root_skeletons(labeled_mask, skeleton, boxes):
+        graph, (rows, cols) = skeleton_graph(root_skeleton)
+        ends = _top_bottom(graph, rows)
+        if ends is None:
+            continue
+        top, bottom = ends
+        if rows[top] + y0 < half_height:
+            tips.append((rows[bottom] + y0, cols[bottom] + x0))
+    return tips
+
+
+def _connected_to_top(root_skeleton):
+    # skeleton pixels with a path to the top node of the root (skeleton graph, dijkstra)
+    graph, (rows, cols) = skeleton_graph(root_skeleton)
+    connected = np.zeros(root_skeleton.shape, dtype=bool)
+    ends = _top_bottom(graph, rows)
+    if ends is not None:
+        reachable = np.isfinite(dijkstra(graph, directed=False, indices=ends[0]))
+        connected[rows[reachable], cols[reachable]] = True
+    return connected
+
+
+def endpoint_tips(labeled_mask, skeleton=None, boxes=None, geodesic=False):
+    """
+    Bottom tips from the skeleton endpoints, without building the skeleton graph.
+    An endpoint is a skeleton pixel with exactly one neighbour (3x3 neighbour count on the
+    root's crop); the tip is the lowest endpoint of the root (leftmost on ties), or its lowest
+    pixel with a neighbour when the skeleton is a closed loop. As in extract_bottom_tips,
+    only roots whose top pixel (with a neighbour) is in the top half of the image are kept.
+
+    Parameters:
+        boxes (list): Bounding slices of the roots (box_slices(); default: ndimage.find_objects).
+        geodesic (bool): Only accept endpoints connected to the top pixel through the
+                         skeleton (shortest paths on the skeleton graph of the root, slower).
+
+    Returns:
+        list: (y, x) coordinates in pixel space.
+    """
+    if skeleton is None:
+        skeleton = skeletonize(labeled_mask, labels=labeled_mask, boxes=boxes)
+    half_height = labeled_mask.shape[0] // 2
+    ids, ys, xs = [], [], []
+    for root_id, root_skeleton, (y0, x0) in _root_skeletons(labeled_mask, skeleton, boxes):
+        counts = cv2.filter2D(root_skeleton.view(np.uint8), -1, NEIGHBOUR_KERNEL, borderType=cv2.BORDER_CONSTANT)
+        nodes = root_skeleton & (counts >= 2)
+        node_rows = np.flatnonzero(nodes.any(axis=1))
+        if len(node_rows) == 0 or node_rows[0] + y0 >= half_height:
+            continue
+        candidates = root_skeleton & (counts == 2)
+        if geodesic:
+            candidates &= _connected_to_top(root_skeleton)
+        if not candidates.any():
+            candidates = nodes
+        rows, cols = np.nonzero(candidates)
+        ids.append(np.full(len(rows), root_id))
+        ys.append(rows + y0)
+        xs.append(cols + x0)
+    if not ids:
+        return []
+    ids, ys, xs = np.concatenate(ids), np.concatenate(ys), np.concatenate(xs)
+    # lowest candidate of every root: sort by root, then row down, then column; take the first of every root
+    order = np.lexsort((xs, -ys, ids))
+    first = order[np.flatnonzero(np.diff(ids[order], prepend=-1))]
+    return list(zip(ys[first], xs[first]))
+
+
+def detect_tips(labeled_mask, skeleton=None, method="graph", boxes=None):
+    """Bottom tips with one of TIP_METHODS (see extract_bottom_tips and endpoint_tips)."""
+    if method == "graph":
+        return extract_bottom_tips(labeled_mask, skeleton, boxes)
+    if method in ("endpoints", "geodesic"):
+        return endpoint_tips(labeled_mask, skeleton, boxes, geodesic=method == "geodesic")
+    raise ValueError(f"unknown tip method {method!r}, expected one of {TIP_METHODS}")
+
+
+def root_lengths(labeled_mask, skeleton=None, boxes=None):
+    """
+    Length of every labeled root: shortest skeleton path from its top to its bottom pixel.
+
+    Parameters:
+        boxes (list): Bounding slices of the roots (box_slices(); default: ndimage.find_objects).
+
+    Returns:
+        dict: root id -> length in pixels (0 when there is no path).
+    """
+    if skeleton is None:
+        skeleton = skeletonize(labeled_mask, labels=labeled_mask, boxes=boxes)
+    lengths = {}
+    for root_id, root_skeleton, _ in _root_skeletons(labeled_mask, skeleton, boxes):
+        graph, (rows, cols) = skeleton_graph(root_skeleton)
+        ends = _top_bottom(graph, rows)
+        if ends is None:
+            lengths[root_id] = 0
+            continue
+        top, bottom = ends
+        distance = dijkstra(graph, directed=False, indices=top)[bottom]
+        lengths[root_id] = float(distance) if np.isfinite(distance) else 0
+    return lengths
+
+
+def process_plate(image, model, profiler=None, name=None, patch_size=PATCH_SIZE, kernel_size=CLOSING_KERNEL,
+                  closing_method="auto", skeleton_backend="skimage", tip_method="graph"):
+    """
+    Run every stage on one grayscale camera image.
+
+    Parameters:
+        image (np.ndarray): uint8 camera image of the plate.
+        model: Segmentation model for plate_inference.predict_mask.
+        profiler (Profiler): Records the stages and counters (default: disabled).
+        name (str): Plate name in the profiler report.
+        closing_method (str): Method of the closing stage (morphology.closing).
+        skeleton_backend (str): Thinning backend of the skeleton stage (skeleton.BACKENDS).
+        tip_method (str): Tip detection of the tips stage (TIP_METHODS).
+
+    Returns:
+        dict: plate (formatted view), origin, predicted_mask, closed_mask, labeled_mask,
+              boxes, skeleton, tips (y, x in plate pixels), lengths
+    """
+    profiler = profiler or Profiler(enabled=False)
+    with profiler.plate(name):
+        with profiler.stage("crop"):
+            plate, origin = plate_region(image)
+        with profiler.stage("predict"):
+            predicted_mask = predict_mask(plate, model, patch_size)
+        # the padding always adds at least one pixel (plate_inference.padding)
+        profiler.count("tiles", (plate.shape[0] // patch_size + 1) * (plate.shape[1] // patch_size + 1))
+        with profiler.stage("closing"):
+            closed_mask = close_mask(predicted_mask, kernel_size, closing_method)
+        with profiler.stage("select_roots"):
+            labeled_mask, boxes = select_roots(closed_mask, predicted_mask)
+        profiler.count("components", len(boxes))
+        slices = box_slices(boxes)
+        with profiler.stage("skeletonize"):
+            skeleton = skeletonize(labeled_mask, skeleton_backend, labels=labeled_mask, boxes=slices)
+        profiler.count("skeleton_pixels", int(np.count_nonzero(skeleton)))
+        with profiler.stage("tips"):
+            tips = detect_tips(labeled_mask, skeleton, tip_method, slices)
+        profiler.count("tips", len(tips))
+        with profiler.stage("lengths"):
+            lengths = root_lengths(labeled_mask, skeleton, slices)
+    return {"plate": plate, "origin": origin, "predicted_mask": predicted_mask, "closed_mask": closed_mask,
+            "labeled_mask": labeled_mask, "boxes": boxes, "skeleton": skeleton, "tips": tips, "lengths": lengths}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the root pipeline on plate images and report stage timings.")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--model", default=None, help="Keras .h5 model (default: stand-in threshold model)")
+    parser.add_argument("--report", default="timings.json")
+    parser.add_argument("--capture", choices=["cprofile", "pyinstrument"], default=None)
+    parser.add_argument("--tips", choices=TIP_METHODS, default="graph", help="tip detection method")
+    args = parser.parse_args()
+
+    if args.model:
+        from keras.models import load_model
+        from plate_inference import uint8_model
+        model = uint8_model(load_model(args.model, custom_objects={"f1": lambda y_true, y_pred: y_pred}))
+    else:
+        from plate_inference import ThresholdModel
+        model = ThresholdModel()
+
+    profiler = Profiler(capture=args.capture)
+    for path in args.images:
+        result = process_plate(cv2.imread(path, cv2.IMREAD_GRAYSCALE), model, profiler, name=path, tip_method=args.tips)
+        print(f"[PLATE] {path}: {len(result['tips'])} tips")
+    profiler.save(args.report)
+    print(profiler.summary())
+    print(f"[PROFILE] report saved to {args.report}")
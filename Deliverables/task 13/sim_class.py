@@ -5,6 +5,8 @@ import math
 import logging
 import os
 import random
+import numpy as np
+from kinematics import PipetteKinematics, JOINT_SIGN
 
 #logging.basicConfig(level=logging.INFO)
 
@@ -142,27 +144,18 @@ class Simulation:
 
                     agent_count += 1  # Increment the agent counter
 
-                    # calculate the pipette position
-                    pipette_position = self.get_pipette_position(robotId)
-                    # save the pipette position
-                    self.pipette_positions[f'robotId_{robotId}'] = pipette_position
+        # cache the (fixed) base poses and joint limits of all robots
+        self.kinematics = PipetteKinematics(self.robotIds, self.pipette_offset)
+
+        # calculate and save the pipette positions
+        for robotId, pipette_position in zip(self.robotIds, self.kinematics.pipette_positions()):
+            self.pipette_positions[f'robotId_{robotId}'] = pipette_position.tolist()
 
     # method to get the current pipette position for a robot
     def get_pipette_position(self, robotId):
-        #get the position of the robot
-        robot_position = p.getBasePositionAndOrientation(robotId)[0]
-        robot_position = list(robot_position)
-        joint_states = p.getJointStates(robotId, [0, 1, 2])
-        robot_position[0] -= joint_states[0][0]
-        robot_position[1] -= joint_states[1][0]
-        robot_position[2] += joint_states[2][0]
-        # x,y offset
-        x_offset = self.pipette_offset[0]
-        y_offset = self.pipette_offset[1]
-        z_offset = self.pipette_offset[2]
-        # Calculate the position of the pipette at the tip of the pipette but at the same z coordinate as the specimen
-        pipette_position = [robot_position[0]+x_offset, robot_position[1]+y_offset, robot_position[2]+z_offset]
-        return pipette_position
+        joint_positions = [s[0] for s in p.getJointStates(robotId, [0, 1, 2])]
+        # Calculate the position of the pipette at the tip of the pipette from the cached base position
+        return self.kinematics.forward(joint_positions, self.kinematics.index(robotId)).tolist()
 
     # method to reset the simulation
     def reset(self, num_agents=1):
@@ -251,7 +244,101 @@ class Simulation:
                 time.sleep(1./240.) # slow down the simulation
 
         return self.get_states()
-    
+
+    # method to drive one robot through a list of waypoints (or an open-loop velocity profile) in a single call
+    # the PID loop runs here instead of around run(), so there is no per-step get_states() dictionary building
+    def run_trajectory(self, waypoints=None, velocities=None, gains=((5, 0.1, 0.01),) * 3, tolerance=0.001,
+                       max_steps=500, dt=0.01, velocity_scale=5.0, check_z=True, drop=False,
+                       telemetry_every=0, robot_index=0):
+        # waypoints: list of [x, y, z] pipette targets, visited in order with a PID controller per axis
+        # velocities: (n_steps, 3) array of joint velocities applied open-loop (used when no waypoints are given)
+        # gains: (Kp, Ki, Kd) per axis; max_steps is per waypoint
+        # check_z: if False only the x,y error has to be within tolerance (as for inoculation)
+        # drop: release a droplet once each waypoint is reached
+        # telemetry_every: record the pipette position every n steps (0 = no telemetry)
+        robotId = self.robotIds[robot_index]
+        specimenId = self.specimenIds[robot_index]
+        # the base is fixed by a constraint, so its position comes from the kinematics cache
+        offset = self.kinematics.origin[robot_index]
+        sign = JOINT_SIGN  # x and y joints move opposite to the world axes
+        forces = [500, 500, 800]
+        joints = [0, 1, 2]
+
+        def pipette_position():
+            joint_positions = np.array([s[0] for s in p.getJointStates(robotId, joints)])
+            return offset + sign * joint_positions
+
+        def step(velocity):
+            # the joint velocity targets are the world velocities with the joint signs applied
+            p.setJointMotorControlArray(robotId, joints, p.VELOCITY_CONTROL,
+                                        targetVelocities=list(sign * velocity), forces=forces)
+            p.stepSimulation()
+            if self.sphereIds:
+                self.check_contact(robotId, specimenId)
+            if self.render:
+                time.sleep(1./240.)
+
+        telemetry = []
+        total_steps = 0
+
+        if waypoints is None:
+            for velocity in np.asarray(velocities, dtype=float):
+                step(velocity)
+                total_steps += 1
+                if telemetry_every and total_steps % telemetry_every == 0:
+                    telemetry.append({'step': total_steps, 'pipette_position': pipette_position().tolist()})
+            return {
+                'steps': total_steps,
+                'state': self.get_states(),
+                'telemetry': telemetry,
+            }
+
+        kp, ki, kd = (np.array(g, dtype=float) for g in zip(*gains))
+        axes = 3 if check_z else 2
+        reached = []
+        steps_per_waypoint = []
+        final_errors = []
+
+        for target in waypoints:
+            target = np.asarray(target, dtype=float)
+            integral = np.zeros(3)
+            prev_error = np.zeros(3)
+            success = False
+            waypoint_steps = 0
+            while True:
+                position = pipette_position()
+                error = target - position
+                if telemetry_every and total_steps % telemetry_every == 0:
+                    telemetry.append({'step': total_steps, 'pipette_position': position.tolist()})
+                if np.all(np.abs(error[:axes]) < tolerance):
+                    success = True
+                    break
+                if waypoint_steps >= max_steps:
+                    break
+                integral += error * dt
+                derivative = (error - prev_error) / dt
+                prev_error = error
+                step(velocity_scale * (kp * error + ki * integral + kd * derivative))
+                total_steps += 1
+                waypoint_steps += 1
+
+            if success and drop:
+                self.drop(robotId=robotId)
+                step(np.zeros(3))
+                total_steps += 1
+
+            reached.append(success)
+            steps_per_waypoint.append(waypoint_steps)
+            final_errors.append(np.abs(error).tolist())
+
+        return {
+            'reached': reached,
+            'steps': steps_per_waypoint,
+            'final_error': final_errors,
+            'state': self.get_states(),
+            'telemetry': telemetry,
+        }
+
     # method to apply actions to the robots using velocity control
     def apply_actions(self, actions): # actions [[x,y,z,drop], [x,y,z,drop], ...
         for i in range(len(self.robotIds)):
@@ -265,20 +352,7 @@ class Simulation:
     # method to drop a simulated droplet on the specimen from the pipette
     def drop(self, robotId):
         # Get the position of the pipette based on the x,y,z coordinates of the joints
-        #robot_position = [0, 0, 0]
-        #get the position of the robot
-        robot_position = p.getBasePositionAndOrientation(robotId)[0]
-        robot_position = list(robot_position)
-        joint_states = p.getJointStates(robotId, [0, 1, 2])
-        robot_position[0] -= joint_states[0][0]
-        robot_position[1] -= joint_states[1][0]
-        robot_position[2] += joint_states[2][0]
-        # x,y offset
-        x_offset = self.pipette_offset[0]
-        y_offset = self.pipette_offset[1]
-        z_offset = self.pipette_offset[2]-0.0015
-        # Get the position of the specimen
-        specimen_position = p.getBasePositionAndOrientation(self.specimenIds[0])[0]
+        pipette_position = self.get_pipette_position(robotId)
         #logging.info(f'droplet_position: {droplet_position}')
         # Create a sphere to represent the droplet
         sphereRadius = 0.003  # Adjust as needed
@@ -288,8 +362,7 @@ class Simulation:
         collision = p.createCollisionShape(shapeType=p.GEOM_SPHERE, radius=sphereRadius)
         sphereBody = p.createMultiBody(baseMass=0.1, baseVisualShapeIndex=visualShapeId, baseCollisionShapeIndex=collision)
         # Calculate the position of the droplet at the tip of the pipette but at the same z coordinate as the specimen
-        droplet_position = [robot_position[0]+x_offset, robot_position[1]+y_offset, robot_position[2]+z_offset]
-                            #specimen_position[2] + sphereRadius+0.015/2+0.06]
+        droplet_position = [pipette_position[0], pipette_position[1], pipette_position[2]-0.0015]
         p.resetBasePositionAndOrientation(sphereBody, droplet_position, [0, 0, 0, 1])
         # track the sphere id
         self.sphereIds.append(sphereBody)
@@ -300,8 +373,12 @@ class Simulation:
     # method to get the states of the robots
     def get_states(self):
         states = {}
-        for robotId in self.robotIds:
-            raw_joint_states = p.getJointStates(robotId, [0, 1, 2])
+        # one joint state query per robot; the base positions come from the kinematics cache
+        all_joint_states, joint_positions = self.kinematics.read_joint_states()
+        robot_positions = self.kinematics.base_positions + JOINT_SIGN * joint_positions
+        pipette_positions = robot_positions + self.kinematics.pipette_offset
+        for k, robotId in enumerate(self.robotIds):
+            raw_joint_states = all_joint_states[k]
 
             # Convert joint states into a dictionary
             joint_states = {}
@@ -313,21 +390,11 @@ class Simulation:
                     'motor_torque': joint_state[3]
                 }
 
-            # Robot position
-            robot_position = p.getBasePositionAndOrientation(robotId)[0]
-            robot_position = list(robot_position)
-
-            # Adjust robot position based on joint states
-            robot_position[0] -= raw_joint_states[0][0]
-            robot_position[1] -= raw_joint_states[1][0]
-            robot_position[2] += raw_joint_states[2][0]
+            # Robot position adjusted by the joint states
+            robot_position = robot_positions[k].tolist()
 
-            # Pipette position
-            pipette_position = [robot_position[0] + self.pipette_offset[0],
-                                robot_position[1] + self.pipette_offset[1],
-                                robot_position[2] + self.pipette_offset[2]]
-            # Round pipette position to 4 decimal places
-            pipette_position = [round(num, 4) for num in pipette_position]
+            # Pipette position, rounded to 4 decimal places
+            pipette_position = [round(num, 4) for num in pipette_positions[k].tolist()]
 
             # Store information in the dictionary
             states[f'robotId_{robotId}'] = {
@@ -412,23 +479,14 @@ class Simulation:
                 #             logging.info(f'sphereId: {sphereId}, collision disabled with sphereId2: {sphereId2}')
 
     def set_start_position(self, x, y, z):
-        # Iterate through each robot and set its pipette to the start position
-        for robotId in self.robotIds:
-            # Calculate the necessary joint positions to reach the desired start position
-            # The calculation depends on the kinematic model of the robot
-            # For simplicity, let's assume a simple model where each joint moves in one axis (x, y, z)
-            # You might need to adjust this based on the actual robot kinematics
-
-            # Adjust the x, y, z values based on the robot's current position and pipette offset
-            robot_position = p.getBasePositionAndOrientation(robotId)[0]
-            adjusted_x = x - robot_position[0] - self.pipette_offset[0]
-            adjusted_y = y - robot_position[1] - self.pipette_offset[1]
-            adjusted_z = z - robot_position[2] - self.pipette_offset[2]
-
+        # Set the pipette of each robot to the start position
+        # The joint positions come from the analytic inverse kinematics (clipped to the joint limits)
+        joint_positions = self.kinematics.inverse([x, y, z])
+        for robotId, joints in zip(self.robotIds, joint_positions):
             # Reset the joint positions/start position
-            p.resetJointState(robotId, 0, targetValue=adjusted_x)
-            p.resetJointState(robotId, 1, targetValue=adjusted_y)
-            p.resetJointState(robotId, 2, targetValue=adjusted_z)
+            p.resetJointState(robotId, 0, targetValue=joints[0])
+            p.resetJointState(robotId, 1, targetValue=joints[1])
+            p.resetJointState(robotId, 2, targetValue=joints[2])
 
     # function to return the path of the current plate image
     def get_plate_image(self):
@@ -0,0 +1,203 @@
+# synthetic_plates.py
+# Plate images with known roots, for benchmarking the root pipeline without the
+# Kaggle dataset.
+#
+# synthetic_plate() draws a 4112x3006 camera frame (dark background, one square
+# plate) with `n_roots` seedlings along the top of the plate. Every main root is a
+# random walk downward with a few lateral roots, and there are small specks of noise
+# to exercise the filtering. The ground truth is the root mask of the frame and the
+# bottom tip of every main root.
+#
+# dataset_plate() builds the same kind of frame from the bundled task 4
+# test_patched_dataset (11x11 patches of 256 px, one plate): real root shapes and
+# their mask. With the stand-in threshold model (plate_inference.ThresholdModel)
+# the roots have to be the bright pixels, so by default the plate is re-rendered as
+# a mid-grey background with the roots marked bright; raw=True keeps the original
+# image for a real UNet.
+#
+# generate() writes a dataset to a directory (image .png, mask .npz as PackedMask,
+# tips .json) that benchmark_cv.py reads:
+#
+#   python synthetic_plates.py --n 16 --output bench_plates
+#   python synthetic_plates.py --source dataset --output bench_plates
+
+import os
+import json
+import argparse
+import numpy as np
+import cv2
+from mask_codec import PackedMask
+
+FRAME_SHAPE = (3006, 4112)  # (height, width) of the camera images
+PLATE_SIDE = 2780
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "task 4", "test_patched_dataset")
+
+BACKGROUND, PLATE, ROOT = 20, 95, 200  # gray levels
+
+
+def _plate_box(frame_shape, side):
+    # plate centred horizontally, near the top (crop_initial cuts 100 px at the bottom)
+    top = (frame_shape[0] - 100 - side) // 2
+    left = (frame_shape[1] - side) // 2
+    return top, left
+
+
+def _walk(rng, start, length, angle, wander, step=4.0, pull=0.0):
+    # random walk from `start` (x, y) with a slowly changing direction; angle 0 = down.
+    # `pull` steers the walk back towards the starting column, so roots do not cross
+    points = [start]
+    x, y = start
+    for _ in range(int(length / step)):
+        angle += rng.normal(0, wander) - pull * (x - start[0])
+        angle = float(np.clip(angle, -1.2, 1.2))
+        x, y = x + step * np.sin(angle), y + step * np.cos(angle)
+        points.append((x, y))
+    return np.array(points)
+
+
+def synthetic_plate(seed=0, n_roots=5, frame_shape=FRAME_SHAPE, side=PLATE_SIDE, specks=40):
+    """
+    Draw one camera frame with a plate and `n_roots` seedlings.
+
+    Parameters:
+        seed (int): Seed of the random generator; the same seed gives the same plate.
+        n_roots (int): Number of seedlings, spread evenly along the top of the plate.
+        specks (int): Small blobs of noise that the filtering has to remove.
+
+    Returns:
+        tuple: (uint8 image, uint8 root mask (0/1) of the frame, list of (y, x) main root tips)
+    """
+    rng = np.random.default_rng(seed)
+    h, w = frame_shape
+    top, left = _plate_box(frame_shape, side)
+
+    mask = np.zeros(frame_shape, dtype=np.uint8)
+    tips = []
+    spacing = side / n_roots
+    for k in range(n_roots):
+        x0 = left + spacing * (k + 0.5) + rng.uniform(-0.1, 0.1) * spacing
+        y0 = top + side * rng.uniform(0.12, 0.2)
+        length = side * rng.uniform(0.3, 0.6)
+        main = _walk(rng, (x0, y0), length, rng.normal(0, 0.1), 0.04, pull=2e-4)
+        cv2.polylines(mask, [np.round(main).astype(np.int32)], False, 1, int(rng.integers(5, 9)))
+        for _ in range(rng.integers(0, 4)):
+            start = main[rng.integers(len(main) // 4, len(main) - 1)]
+            side_angle = rng.choice([-1, 1]) * rng.uniform(0.7, 1.1)
+            lateral = _walk(rng, tuple(start), rng.uniform(40, 0.15 * spacing), side_angle, 0.08)
+            cv2.polylines(mask, [np.round(lateral).astype(np.int32)], False, 1, int(rng.integers(3, 5)))
+        tip = np.round(main[np.argmax(main[:, 1])]).astype(int)
+        tips.append((int(tip[1]), int(tip[0])))
+    for _ in range(specks):
+        center = (int(rng.integers(left, left + side)), int(rng.integers(top, top + side)))
+        cv2.circle(mask, center, int(rng.integers(2, 7)), 1, -1)
+
+    image = np.full(frame_shape, BACKGROUND, dtype=np.float32)
+    image[top:top + side, left:left + side] = PLATE
+    image[mask > 0] = ROOT
+    image += rng.normal(0, 6, frame_shape).astype(np.float32)
+    image = cv2.GaussianBlur(image, (3, 3), 0)
+    return np.clip(image, 0, 255).astype(np.uint8), mask, tips
+
+
+def dataset_plate(directory=DATASET_DIR, grid=11, patch_size=256, frame_shape=FRAME_SHAPE, raw=False):
+    """
+    Camera frame with the plate of the task 4 test_patched_dataset.
+
+    Parameters:
+        raw (bool): Keep the original grayscale plate (for a real model) instead of
+                    re-rendering it with bright roots (for the stand-in threshold model).
+
+    Returns:
+        tuple: (uint8 image, uint8 root mask (0/1) of the frame, list of (y, x) root tips)
+    """
+    side = grid * patch_size
+    plate = np.zeros((side, side), dtype=np.uint8)
+    plate_mask = np.zeros((side, side), dtype=np.uint8)
+    for k in range(grid * grid):
+        r, c = divmod(k, grid)
+        window = slice(r * patch_size, (r + 1) * patch_size), slice(c * patch_size, (c + 1) * patch_size)
+        plate[window] = cv2.imread(os.path.join(directory, "image_patches", f"patch_{k}.png"), cv2.IMREAD_GRAYSCALE)
+        plate_mask[window] = cv2.imread(os.path.join(directory, "mask_patches", f"patch_{k}.tif"), cv2.IMREAD_UNCHANGED) > 0
+    if not raw:
+        plate = (PLATE - 15 + plate.astype(np.uint16) * 30 // 255).astype(np.uint8)
+        plate[plate_mask > 0] = ROOT
+
+    top, left = _plate_box(frame_shape, side)
+    image = np.full(frame_shape, BACKGROUND, dtype=np.uint8)
+    image[top:top + side, left:left + side] = plate
+    mask = np.zeros(frame_shape, dtype=np.uint8)
+    mask[top:top + side, left:left + side] = plate_mask
+    return image, mask, _component_tips(mask, top + side // 2)
+
+
+def _component_tips(mask, max_top):
+    # lowest pixel of every large root component starting above max_top
+    from scipy import ndimage
+    labeled, _ = ndimage.label(mask, np.ones((3, 3)))
+    tips = []
+    for label, box in enumerate(ndimage.find_objects(labeled), start=1):
+        if box is None or box[0].start >= max_top or (box[0].stop - box[0].start) < 100:
+            continue
+        xs = np.flatnonzero(labeled[box[0].stop - 1, box[1]] == label)
+        tips.append((box[0].stop - 1, box[1].start + int(xs[0])))
+    return tips
+
+
+def save_plate(directory, name, image, mask, tips):
+    """Write image (png), mask (PackedMask npz) and tips (json); returns the image path."""
+    path = os.path.join(directory, name + ".png")
+    cv2.imwrite(path, image)
+    PackedMask.from_array(mask).save(os.path.join(directory, name + "_mask.npz"))
+    with open(os.path.join(directory, name + "_tips.json"), "w") as f:
+        json.dump([list(map(int, tip)) for tip in tips], f)
+    return path
+
+
+def load_truth(image_path):
+    """(root mask, tips) saved next to a plate image by save_plate()."""
+    stem = image_path[:-4]
+    with open(stem + "_tips.json") as f:
+        tips = [tuple(tip) for tip in json.load(f)]
+    return PackedMask.load(stem + "_mask.npz").to_array(), tips
+
+
+def generate(directory, n, seed=0, source="synthetic", n_roots=5, raw=False):
+    """
+    Write `n` plates to `directory`, reusing plates that are already there.
+
+    Parameters:
+        source (str): "synthetic" (plate k drawn with seed + k) or "dataset" (the
+                      test_patched_dataset plate, written once and listed n times).
+
+    Returns:
+        list: n image paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    if source == "dataset":
+        name = "dataset_raw" if raw else "dataset"
+        path = os.path.join(directory, name + ".png")
+        if not os.path.exists(path):
+            save_plate(directory, name, *dataset_plate(raw=raw))
+        return [path] * n
+    paths = []
+    for k in range(n):
+        name = f"synthetic_{seed + k:05d}_{n_roots}"
+        path = os.path.join(directory, name + ".png")
+        if not os.path.exists(path):
+            save_plate(directory, name, *synthetic_plate(seed + k, n_roots))
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate plate images with ground truth for benchmark_cv.py.")
+    parser.add_argument("--n", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--roots", type=int, default=5)
+    parser.add_argument("--source", choices=["synthetic", "dataset"], default="synthetic")
+    parser.add_argument("--raw", action="store_true", help="dataset: keep the original image (real model)")
+    parser.add_argument("--output", default="bench_plates")
+    args = parser.parse_args()
+
+    paths = generate(args.output, args.n, args.seed, args.source, args.roots, args.raw)
+    print(f"[DATA] {len(set(paths))} plates in {args.output}")
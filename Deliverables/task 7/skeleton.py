@@ -0,0 +1,249 @@
+# skeleton.py
+# Skeletonization of root masks with a pluggable thinning backend.
+#
+# skimage.morphology.skeletonize was run on the full plate mask (2780x2780 and up),
+# although the roots cover a few percent of it: every thinning pass scans the whole
+# image. skeletonize() here thins every component on its own bounding-box crop, the
+# crops in a thread pool (largest first), and pastes the results back. With the
+# default labels (8-connected components, which never touch) and the skimage backend
+# the result is identical to skeletonizing the full mask. Given labels can touch, e.g.
+# the select_roots labels, which are painted per bounding box; near a contact the
+# per-label skeletons can then differ from the full-mask skeleton.
+#
+# The crops pay off when the roots are small against the frame (synthetic benchmark
+# plates: ~98 ms -> ~17 ms). On the task 4 test plate mask (10 large components) they
+# are no faster than the full mask (0.7-1.2x between runs), and the opencv backend is
+# several times slower there, with lowest points up to 3.2 px from skimage's.
+#
+# Backends:
+#   "skimage"   skimage.morphology.skeletonize (Zhang's method, the reference)
+#   "opencv"    cv2.ximgproc.thinning (Zhang-Suen, opencv-contrib-python); a slightly
+#               different skeleton: within a pixel of the skimage one, except for some
+#               short spurs that skimage keeps on thick blobs
+#
+# parity() compares both backends on a mask (differing pixels, largest distance
+# between the skeletons, lowest point and pixel count of every component), and the
+# command line benchmarks the backends on full masks and on crops:
+#
+#   python skeleton.py                          # task 4 test plate mask
+#   python skeleton.py masks/*.png --workers 1 4
+#   python skeleton.py --check                  # exit code 1 when a parity check fails
+
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from scipy import ndimage
+from skimage.morphology import skeletonize as _skimage_skeletonize
+
+BACKENDS = ("skimage", "opencv")
+EIGHT_CONNECTED = np.ones((3, 3), dtype=bool)
+
+PARITY_TOLERANCE = 2.0  # px, a skeleton pixel this close to the other skeleton agrees with it
+PARITY_SHARE = 0.99  # share of the pixels of both skeletons that have to agree
+
+_threads = os.cpu_count() or 1
+
+
+def set_num_threads(n):
+    """Threads used by skeletonize() when `workers` is not given (as cv2.setNumThreads)."""
+    global _threads
+    _threads = max(1, int(n))
+
+
+def thin(mask, backend="skimage"):
+    """
+    One-pixel-wide skeleton of a binary mask, in one piece.
+
+    Parameters:
+        mask (np.ndarray): Binary mask (nonzero = foreground).
+        backend (str): "skimage" or "opencv".
+
+    Returns:
+        np.ndarray: bool skeleton of the same shape.
+    """
+    if backend == "skimage":
+        return _skimage_skeletonize(mask != 0)
+    if backend == "opencv":
+        if not hasattr(cv2, "ximgproc"):
+            raise ImportError("backend='opencv' needs cv2.ximgproc (opencv-contrib-python)")
+        # thinning never removes pixels on the image border, so add a background border
+        padded = cv2.copyMakeBorder((mask != 0).astype(np.uint8) * 255, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+        return cv2.ximgproc.thinning(padded, thinningType=cv2.ximgproc.THINNING_ZHANGSUEN)[1:-1, 1:-1] > 0
+    raise ValueError(f"unknown skeleton backend {backend!r}, expected one of {BACKENDS}")
+
+
+def skeletonize(mask, backend="skimage", labels=None, boxes=None, workers=None):
+    """
+    Skeleton of a root mask, every component thinned on its bounding-box crop.
+
+    Parameters:
+        mask (np.ndarray): Binary (or labeled) root mask.
+        backend (str): "skimage" or "opencv" (see thin()).
+        labels (np.ndarray): Label image whose labels are thinned separately, e.g. the
+                             labeled mask of root_pipeline.select_roots (default: the
+                             8-connected components of the mask).
+        boxes (list): Bounding slices of the labels (item k for label k + 1, None for no
+                      pixels), as ndimage.find_objects returns them; saves that full-frame
+                      scan when the boxes are already known.
+        workers (int): Threads thinning the crops (default: set_num_threads(), all CPUs).
+
+    Returns:
+        np.ndarray: bool skeleton of the full mask.
+    """
+    if labels is None:
+        labels, _ = ndimage.label(mask != 0, EIGHT_CONNECTED)
+    if boxes is None:
+        boxes = ndimage.find_objects(labels)
+    boxes = [(label, box) for label, box in enumerate(boxes, start=1) if box is not None]
+    # largest crops first, so the pool does not end on a big one
+    boxes.sort(key=lambda item: (item[1][0].stop - item[1][0].start) * (item[1][1].stop - item[1][1].start),
+               reverse=True)
+
+    def run(item):
+        label, box = item
+        return box, thin(labels[box] == label, backend)
+
+    workers = workers or _threads
+    if workers > 1 and len(boxes) > 1:
+        with ThreadPoolExecutor(min(workers, len(boxes))) as pool:
+            crops = list(pool.map(run, boxes))
+    else:
+        crops = [run(item) for item in boxes]
+
+    skeleton = np.zeros(mask.shape, dtype=bool)
+    for box, crop in crops:
+        skeleton[box] |= crop
+    return skeleton
+
+
+def _lowest_points(skeleton, labels, n):
+    # (row, col) of the lowest skeleton pixel of every label (-1 where a label has none),
+    # and the skeleton pixel count of every label
+    rows, cols = np.nonzero(skeleton)
+    owner = labels[rows, cols]
+    keep = owner > 0
+    rows, cols, owner = rows[keep], cols[keep], owner[keep]
+    lowest = np.full((n + 1, 2), -1, dtype=np.int64)
+    order = np.lexsort((rows, owner))  # by label, then row; the last of every label is its lowest
+    last = np.flatnonzero(np.diff(np.append(owner[order], -1)) != 0) if len(order) else order
+    lowest[owner[order][last]] = np.column_stack((rows[order][last], cols[order][last]))
+    return lowest[1:], np.bincount(owner, minlength=n + 1)[1:]
+
+
+def parity(mask, labels=None, reference=None, candidate=None):
+    """
+    Compare the skeletons of the two backends on one mask.
+
+    Parameters:
+        labels (np.ndarray): Label image of the roots (default: 8-connected components).
+        reference, candidate (np.ndarray): Skeletons to compare (default: skeletonize()
+                                           with "skimage" and with "opencv").
+
+    Returns:
+        dict: pixel counts, differing pixels, max_distance_px (largest distance of a pixel
+              of either skeleton from the other), within_share (share of the pixels of the
+              skeleton that agrees least within PARITY_TOLERANCE of the other), tip_max_px
+              (largest distance between the lowest points of a component), pixel_ratio
+              (candidate / reference pixels, lowest and highest over the components).
+    """
+    if labels is None:
+        labels, _ = ndimage.label(mask != 0, EIGHT_CONNECTED)
+    n = int(labels.max())
+    if reference is None:
+        reference = skeletonize(mask, "skimage", labels)
+    if candidate is None:
+        candidate = skeletonize(mask, "opencv", labels)
+
+    distance, within = 0.0, 1.0
+    for a, b in ((reference, candidate), (candidate, reference)):
+        extra = a & ~b
+        if not extra.any():
+            continue
+        if not b.any():
+            distance, within = float("inf"), 0.0
+            break
+        gaps = cv2.distanceTransform((~b).astype(np.uint8), cv2.DIST_L2, 5)[extra]
+        distance = max(distance, float(gaps.max()))
+        within = min(within, 1 - np.count_nonzero(gaps > PARITY_TOLERANCE) / np.count_nonzero(a))
+
+    low_a, count_a = _lowest_points(reference, labels, n)
+    low_b, count_b = _lowest_points(candidate, labels, n)
+    both = (low_a[:, 0] >= 0) & (low_b[:, 0] >= 0)
+    tip = np.hypot(*(low_a[both] - low_b[both]).T) if both.any() else np.zeros(0)
+    ratio = count_b[count_a > 0] / count_a[count_a > 0]
+    return {
+        "reference_pixels": int(reference.sum()),
+        "candidate_pixels": int(candidate.sum()),
+        "different_pixels": int((reference ^ candidate).sum()),
+        "max_distance_px": distance,
+        "within_share": float(within),
+        "tip_max_px": float(tip.max()) if len(tip) else 0.0,
+        "pixel_ratio": (float(ratio.min()), float(ratio.max())) if len(ratio) else (1.0, 1.0),
+        "components": n,
+    }
+
+
+def _timed(function, repeats):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def _test_plate_mask(directory, grid=11, patch_size=256):
+    # mask of the task 4 test_patched_dataset plate (11x11 patches of 256 px)
+    mask = np.zeros((grid * patch_size, grid * patch_size), dtype=np.uint8)
+    for k in range(grid * grid):
+        r, c = divmod(k, grid)
+        patch = cv2.imread(os.path.join(directory, "mask_patches", f"patch_{k}.tif"), cv2.IMREAD_UNCHANGED)
+        mask[r * patch_size:(r + 1) * patch_size, c * patch_size:(c + 1) * patch_size] = patch > 0
+    return mask
+
+
+if __name__ == "__main__":
+    default_plate = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "task 4", "test_patched_dataset")
+    parser = argparse.ArgumentParser(description="Skeleton backends against skimage on full root masks.")
+    parser.add_argument("masks", nargs="*", help="mask images (default: the task 4 test plate mask)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--check", action="store_true",
+                        help="exit with 1 when skimage crops differ from skeletonize() or the opencv skeleton "
+                             f"has less than {PARITY_SHARE:.0%} of its pixels within {PARITY_TOLERANCE} px")
+    args = parser.parse_args()
+
+    if args.masks:
+        masks = [(path, cv2.imread(path, cv2.IMREAD_GRAYSCALE)) for path in args.masks]
+    else:
+        masks = [("test_patched_dataset", _test_plate_mask(default_plate))]
+
+    failed = False
+    for name, mask in masks:
+        labels, n = ndimage.label(mask != 0, EIGHT_CONNECTED)
+        print(f"\n[MASK] {name} {mask.shape}, {n} components, {np.count_nonzero(mask) / mask.size:.1%} foreground")
+        reference_s, reference = _timed(lambda: _skimage_skeletonize(mask != 0), args.repeats)
+        print(f"{'backend':<10}{'crops':<8}{'workers':>8}{'ms':>9}{'speedup':>9}{'diff px':>9}{'max dist':>9}{'within':>8}{'tip px':>8}")
+        configs = [(backend, False, 1) for backend in BACKENDS]
+        configs += [(backend, True, workers) for backend in BACKENDS for workers in sorted(set(args.workers))]
+        for backend, crops, workers in configs:
+            if crops:
+                seconds, skeleton = _timed(lambda: skeletonize(mask, backend, labels, workers=workers),
+                                          args.repeats)
+            else:
+                seconds, skeleton = _timed(lambda: thin(mask, backend), args.repeats)
+            result = parity(mask, labels, reference, skeleton)
+            print(f"{backend:<10}{'yes' if crops else 'no':<8}{workers:>8}{seconds * 1e3:>9.1f}"
+                  f"{reference_s / seconds:>9.1f}{result['different_pixels']:>9}{result['max_distance_px']:>9.1f}"
+                  f"{result['within_share']:>8.1%}{result['tip_max_px']:>8.1f}")
+            if backend == "skimage" and result["different_pixels"]:
+                failed = True
+                print(f"[PARITY] {name}: skimage {'crops' if crops else 'full'} differ from skeletonize()")
+            if backend == "opencv" and result["within_share"] < PARITY_SHARE:
+                failed = True
+                print(f"[PARITY] {name}: {result['within_share']:.1%} of the opencv skeleton within "
+                      f"{PARITY_TOLERANCE} px of skimage")
+    if args.check:
+        raise SystemExit(1 if failed else 0)
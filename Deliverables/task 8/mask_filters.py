@@ -0,0 +1,120 @@
+# mask_filters.py
+# Component filters of the task 8 postprocessing (task_8_v6.ipynb), with the mask labeled once.
+#
+# apply_remove_small_objects_per_section_with_top_constraint and remove_small_and_low_objects
+# relabeled every section and then built a full-frame boolean mask for every label to
+# get its size and top row: O(labels x pixels). Here the mask is labeled once (the sections in a single pass,
+# with an empty column between them so no component crosses a section border), the
+# size of every label comes from np.bincount and its top row, bottom row and columns
+# from ndimage.find_objects, and the keep rules are evaluated on these per-label
+# arrays. The output is a single lookup-table remap of the label image: O(pixels).
+#
+# The results are identical to the notebook functions (same connectivity, same
+# "largest component" tie-break, columns right of the last full section dropped).
+#
+#   filtered = remove_small_objects_per_section(mask, size_threshold=2000, top_y_threshold=1000)
+#   filtered = remove_small_and_low_objects(filtered, size_threshold=200, y_threshold=500)
+
+import numpy as np
+from scipy import ndimage
+
+EIGHT_CONNECTED = np.ones((3, 3), dtype=bool)  # skimage connectivity=2
+
+
+def label(mask):
+    """
+    8-connected labels of the nonzero pixels.
+
+    Returns:
+        tuple: (int32 label image, number of labels)
+    """
+    return ndimage.label(mask != 0, structure=EIGHT_CONNECTED)
+
+
+def label_sections(mask, num_sections):
+    """
+    Label every vertical section of width `mask width // num_sections` separately, in one pass.
+    Columns right of the last full section get label 0, like the notebook, which never visits them.
+
+    Returns:
+        tuple: (int32 label image of the mask shape, number of labels)
+    """
+    h, w = mask.shape
+    section_width = w // num_sections
+    used = num_sections * section_width
+    # sections side by side with one empty column after each
+    spaced = np.zeros((h, num_sections, section_width + 1), dtype=bool)
+    spaced[:, :, :section_width] = (mask[:, :used] != 0).reshape(h, num_sections, section_width)
+    spaced_labels, n = ndimage.label(spaced.reshape(h, -1), structure=EIGHT_CONNECTED)
+    labels = np.zeros((h, w), dtype=spaced_labels.dtype)
+    labels[:, :used] = spaced_labels.reshape(h, num_sections, section_width + 1)[:, :, :section_width].reshape(h, used)
+    return labels, n
+
+
+def component_stats(labels, n):
+    """
+    Per-label size and bounding box, indexed by label (index 0 = background).
+
+    Returns:
+        dict: size, top, bottom (exclusive), left, right (exclusive), each an (n + 1,) int64 array
+    """
+    # background pixels are most of the mask: count the labeled pixels only
+    stats = {"size": np.bincount(labels[labels != 0], minlength=n + 1).astype(np.int64)}
+    for key in ("top", "bottom", "left", "right"):
+        stats[key] = np.zeros(n + 1, dtype=np.int64)
+    for index, box in enumerate(ndimage.find_objects(labels, max_label=n), start=1):
+        if box is None:
+            continue
+        stats["top"][index], stats["bottom"][index] = box[0].start, box[0].stop
+        stats["left"][index], stats["right"][index] = box[1].start, box[1].stop
+    return stats
+
+
+def remap(labels, keep, value=255, dtype=np.uint8):
+    """
+    Mask of the kept labels, as one lookup-table remap of the label image.
+
+    Parameters:
+        keep (np.ndarray): (n + 1,) bool, keep[0] is ignored (background).
+    """
+    lut = np.where(keep, value, 0).astype(dtype)
+    lut[0] = 0
+    return lut[labels]
+
+
+def remove_small_objects_per_section(mask, size_threshold, top_y_threshold, num_sections=5):
+    """
+    Per vertical section, keep the components that are at least `size_threshold` pixels or the
+    largest of their section, and whose top is above `top_y_threshold`.
+
+    Returns:
+        np.ndarray: uint8 mask (0/255).
+    """
+    labels, n = label_sections(mask, num_sections)
+    stats = component_stats(labels, n)
+    size, top = stats["size"], stats["top"]
+    section = stats["left"] // max(1, mask.shape[1] // num_sections)
+
+    largest = np.zeros(n + 1, dtype=bool)
+    for s in range(num_sections):
+        members = np.flatnonzero((section == s) & (size > 0))
+        members = members[members > 0]
+        if members.size:
+            # first label of the maximum size, like max() over the notebook's label list
+            largest[members[np.argmax(size[members])]] = True
+
+    keep = ((size >= size_threshold) | largest) & (top < top_y_threshold)
+    return remap(labels, keep)
+
+
+def remove_small_and_low_objects(mask, size_threshold=20, y_threshold=500):
+    """
+    Keep the components that are at least `size_threshold` pixels or whose top is above `y_threshold`.
+
+    Returns:
+        np.ndarray: uint8 mask (0/255).
+    """
+    labels, n = label(mask)
+    stats = component_stats(labels, n)
+    keep = (stats["size"] >= size_threshold) | (stats["top"] < y_threshold)
+    return remap(labels, keep)